@@ -0,0 +1,33 @@
+"""added data version table
+
+Revision ID: 5c2f0e9b7a41
+Revises: eda574247c2b
+Create Date: 2026-10-17 10:12:41.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+import sqlmodel  
+
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2f0e9b7a41'
+down_revision = 'eda574247c2b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_version',
+    sa.Column('name', sa.Text(), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.PrimaryKeyConstraint('name'),
+    schema='basic'
+    )
+    op.execute("INSERT INTO basic.data_version(name) VALUES ('edge'), ('isochrone')")
+
+
+def downgrade():
+    op.drop_table('data_version', schema='basic')
@@ -200,6 +200,34 @@ class Settings(BaseSettings):
     OPPORTUNITY_PATH: str = "/app/src/cache/opportunity"
     
     HEATMAP_MULTIPROCESSING_BULK_SIZE = 50
+    # Pixels of the polygon opportunities by geometry hash (polygons per worker, shared tier in the cache directory)
+    POLYGON_PIXEL_CACHE_SIZE: int = 100000
+    POLYGON_PIXEL_CACHE_PATH: str = "/app/src/cache/opportunity/polygon_pixels"
+    # Bulks per task of the region opportunity matrix job and decoded travel time matrices it keeps
+    OPPORTUNITY_MATRIX_REGION_SIZE: int = 64
+    TRAVELTIME_MATRIX_CACHE_SIZE: int = 64
+
+    # Routing network store (per worker)
+    ROUTING_NETWORK_STORE_ENABLED: bool = True
+    ROUTING_NETWORK_STORE_BUFFER: int = 5000  # in meters around the study area
+    ROUTING_DISTANCE_TREE_CACHE_SIZE: int = 128  # walking trees per worker, reused across speeds
+    # Networks beyond the store are loaded lazily in web mercator tiles as the search reaches them
+    ROUTING_NETWORK_TILES_ENABLED: bool = True
+    ROUTING_NETWORK_TILE_ZOOM: int = 13  # about 4.9 km wide at the equator
+    ROUTING_NETWORK_TILE_CACHE_SIZE: int = 1024  # tiles per worker
+    # Bytes of the dense distance rows of the searches that run together in dijkstra_many
+    ROUTING_SEARCH_CHUNK_MEMORY: int = 256 * 1024 * 1024
+
+    # Simplification of the isochrone polygons in pixels of the grid (0 to keep all vertices)
+    ISOCHRONE_SIMPLIFY_TOLERANCE: float = 0.25
+    # Cache of the isochrone results (number of results per process, shared tier in the cache directory)
+    ISOCHRONE_CACHE_SIZE: int = 256
+    ISOCHRONE_CACHE_SHARED: bool = True
+    ISOCHRONE_CACHE_SHARED_MAX_AGE: int = 60 * 60 * 24 * 7  # seconds since the last hit
+    # Seconds between reads of the data versions (basic.data_version) per process
+    DATA_VERSION_CHECK_INTERVAL: int = 10
+    # Compression of the isochrone grid body (deflate or zstd), None for grids readable by R5 clients
+    ISOCHRONE_GRID_COMPRESSION: Optional[str] = None
 
     # Celery config
     CELERY_BROKER_URL: Optional[str] = ""
@@ -218,6 +246,12 @@ class Settings(BaseSettings):
     
     CELERY_TASK_TIME_LIMIT: Optional[int] = 60 # seconds
 
+    # Store for large task results, the Celery result only carries a reference
+    RESULT_STORE: str = "filesystem"  # filesystem or s3
+    RESULT_STORE_PATH: str = "/app/src/cache/results"  # directory or key prefix in the bucket
+    RESULT_STORE_MIN_SIZE: int = 64 * 1024  # bytes, smaller results stay in the result backend
+    RESULT_STORE_EXPIRES: int = 60 * 60 * 24  # seconds
+
         
     OPENROUTESERVICE_API_KEY: Optional[str] = None
     GEOAPIFY_API_KEY: Optional[str] = None
@@ -0,0 +1,38 @@
+import time
+
+from sqlalchemy.sql import text
+
+from src.core.config import settings
+from src.db.session import legacy_engine
+
+
+class DataVersions:
+    """
+    Versions of the source data in basic.data_version.
+
+    The trigger basic.trigger_data_version increases the versions in the transaction of every
+    change of their tables, so a new version is visible exactly when the change is committed.
+    The versions are read at most every DATA_VERSION_CHECK_INTERVAL seconds per process.
+    """
+
+    def __init__(self):
+        self.versions = {}
+        self.last_check = 0.0
+
+    def get(self, name: str) -> int:
+        """
+        Version of the data
+
+        :param name: Name of the version (edge or isochrone)
+        """
+        now = time.time()
+        if now - self.last_check > settings.DATA_VERSION_CHECK_INTERVAL:
+            rows = legacy_engine.execute(
+                text("SELECT name, version FROM basic.data_version")
+            ).fetchall()
+            self.versions = {row[0]: int(row[1]) for row in rows}
+            self.last_check = now
+        return self.versions.get(name, 0)
+
+
+data_versions = DataVersions()
@@ -14,8 +14,9 @@ import time
 
 import h3
 import numpy as np
+import shapely
 from geopandas import GeoDataFrame, points_from_xy, read_postgis
-from pandas import isnull
+from pandas import factorize
 from rich import print
 from shapely.geometry import Point, Polygon, box
 from sqlalchemy.sql.functions import func
@@ -23,9 +24,23 @@ from sqlalchemy.sql.functions import func
 from src.crud.crud_isochrone import isochrone
 from src.core.heatmap import heatmap_core_cython as heatmap_cython
 from src.core.config import settings
-from src.core.heatmap.heatmap_core import save_traveltime_matrix
-from src.core.isochrone import network_to_grid, prepare_network_isochrone, dijkstra, construct_adjacency_list_
+from src.core.heatmap.heatmap_core import (
+    MatrixExtentIndex,
+    TravelTimeMatrixCache,
+    aggregate_point_opportunities,
+    point_opportunity_relations,
+    polygon_pixel_cache,
+    save_traveltime_matrix,
+)
+from src.core.isochrone import (
+    dijkstra_many,
+    get_reached_edges_,
+    network_to_grid,
+    prepare_network_isochrone,
+    reached_to_distances,
+)
 from src.core.heatmap.heatmap_read import BaseHeatmap
+from src.core.network_store import network_store
 from src.db.session import async_session, legacy_engine, sync_session
 from src.schemas.heatmap import (
     BulkTravelTime,
@@ -41,6 +56,7 @@ from src.schemas.isochrone import (
 )
 from src.utils import (
     coordinate_to_pixel,
+    coordinates_to_pixels,
     create_dir,
     create_h3_grid,
     decode_r5_grid,
@@ -48,6 +64,7 @@ from src.utils import (
     filter_r5_grid,
     get_random_string,
     h3_to_int,
+    hilbert_curve_index,
     print_hashtags,
     print_info,
     print_warning,
@@ -158,38 +175,40 @@ def pixelate_geom(geom, isochrone_resolution):
         return coords
 
 
+def get_feature_extent(geom, pixel):
+    """
+    Pixel extent of a feature
+
+    :param geom: Geometry of the feature
+    :param pixel: Pixel of a point feature or pixels of a polygon feature
+
+    :return: west, north, east and south pixel, or None if the feature has no pixels
+    """
+    if geom.geom_type == "Point":
+        x, y = pixel
+        return x, y, x, y
+
+    elif geom.geom_type == "Polygon" or geom.geom_type == "MultiPolygon":
+        if pixel is None or len(pixel) == 0:
+            return None
+        pixel = np.asarray(pixel)
+        return pixel[:, 0].min(), pixel[:, 1].min(), pixel[:, 0].max(), pixel[:, 1].max()
+    return None
+
+
 def get_relevant_travel_time_matrices(travel_time_matrices: dict, feature: dict) -> dict:
     """
     Get the travel time matrices that are relevant for the isochrone resolution
 
-    :param travel_time_matrices:
-    :param isochrone_resolution:
+    :param travel_time_matrices: Travel time matrices with their extent index
+    :param feature: Feature with geom and pixel
 
-    :return: dict of relevant travel time matrices
+    :return: indices of relevant travel time matrices
     """
-    if feature.geom.geom_type == "Point":
-        x, y = feature.pixel
-        # Check if feature is in relevant travel time matrices
-        indices_relevant_matrices = (
-            (travel_time_matrices["north"] <= y)
-            & (travel_time_matrices["south"] >= y)
-            & (travel_time_matrices["west"] <= x)
-            & (travel_time_matrices["east"] >= x)
-        ).nonzero()[0]
-
-    elif feature.geom.geom_type == "Polygon" or feature.geom.geom_type == "MultiPolygon":
-        # Check if feature is in relevant travel time matrices
-        try:
-            indices_relevant_matrices = (
-                (travel_time_matrices["north"] <= feature.pixel[0][1])
-                & (travel_time_matrices["south"] >= feature.pixel[-1][1])
-                & (travel_time_matrices["west"] <= feature.pixel[0][0])
-                & (travel_time_matrices["east"] >= feature.pixel[-1][0])
-            ).nonzero()[0]
-        except:
-            return []
-
-    return indices_relevant_matrices
+    extent = get_feature_extent(feature.geom, feature.pixel)
+    if extent is None:
+        return []
+    return travel_time_matrices["extent_index"].query(*extent)
 
 
 def get_opportunity_relations(
@@ -273,6 +292,40 @@ def get_opportunity_relations(
     return result
 
 
+def get_point_opportunity_relations(
+    travel_time_matrices: dict,
+    x: np.ndarray,
+    y: np.ndarray,
+    weights: np.ndarray,
+    max_travel_time: int,
+):
+    """
+    Get the opportunity relations of all point opportunities in one pass
+
+    :param travel_time_matrices: Travel time matrices with their extent index and flattened travel times
+    :param x: np.array of the pixel x of every opportunity at the resolution of the matrices
+    :param y: np.array of the pixel y of every opportunity at the resolution of the matrices
+    :param weights: np.array of the weight of every opportunity
+    :param max_travel_time: int of maximum travel time
+
+    :return: offsets of the relations of every opportunity, travel time, matrix and weight of every relation
+    """
+    relevant_offsets, relevant_matrices = travel_time_matrices["extent_index"].query_many(x, y)
+    return point_opportunity_relations(
+        x,
+        y,
+        np.asarray(weights, np.float32),
+        relevant_offsets,
+        relevant_matrices,
+        travel_time_matrices["north"].astype(np.int64),
+        travel_time_matrices["west"].astype(np.int64),
+        travel_time_matrices["width"].astype(np.int64),
+        travel_time_matrices["travel_times_flat"],
+        travel_time_matrices["travel_times_offsets"],
+        max_travel_time,
+    )
+
+
 class ComputeHeatmap(BaseHeatmap):
     async def get_bulk_ids(
         self,
@@ -377,6 +430,37 @@ class ComputeHeatmap(BaseHeatmap):
 
         return calculation_obj
 
+    @staticmethod
+    def get_polygon_opportunity_relations(
+        travel_time_matrices: dict, geom, pixel: np.ndarray, max_travel_time: int
+    ):
+        """
+        Get the opportunity relations of a polygon opportunity
+
+        :param pixel: np.array of x, y and area of the pixels of the polygon
+
+        :return: dict of opportunity relations, or None if the polygon has no relations
+        """
+        extent = get_feature_extent(geom, pixel)
+        if extent is None:
+            return None
+        indices_relevant_matrices = travel_time_matrices["extent_index"].query(*extent)
+        if len(indices_relevant_matrices) == 0:
+            return None
+        opportunity_relations = get_opportunity_relations(
+            pixel,
+            travel_time_matrices["north"],
+            travel_time_matrices["width"],
+            travel_time_matrices["west"],
+            indices_relevant_matrices,
+            travel_time_matrices["travel_times"][indices_relevant_matrices],
+            travel_time_matrices["grids_ids"][indices_relevant_matrices],
+            max_travel_time,
+        )
+        if len(opportunity_relations["travel_times"]) == 0:
+            return None
+        return opportunity_relations
+
     async def compute_opportunity_matrix(
         self,
         bulk_id: str,
@@ -399,19 +483,19 @@ class ComputeHeatmap(BaseHeatmap):
             s3_folder (str, optional): S3 folder to save opportunity matrix. Defaults to None.
         """
         routing_profile = self.get_isochrone_routing_profile(isochrone_dto)
-        # OPPORTUNITY INTERSECTION
-        opportunities["pixel"] = opportunities["geom"].apply(
-            pixelate_geom, isochrone_resolution=isochrone_dto.output.resolution
-        )
-        weight = None
+        resolution = isochrone_dto.output.resolution
+        max_travel_time = isochrone_dto.settings.travel_time
         if opportunity_type == "population":
             # edge case for population data. Also for other `point` data that that we don't know the key for the weight
             # todo: make this more generic by defining the weight key somewhere else.
             opportunities["category"] = "population"
-            weight = "population"
-        if opportunity_type == "poi":
-            weight = 1
+        if opportunity_type == "population" and "population" in opportunities:
+            weights = opportunities["population"].fillna(0).to_numpy(np.float32)
+        else:
+            weights = np.ones(len(opportunities), np.float32)
 
+        # Relations are stored once per polygon and once per aggregate of the points of a category
+        # in the same pixel, names and uids per opportunity with the index of their relations
         opportunity_matrix = {
             "travel_times": [],
             "grid_ids": [],
@@ -419,82 +503,128 @@ class ComputeHeatmap(BaseHeatmap):
             "uids": [],
             "weight": [],
             "relation_size": [],
+            "opportunity_index": [],
+            "opportunity_weight": [],
         }
         types = {
             "travel_times": np.byte,
             "grid_ids": np.int_,
             "weight": np.float32,
             "relation_size": np.int_,
+            "opportunity_index": np.int_,
+            "opportunity_weight": np.float32,
         }
         _grid_id_int_cache = {}
+        matrix_grid_ids = np.array(
+            [
+                _grid_id_int_cache.setdefault(x, h3.string_to_h3(str(x)))
+                for x in travel_time_matrices["grids_ids"]
+            ],
+            dtype=np.int_,
+        )
+
+        # OPPORTUNITY INTERSECTION
+        # All point aggregates of the bulk are intersected at once, polygons one by one
+        geoms = np.asarray(opportunities["geom"])
+        is_point = shapely.get_type_id(geoms) == 0
+        point_index = np.cumsum(is_point) - 1
+        x, y = coordinates_to_pixels(
+            shapely.get_x(geoms[is_point]), shapely.get_y(geoms[is_point]), resolution
+        )
+        (
+            point_aggregates,
+            aggregate_x,
+            aggregate_y,
+            aggregate_weights,
+        ) = aggregate_point_opportunities(
+            x, y, factorize(opportunities["category"])[0][is_point], weights[is_point]
+        )
+        (
+            relation_offsets,
+            relation_travel_times,
+            relation_matrices,
+            relation_weights,
+        ) = get_point_opportunity_relations(
+            travel_time_matrices, aggregate_x, aggregate_y, aggregate_weights, max_travel_time
+        )
+        relation_travel_times = relation_travel_times.astype(types["travel_times"])
+        relation_grid_ids = matrix_grid_ids[relation_matrices]
+        # The polygons missing in the cache are rasterized together
+        polygon_pixels = polygon_pixel_cache.get_many(geoms[~is_point], resolution)
+        polygon_index = np.cumsum(~is_point) - 1
+
+        uids = opportunities["uid"] if "uid" in opportunities else opportunities.get("id")
+        if "uid" in opportunities and "id" in opportunities:
+            uids = uids.where(uids.astype(bool), opportunities["id"])
+        names = opportunities["name"] if "name" in opportunities else None
+        if names is not None:
+            names = names.where(names.astype(bool), "")
+
         opportunity_categories = []
-        opportunities = opportunities.groupby("category")
-        for category, opportunity_group in opportunities:
+        for category, positions in opportunities.groupby("category").indices.items():
             opportunity_categories.append(category)
             for key in opportunity_matrix.keys():
                 opportunity_matrix[key].append([])
             idx_opportunity_category = len(opportunity_categories) - 1
-            for index, opportunity in opportunity_group.iterrows():
-                uid = opportunity.get("uid") or opportunity.get("id")
-                name = opportunity.get("name") or ""
-                category = opportunity["category"]
-                # Check if feature is in relevant travel time matrices
-                indices_relevant_matrices = get_relevant_travel_time_matrices(
-                    travel_time_matrices, opportunity
-                )
-                if len(indices_relevant_matrices) == 0:
-                    continue
-                # Get the relevant travel time matrices
-                relevant_traveltime_matrices = travel_time_matrices["travel_times"][
-                    indices_relevant_matrices
-                ]
-                # Get the grid ids of the relevant travel time matrices
-                relevant_traveltime_matrices_grid_ids = travel_time_matrices["grids_ids"][
-                    indices_relevant_matrices
-                ]
-
-                if weight is not None and weight in opportunity.keys():
-                    weight = opportunity[weight]
-                    if isnull(weight):
-                        weight = 0
-
-                opportunity_relations = get_opportunity_relations(
-                    opportunity["pixel"],
-                    travel_time_matrices["north"],
-                    travel_time_matrices["width"],
-                    travel_time_matrices["west"],
-                    indices_relevant_matrices,
-                    relevant_traveltime_matrices,
-                    relevant_traveltime_matrices_grid_ids,
-                    isochrone_dto.settings.travel_time,
-                    weight,
-                )
-
-                if len(opportunity_relations["travel_times"]) > 0:
-                    try:
-                        for key in ["travel_times", "weight", "relation_size"]:
-                            opportunity_matrix[key][idx_opportunity_category].append(
-                                np.array(opportunity_relations[key], dtype=types[key])
-                            )
-                    except Exception as e:
-                        print(e)
-                        print(opportunity_relations)
-                        raise e
-                    h3_arr_grid_ids = []
-                    for x in opportunity_relations["grid_ids"]:
-                        h3_int = _grid_id_int_cache.setdefault(x, h3.string_to_h3(str(x)))
-                        h3_arr_grid_ids.append(h3_int)
-
-                    h3_arr_grid_ids = np.array(h3_arr_grid_ids, dtype=np.dtype(np.int_))
-                    opportunity_matrix["grid_ids"][idx_opportunity_category].append(
-                        h3_arr_grid_ids
+            category_relations = opportunity_matrix["relation_size"][idx_opportunity_category]
+            aggregate_relations = {}
+            for position in positions:
+                if is_point[position]:
+                    aggregate = point_aggregates[point_index[position]]
+                    start = relation_offsets[aggregate]
+                    end = relation_offsets[aggregate + 1]
+                    if start == end:
+                        continue
+                    opportunity_index = aggregate_relations.get(aggregate)
+                    if opportunity_index is None:
+                        opportunity_index = aggregate_relations[aggregate] = len(category_relations)
+                        opportunity_relations = {
+                            "travel_times": relation_travel_times[start:end],
+                            "weight": relation_weights[start:end],
+                            "relation_size": np.array([end - start], dtype=types["relation_size"]),
+                            "grid_ids": relation_grid_ids[start:end],
+                        }
+                    else:
+                        opportunity_relations = None
+                else:
+                    opportunity_relations = self.get_polygon_opportunity_relations(
+                        travel_time_matrices,
+                        geoms[position],
+                        polygon_pixels[polygon_index[position]],
+                        max_travel_time,
                     )
+                    if opportunity_relations is None:
+                        continue
+                    opportunity_index = len(category_relations)
+                    opportunity_relations["grid_ids"] = np.array(
+                        [
+                            _grid_id_int_cache.setdefault(x, h3.string_to_h3(str(x)))
+                            for x in opportunity_relations["grid_ids"]
+                        ],
+                        dtype=types["grid_ids"],
+                    )
+                    for key in ["travel_times", "weight", "relation_size"]:
+                        opportunity_relations[key] = np.array(
+                            opportunity_relations[key], dtype=types[key]
+                        )
 
-                    opportunity_matrix["names"][idx_opportunity_category].append(name)
-                    opportunity_matrix["uids"][idx_opportunity_category].append(uid)
-
-                else:
-                    continue
+                if opportunity_relations is not None:
+                    for key in ["travel_times", "weight", "relation_size", "grid_ids"]:
+                        opportunity_matrix[key][idx_opportunity_category].append(
+                            opportunity_relations[key]
+                        )
+                opportunity_matrix["opportunity_index"][idx_opportunity_category].append(
+                    opportunity_index
+                )
+                opportunity_matrix["opportunity_weight"][idx_opportunity_category].append(
+                    weights[position]
+                )
+                opportunity_matrix["names"][idx_opportunity_category].append(
+                    "" if names is None else names.iat[position]
+                )
+                opportunity_matrix["uids"][idx_opportunity_category].append(
+                    None if uids is None else uids.iat[position]
+                )
 
         for key in ["travel_times", "grid_ids", "weight", "relation_size"]:
             for idx, category in enumerate(opportunity_matrix[key]):
@@ -504,9 +634,21 @@ class ComputeHeatmap(BaseHeatmap):
             for idx, category in enumerate(opportunity_matrix[key]):
                 opportunity_matrix[key][idx] = np.array(category, dtype=np.str_)
 
+        for key in ["opportunity_index", "opportunity_weight"]:
+            for idx, category in enumerate(opportunity_matrix[key]):
+                opportunity_matrix[key][idx] = np.array(category, dtype=types[key])
 
         try:
-            for key in ["travel_times", "grid_ids", "weight", "relation_size", "names", "uids"]:
+            for key in [
+                "travel_times",
+                "grid_ids",
+                "weight",
+                "relation_size",
+                "names",
+                "uids",
+                "opportunity_index",
+                "opportunity_weight",
+            ]:
                 opportunity_matrix[key] = np.array(opportunity_matrix[key], dtype=object)
 
             opportunity_matrix["categories"] = np.array(opportunity_categories, dtype=np.str_)
@@ -571,34 +713,20 @@ class ComputeHeatmap(BaseHeatmap):
             )
       
 
-    async def compute_traveltime_active_mobility(
-        self,
-        isochrone_dto: IsochroneDTO,
-        calculation_obj: dict,
-        s3_folder: str = "",
+    async def read_network_artificial_edges(
+        self, isochrone_dto: IsochroneDTO, obj: dict, routing_profile: str, random_table_prefix: str
     ):
-        """Computes the traveltime for active mobility in matrix style.
+        """Snaps the starting points with artificial edges in the database and reads the network.
 
         Args:
             isochrone_dto (IsochroneDTO): Settings for the isochrone calculation
-            calculation_obj (dict): Hierarchical structure of starting points for the calculation using the bulk resolution as parent and calculation resolution as children.
-            s3_folder: The S3 output directory where the travel time folder will be stored
-        """
-        # Create random table prefix for starting ids and artificial edges
-        random_table_prefix = get_random_string(10)
-        starting_time = time.time()
-
-        # Get Routing Profile
-        routing_profile = self.get_isochrone_routing_profile(isochrone_dto)
-
-        # Get calculation object
-        bulk_id = list(calculation_obj.keys())[0]
-        obj = calculation_obj[bulk_id]
+            obj (dict): Starting points of the bulk
+            routing_profile (str): Routing profile
+            random_table_prefix (str): Prefix of the tables for the artificial edges
 
-        # Check if there are no starting points
-        if len(obj["starting_point_objs"]) == 0:
-            print_info(f"No starting points for section.")
-            return
+        Returns:
+            Network, starting ids, grid ids and extents of the valid starting points or None
+        """
         # Prepare starting points using routing network
         db = async_session()
         starting_ids = await db.execute(
@@ -620,8 +748,7 @@ class ComputeHeatmap(BaseHeatmap):
         await db.close()
 
         if len(starting_ids) == 0:
-            print_info(f"No starting points for section.")
-            return
+            return None
 
         # Sort out invalid starting points (no network edge found)
         valid_extents = []
@@ -651,22 +778,68 @@ class ComputeHeatmap(BaseHeatmap):
             table_prefix=random_table_prefix,
         )
         db.close()
-        network = network[0]
-        network = network.iloc[1:, :]
+        return network[0], starting_ids, grid_ids, extents
+
+    async def compute_traveltime_active_mobility(
+        self,
+        isochrone_dto: IsochroneDTO,
+        calculation_obj: dict,
+        s3_folder: str = "",
+    ):
+        """Computes the traveltime for active mobility in matrix style.
+
+        Args:
+            isochrone_dto (IsochroneDTO): Settings for the isochrone calculation
+            calculation_obj (dict): Hierarchical structure of starting points for the calculation using the bulk resolution as parent and calculation resolution as children.
+            s3_folder: The S3 output directory where the travel time folder will be stored
+        """
+        # Create random table prefix for starting ids and artificial edges
+        random_table_prefix = get_random_string(10)
+        starting_time = time.time()
+
+        # Get Routing Profile
+        routing_profile = self.get_isochrone_routing_profile(isochrone_dto)
+
+        # Get calculation object
+        bulk_id = list(calculation_obj.keys())[0]
+        obj = calculation_obj[bulk_id]
+
+        # Check if there are no starting points
+        if len(obj["starting_point_objs"]) == 0:
+            print_info(f"No starting points for section.")
+            return
+        # Snap the starting points and read the network, in memory if the network store can serve the bulk
+        network = None
+        if settings.ROUTING_NETWORK_STORE_ENABLED:
+            network = network_store.read_network_multi(
+                obj["lons"],
+                obj["lats"],
+                isochrone_dto.settings.travel_time * 60,
+                isochrone_dto.settings.speed / 3.6,
+                isochrone_dto.mode.value + "_" + routing_profile,
+            )
+        if network is not None:
+            network, starting_ids, _ = network
+            # Sort out invalid starting points (no network edge found)
+            valid_starts = starting_ids != -1
+            grid_ids = np.array(obj["calculation_ids"])[valid_starts]
+            extents = np.array(obj["extents"])[valid_starts]
+            starting_ids = starting_ids[valid_starts]
+        else:
+            network = await self.read_network_artificial_edges(
+                isochrone_dto, obj, routing_profile, random_table_prefix
+            )
+            if network is None:
+                print_info(f"No starting points for section.")
+                return
+            network, starting_ids, grid_ids, extents = network
+
+        if len(starting_ids) == 0:
+            print_info(f"No starting points for section.")
+            return
 
         # Prepare network
-        (
-            edges_source,
-            edges_target,
-            edges_cost,
-            edges_reverse_cost,
-            edges_length,
-            unordered_map,
-            node_coords,
-            total_extent,
-            geom_address,
-            geom_array,
-        ) = prepare_network_isochrone(network)
+        network = prepare_network_isochrone(network)
 
         # Prepare heatmap calculation objects
         traveltimeobjs = {
@@ -678,36 +851,48 @@ class ComputeHeatmap(BaseHeatmap):
             "grid_ids": [],
             "travel_times": [],
         }
-        adj_list = construct_adjacency_list_(len(edges_source), edges_source, edges_target, edges_cost, edges_reverse_cost)
 
-        for idx, start_vertex in enumerate(starting_ids):
+        # Map start vertices to graph nodes, skip the ones not in the network
+        start_ids, valid_starts = network.get_node_index(starting_ids)
+        grid_ids = grid_ids[valid_starts]
+        extents = extents[valid_starts]
+        start_ids = start_ids[valid_starts]
+        if len(start_ids) == 0:
+            print_info(f"No starting points for section.")
+            return
+
+        # Run Dijkstra for all start vertices at once
+        start_time = time.time()
+        reached, search_index = dijkstra_many(
+            start_ids, network.graph, isochrone_dto.settings.travel_time, algorithm="dial"
+        )
+        print_info(f"Time dijkstra for {len(start_ids)} starting points: {time.time() - start_time}")
+
+        for idx in range(len(start_ids)):
             # Assign variables
             grid_id = grid_ids[idx]
             extent = extents[idx]
-            starting_point_obj = starting_point_objs[idx]
-            # Get start vertex
-            try:
-                start_id = np.array([unordered_map[v] for v in [start_vertex]])
-            except Exception as e:
-                print(e)
-                continue
-            # Run Dijkstra
-            start_time = time.time()
-            distances = dijkstra(start_id, adj_list, isochrone_dto.settings.travel_time)
-            print(f"Time dijkstra: {time.time() - start_time}")
+            distances = reached_to_distances(reached, search_index[idx], network.n_nodes)
+            # Only the edges reached from this start vertex are converted
+            index = search_index[idx]
+            reached_edges = get_reached_edges_(
+                reached.nodes[reached.offsets[index] : reached.offsets[index + 1]],
+                network.node_edges,
+            )
 
             # Convert network to grid
             grid = network_to_grid(
                 extent,
                 isochrone_dto.output.resolution,
-                edges_source,
-                edges_target,
-                edges_length,
-                geom_address,
-                geom_array,
+                network.edges_source,
+                network.edges_target,
+                network.edges_length,
+                network.geom_address,
+                network.geom_array,
                 distances,
-                node_coords,
-                isochrone_dto.settings.speed / 3.6, 
+                reached_edges,
+                network.node_coords,
+                isochrone_dto.settings.speed / 3.6,
                 isochrone_dto.settings.travel_time,
             )
             try:
@@ -724,7 +909,7 @@ class ComputeHeatmap(BaseHeatmap):
                 traveltimeobjs[key].append(grid[key])
             # Print progress
             if idx % 100 == 0:
-                print_info(f"Progress traveltime matrices: {idx}/{len(starting_ids)}")
+                print_info(f"Progress traveltime matrices: {idx}/{len(start_ids)}")
 
         # Convert to numpy arrays
         for key in traveltimeobjs.keys():
@@ -933,23 +1118,18 @@ class ComputeHeatmap(BaseHeatmap):
         
 
 
-    async def read_travel_time_matrices(
-        self, bulk_id: str, isochrone_dto: IsochroneDTO, s3_folder: str = ""
-    ):
+    def get_travel_time_grids(self, bulk_id: str, isochrone_dto: IsochroneDTO) -> list[str]:
         """
-        Reads the travel time matrices from the local file system or from S3 if configured.
+        Bulks with travel time matrices that can reach the bulk
 
         Args:
-            bulk_id (str): The bulk id for which the travel time matrices should be read
+            bulk_id (str): The bulk id
             isochrone_dto (IsochroneDTO): The isochrone DTO containing the settings
 
         Returns:
-            dict: The travel time matrices
-
+            list[str]: The bulk ids of the travel time matrices
         """
-        # FIND RELEVANT TRAVEL TIME MATRICES
         bulk_resolution = h3.h3_get_resolution(h=bulk_id)
-        routing_profile = self.get_isochrone_routing_profile(isochrone_dto)
         if (
             isochrone_dto.mode == IsochroneMode.WALKING
             or isochrone_dto.mode == IsochroneMode.CYCLING
@@ -963,9 +1143,69 @@ class ComputeHeatmap(BaseHeatmap):
 
         edge_length = h3.edge_length(resolution=bulk_resolution, unit="m")
         distance_in_neightbors = math.ceil(max_travel_distance / edge_length)
-        travel_time_grids = h3.k_ring(h=bulk_id, k=distance_in_neightbors)
+        return sorted(h3.k_ring(h=bulk_id, k=distance_in_neightbors))
+
+    def order_bulk_ids(self, bulk_ids: list[str]) -> list[str]:
+        """
+        Orders bulks along a Hilbert curve, so that consecutive bulks share most of their travel time matrices
+        """
+        if len(bulk_ids) == 0:
+            return []
+        latitudes, longitudes = np.array([h3.h3_to_geo(bulk_id) for bulk_id in bulk_ids]).T
+        # Pixels of zoom 8 are about 600 meters wide, the zoom has 2**16 pixels per axis
+        x, y = coordinates_to_pixels(longitudes, latitudes, zoom=8)
+        order = np.argsort(hilbert_curve_index(x, y, order=16), kind="stable")
+        return [bulk_ids[i] for i in order]
+
+    async def read_travel_time_matrix(
+        self, bulk_id: str, mode: str, profile: str, s3_folder: str = ""
+    ):
+        """Reads and decodes the travel time matrix of a bulk, None if it doesn't exist."""
+        print(f"Reading travel time matrix {bulk_id}...")
+        matrix = await self.download_travel_time_matrices(bulk_id, mode, profile, s3_folder)
+        if matrix is None:
+            return None
+        with matrix:
+            return {
+                key: matrix[key]
+                for key in ["north", "west", "height", "width", "grid_ids", "travel_times"]
+            }
+
+    async def read_travel_time_matrices(
+        self,
+        bulk_id: str,
+        isochrone_dto: IsochroneDTO,
+        s3_folder: str = "",
+        matrix_cache: TravelTimeMatrixCache = None,
+    ):
+        """
+        Reads the travel time matrices from the local file system or from S3 if configured.
+
+        Args:
+            bulk_id (str): The bulk id for which the travel time matrices should be read
+            isochrone_dto (IsochroneDTO): The isochrone DTO containing the settings
+            matrix_cache (TravelTimeMatrixCache, optional): Cache of the decoded matrices of a sequence of bulks
+
+        Returns:
+            dict: The travel time matrices
+
+        """
+        # FIND RELEVANT TRAVEL TIME MATRICES
+        routing_profile = self.get_isochrone_routing_profile(isochrone_dto)
+        travel_time_grids = self.get_travel_time_grids(bulk_id, isochrone_dto)
 
         # FETCH TRAVEL TIME MATRICES
+        keys_to_read = (
+            travel_time_grids if matrix_cache is None else matrix_cache.missing(travel_time_grids)
+        )
+        matrices = {}
+        for key in keys_to_read:
+            matrices[key] = await self.read_travel_time_matrix(
+                key, isochrone_dto.mode.value, routing_profile, s3_folder
+            )
+        if matrix_cache is not None:
+            matrices = matrix_cache.update(travel_time_grids, matrices)
+
         travel_time_matrices = {
             "north": [],
             "west": [],
@@ -976,54 +1216,16 @@ class ComputeHeatmap(BaseHeatmap):
             "grids_ids": [],
             "travel_times": [],
         }
-
         for key in travel_time_grids:
-            print(f"Reading travel time matrix {key}...")
-            file_name = f"{key}.npz"
-            dir_profile = os.path.join(
-                settings.TRAVELTIME_MATRICES_PATH, isochrone_dto.mode.value, routing_profile
-            )
-            file_path = os.path.join(
-                dir_profile,
-                file_name,
-            )
-            # check if file doesn't exist in local file system and missing_keys folder
-            if s3_folder != "" and not os.path.exists(file_path):
-                # check if file exists in S3
-                if settings.S3_CLIENT:
-                    print_info(f"File {key}.npz not found locally. Checking S3...")
-                    try:
-                        s3_path = os.path.join(
-                            f"{s3_folder}/traveltime_matrices/{isochrone_dto.mode.value}",
-                            routing_profile,
-                            file_name,
-                        )
-                        if not os.path.exists(dir_profile):
-                            os.makedirs(dir_profile, exist_ok=True)
-                        settings.S3_CLIENT.download_file(
-                            settings.AWS_BUCKET_NAME,
-                            s3_path,
-                            file_path,
-                        )
-                    except Exception as e:
-                        print_warning(f"File {key}.npz not found in S3. Skipping...")
-                        continue
-                else:
-                    print_warning(f"File {key}.npz not found locally. Skipping...")
-                    continue
-
-            try:
-                matrix = np.load(
-                    file_path,
-                    allow_pickle=True,
-                )
-            except FileNotFoundError:
-                print_warning(f"Cant load file {file_path}. Skipping...")
+            matrix = matrices[key]
+            if matrix is None:
                 continue
 
             # loop through travel_time_matrices and add the values of grid
-            for key in set(travel_time_matrices.keys()).difference(["south", "east", "grids_ids"]):
-                travel_time_matrices[key].append(matrix[key])
+            for value in set(travel_time_matrices.keys()).difference(
+                ["south", "east", "grids_ids"]
+            ):
+                travel_time_matrices[value].append(matrix[value])
 
             # calculate south and east
             travel_time_matrices["south"].append(matrix["north"] + matrix["height"] - 1)
@@ -1039,6 +1241,27 @@ class ComputeHeatmap(BaseHeatmap):
             print_warning(f"Error while reading travel time matrices: {e}")
             return None
 
+        # Flatten the travel times for the opportunity kernels, the matrices become views into them
+        travel_times = travel_time_matrices["travel_times"]
+        sizes = [len(matrix) for matrix in travel_times]
+        travel_time_matrices["travel_times_offsets"] = np.zeros(len(sizes) + 1, np.int64)
+        np.cumsum(sizes, out=travel_time_matrices["travel_times_offsets"][1:])
+        flat = np.concatenate([np.asarray(matrix) for matrix in travel_times])
+        if flat.dtype == object:
+            flat = flat.astype(np.int32)
+        if travel_times.ndim == 1:
+            offsets = travel_time_matrices["travel_times_offsets"]
+            for i in range(len(travel_times)):
+                travel_times[i] = flat[offsets[i] : offsets[i + 1]]
+        travel_time_matrices["travel_times_flat"] = flat
+
+        # Index of the matrix extents, shared by all opportunity types of the bulk
+        travel_time_matrices["extent_index"] = MatrixExtentIndex(
+            travel_time_matrices["north"],
+            travel_time_matrices["west"],
+            travel_time_matrices["south"],
+            travel_time_matrices["east"],
+        )
         return travel_time_matrices
 
     @staticmethod
@@ -1,11 +1,16 @@
+import hashlib
 import os
-from math import exp
+import tempfile
+from collections import OrderedDict, defaultdict, deque
+from math import exp, inf
 from time import time
 
 import numpy as np
-from numba import njit
+import shapely
+from numba import njit, prange
 
-from src.utils import delete_file
+from src.core.config import settings
+from src.utils import coordinates_to_pixels, delete_file
 
 ii32 = np.iinfo(np.int32)
 example_weights_max = np.array([ii32.max], dtype=np.float32)
@@ -308,6 +313,441 @@ def test_quantile(n):
             # print(i,np.where(out==i)[0].size)
 
 
+class MatrixExtentIndex:
+    """
+    Index of the pixel extents of the travel time matrices of a bulk.
+
+    The pixels are divided into square buckets of about the size of a matrix. Every bucket
+    lists the matrices overlapping it (CSR layout), so finding the matrices that cover a pixel
+    or an extent only checks the few matrices of one bucket.
+    """
+
+    def __init__(self, north, west, south, east):
+        """
+        :param north: Array of the north pixel of every matrix
+        :param west: Array of the west pixel of every matrix
+        :param south: Array of the south pixel of every matrix (inclusive)
+        :param east: Array of the east pixel of every matrix (inclusive)
+        """
+        self.north = np.asarray(north, np.int64)
+        self.west = np.asarray(west, np.int64)
+        self.south = np.asarray(south, np.int64)
+        self.east = np.asarray(east, np.int64)
+        if len(self.north) == 0:
+            self.bucket_size = 1
+            self.bucket_x_min = self.bucket_y_min = self.n_buckets_x = self.n_buckets_y = 0
+            self.offsets = np.zeros(1, np.int64)
+            self.matrices = np.zeros(0, np.int64)
+            return
+
+        extent_size = np.maximum(self.south - self.north, self.east - self.west) + 1
+        self.bucket_size = max(int(np.median(extent_size)), 1)
+        bucket_west = self.west // self.bucket_size
+        bucket_east = self.east // self.bucket_size
+        bucket_north = self.north // self.bucket_size
+        bucket_south = self.south // self.bucket_size
+        self.bucket_x_min = int(bucket_west.min())
+        self.bucket_y_min = int(bucket_north.min())
+        self.n_buckets_x = int(bucket_east.max()) - self.bucket_x_min + 1
+        self.n_buckets_y = int(bucket_south.max()) - self.bucket_y_min + 1
+
+        # One entry for every bucket a matrix overlaps
+        buckets_x = bucket_east - bucket_west + 1
+        counts = buckets_x * (bucket_south - bucket_north + 1)
+        matrices = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        bucket_x = np.repeat(bucket_west, counts) + local % np.repeat(buckets_x, counts)
+        bucket_y = np.repeat(bucket_north, counts) + local // np.repeat(buckets_x, counts)
+        keys = (bucket_y - self.bucket_y_min) * self.n_buckets_x + bucket_x - self.bucket_x_min
+        # The stable sort keeps the matrices of every bucket in ascending order
+        order = np.argsort(keys, kind="stable")
+        self.matrices = matrices[order]
+        self.offsets = np.zeros(self.n_buckets_x * self.n_buckets_y + 1, np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.n_buckets_x * self.n_buckets_y), out=self.offsets[1:])
+
+    def get_bucket(self, x, y):
+        """
+        Bucket of every pixel x, y (-1 outside of the index)
+        """
+        bucket_x = np.asarray(x, np.int64) // self.bucket_size - self.bucket_x_min
+        bucket_y = np.asarray(y, np.int64) // self.bucket_size - self.bucket_y_min
+        inside = (
+            (bucket_x >= 0)
+            & (bucket_x < self.n_buckets_x)
+            & (bucket_y >= 0)
+            & (bucket_y < self.n_buckets_y)
+        )
+        return np.where(inside, bucket_y * self.n_buckets_x + bucket_x, -1)
+
+    def query(self, west: int, north: int, east: int = None, south: int = None) -> np.ndarray:
+        """
+        Matrices covering the pixel west, north or the extent from west, north to east, south
+
+        :return: Ascending indices of the matrices
+        """
+        east = west if east is None else east
+        south = north if south is None else south
+        bucket = int(self.get_bucket(west, north))
+        if bucket == -1:
+            return np.zeros(0, np.int64)
+        candidates = self.matrices[self.offsets[bucket] : self.offsets[bucket + 1]]
+        return candidates[
+            (self.north[candidates] <= north)
+            & (self.south[candidates] >= south)
+            & (self.west[candidates] <= west)
+            & (self.east[candidates] >= east)
+        ]
+
+    def query_many(self, west, north, east=None, south=None):
+        """
+        Matrices covering every pixel or extent (batched query)
+
+        :return: Offsets and ascending indices of the matrices of every query (CSR layout)
+        """
+        west = np.asarray(west, np.int64)
+        north = np.asarray(north, np.int64)
+        east = west if east is None else np.asarray(east, np.int64)
+        south = north if south is None else np.asarray(south, np.int64)
+        bucket = self.get_bucket(west, north)
+        start = np.where(bucket != -1, self.offsets[bucket], 0)
+        counts = np.where(bucket != -1, self.offsets[bucket + 1] - start, 0)
+        queries = np.repeat(np.arange(len(bucket)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = self.matrices[np.repeat(start, counts) + local]
+        covered = (
+            (self.north[candidates] <= north[queries])
+            & (self.south[candidates] >= south[queries])
+            & (self.west[candidates] <= west[queries])
+            & (self.east[candidates] >= east[queries])
+        )
+        offsets = np.zeros(len(bucket) + 1, np.int64)
+        np.cumsum(np.bincount(queries[covered], minlength=len(bucket)), out=offsets[1:])
+        return offsets, candidates[covered]
+
+
+@njit(parallel=True, cache=True)
+def point_opportunity_relations(
+    x,
+    y,
+    weights,
+    relevant_offsets,
+    relevant_matrices,
+    matrix_north,
+    matrix_west,
+    matrix_width,
+    travel_times,
+    travel_times_offsets,
+    max_travel_time,
+):
+    """
+    Relations of point opportunities to the travel time matrices covering them
+    :param x: Array of pixel x of every opportunity
+    :param y: Array of pixel y of every opportunity
+    :param weights: Array of the weight of every opportunity
+    :param relevant_offsets: Offsets of the matrices covering every opportunity (CSR layout)
+    :param relevant_matrices: Indices of the matrices covering every opportunity
+    :param matrix_north: Array of the north pixel of every matrix
+    :param matrix_west: Array of the west pixel of every matrix
+    :param matrix_width: Array of the width of every matrix
+    :param travel_times: Travel times of all matrices, flattened
+    :param travel_times_offsets: Offset of every matrix in travel_times
+    :param max_travel_time: Maximum travel time
+    :return: Offsets of the relations of every opportunity, travel time, matrix and weight of every relation
+    """
+    n = len(x)
+    # First pass counts the relations, the second one writes them
+    counts = np.zeros(n, np.int64)
+    for i in prange(n):
+        for k in range(relevant_offsets[i], relevant_offsets[i + 1]):
+            m = relevant_matrices[k]
+            pixel = (y[i] - matrix_north[m]) * matrix_width[m] + x[i] - matrix_west[m]
+            travel_time = travel_times[travel_times_offsets[m] + pixel]
+            if travel_time <= max_travel_time and travel_time >= 0:
+                counts[i] += 1
+    offsets = np.zeros(n + 1, np.int64)
+    offsets[1:] = np.cumsum(counts)
+    relation_travel_times = np.empty(offsets[-1], travel_times.dtype)
+    relation_matrices = np.empty(offsets[-1], np.int64)
+    relation_weights = np.empty(offsets[-1], np.float32)
+    for i in prange(n):
+        j = offsets[i]
+        for k in range(relevant_offsets[i], relevant_offsets[i + 1]):
+            m = relevant_matrices[k]
+            pixel = (y[i] - matrix_north[m]) * matrix_width[m] + x[i] - matrix_west[m]
+            travel_time = travel_times[travel_times_offsets[m] + pixel]
+            if travel_time <= max_travel_time and travel_time >= 0:
+                relation_travel_times[j] = travel_time
+                relation_matrices[j] = m
+                relation_weights[j] = weights[i]
+                j += 1
+    return offsets, relation_travel_times, relation_matrices, relation_weights
+
+
+def aggregate_point_opportunities(x, y, categories, weights):
+    """
+    Aggregate the point opportunities of a category that lie in the same pixel. They share their
+    relations to the travel time matrices, so these are computed and stored once per aggregate.
+
+    :param x: Array of pixel x of every opportunity
+    :param y: Array of pixel y of every opportunity
+    :param categories: Array of the category code of every opportunity
+    :param weights: Array of the weight of every opportunity
+    :return: Aggregate of every opportunity, and pixel x, pixel y and summed weight of every aggregate
+    """
+    keys = np.column_stack((categories, y, x)).astype(np.int64)
+    aggregates, opportunity_aggregates = np.unique(keys, axis=0, return_inverse=True)
+    opportunity_aggregates = opportunity_aggregates.reshape(-1)
+    aggregate_weights = np.bincount(
+        opportunity_aggregates, weights=weights, minlength=len(aggregates)
+    ).astype(np.float32)
+    return opportunity_aggregates, aggregates[:, 2], aggregates[:, 1], aggregate_weights
+
+
+# Zoom level the polygons are rasterized at before the pixels are summed up to the isochrone zoom
+POLYGON_PIXELATE_ZOOM = 15
+
+
+@njit(parallel=True, cache=True)
+def rasterize_polygons_(
+    coords_x,
+    coords_y,
+    ring_offsets,
+    polygon_ring_offsets,
+    row_min,
+    row_max,
+    target_x0,
+    target_y0,
+    target_width,
+    target_offsets,
+    factor,
+):
+    """
+    Scanline rasterization of polygons, the pixel centers inside are counted per target pixel
+    :param coords_x: x of the ring coordinates of all polygons (pixels of the rasterize zoom)
+    :param coords_y: y of the ring coordinates of all polygons (pixels of the rasterize zoom)
+    :param ring_offsets: Offsets of the coordinates of every ring (closed rings)
+    :param polygon_ring_offsets: Offsets of the rings of every polygon
+    :param row_min: First pixel row of every polygon
+    :param row_max: Last pixel row of every polygon (exclusive)
+    :param target_x0: First target pixel column of every polygon
+    :param target_y0: First target pixel row of every polygon
+    :param target_width: Width of the target window of every polygon
+    :param target_offsets: Offset of the target window of every polygon in the counts
+    :param factor: Number of pixels per target pixel along one axis
+    :return: Number of pixels inside of every target pixel of the target windows
+    """
+    counts = np.zeros(target_offsets[-1], np.int64)
+    for p in prange(len(row_min)):
+        first_ring = polygon_ring_offsets[p]
+        last_ring = polygon_ring_offsets[p + 1]
+        crossings = np.empty(ring_offsets[last_ring] - ring_offsets[first_ring], np.double)
+        for row in range(row_min[p], row_max[p]):
+            center_y = row + 0.5
+            # Crossings of the edges with the row through the pixel centers (even-odd rule)
+            k = 0
+            for ring in range(first_ring, last_ring):
+                for e in range(ring_offsets[ring], ring_offsets[ring + 1] - 1):
+                    y1 = coords_y[e]
+                    y2 = coords_y[e + 1]
+                    if (y1 <= center_y) != (y2 <= center_y):
+                        crossings[k] = coords_x[e] + (center_y - y1) * (
+                            coords_x[e + 1] - coords_x[e]
+                        ) / (y2 - y1)
+                        k += 1
+            row_crossings = np.sort(crossings[:k])
+            target_row = int(np.floor(center_y / factor + 0.5)) - target_y0[p]
+            for j in range(0, k - 1, 2):
+                # Pixels with their center from one crossing to the next
+                for column in range(
+                    int(np.ceil(row_crossings[j] - 0.5)), int(np.ceil(row_crossings[j + 1] - 0.5))
+                ):
+                    target_column = int(np.floor((column + 0.5) / factor + 0.5)) - target_x0[p]
+                    counts[target_offsets[p] + target_row * target_width[p] + target_column] += 1
+    return counts
+
+
+def pixelate_polygons(geoms, zoom: int, pixelate_zoom: int = POLYGON_PIXELATE_ZOOM) -> list:
+    """
+    Pixelate polygons (EPSG:4326) to the pixels of the zoom level. All polygons are rasterized
+    in one pass at the pixelate zoom and the pixels inside are counted per pixel of the zoom level.
+
+    :param geoms: Array of polygons or multipolygons
+    :param zoom: Zoom level of the pixels
+    :param pixelate_zoom: Zoom level the polygons are rasterized at
+
+    :return: Array of x, y and number of pixelate zoom pixels inside (rows of y, then x) of every polygon
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    if len(geoms) == 0:
+        return []
+    pixel_geoms = shapely.transform(
+        geoms,
+        lambda coords: np.column_stack(
+            coordinates_to_pixels(coords[:, 0], coords[:, 1], pixelate_zoom, round_int=False)
+        ),
+    )
+    # Rings of all polygons, the rings of a polygon are consecutive
+    parts, part_polygon = shapely.get_parts(pixel_geoms, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+    ring_offsets = np.searchsorted(coord_ring, np.arange(len(rings) + 1))
+    polygon_ring_offsets = np.searchsorted(part_polygon[ring_part], np.arange(len(geoms) + 1))
+
+    factor = 2 ** (pixelate_zoom - zoom)
+    bounds = shapely.bounds(pixel_geoms)
+    target_x0 = np.floor(bounds[:, 0] / factor + 0.5).astype(np.int64)
+    target_y0 = np.floor(bounds[:, 1] / factor + 0.5).astype(np.int64)
+    target_width = np.floor(bounds[:, 2] / factor + 0.5).astype(np.int64) - target_x0 + 1
+    target_height = np.floor(bounds[:, 3] / factor + 0.5).astype(np.int64) - target_y0 + 1
+    target_offsets = np.zeros(len(geoms) + 1, np.int64)
+    np.cumsum(target_width * target_height, out=target_offsets[1:])
+    counts = rasterize_polygons_(
+        coords[:, 0],
+        coords[:, 1],
+        ring_offsets,
+        polygon_ring_offsets,
+        np.floor(bounds[:, 1]).astype(np.int64),
+        np.ceil(bounds[:, 3]).astype(np.int64),
+        target_x0,
+        target_y0,
+        target_width,
+        target_offsets,
+        factor,
+    )
+
+    # Pixels with at least one pixel inside, sorted by polygon, y and x
+    inside = np.flatnonzero(counts)
+    polygon = np.searchsorted(target_offsets, inside, side="right") - 1
+    local = inside - target_offsets[polygon]
+    pixels = np.column_stack(
+        [
+            target_x0[polygon] + local % target_width[polygon],
+            target_y0[polygon] + local // target_width[polygon],
+            counts[inside],
+        ]
+    )
+    return np.split(pixels, np.searchsorted(polygon, np.arange(1, len(geoms))))
+
+
+class PolygonPixelCache:
+    """
+    Cache of the pixels of polygon opportunities by geometry hash.
+
+    The first tier is an LRU cache per process, the second tier is shared by all processes and
+    runs through files in the cache directory. Unchanged polygons are not rasterized again across
+    bulks, runs and scenarios.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.pixels = OrderedDict()
+
+    def get_path(self, key: tuple) -> str:
+        geom_hash, zoom = key
+        return f"{settings.POLYGON_PIXEL_CACHE_PATH}/{zoom}/{geom_hash[:2]}/{geom_hash}.npy"
+
+    def put(self, key: tuple, pixels: np.ndarray, shared: bool = True):
+        self.pixels[key] = pixels
+        self.pixels.move_to_end(key)
+        while len(self.pixels) > self.max_size:
+            self.pixels.popitem(last=False)
+        if shared:
+            path = self.get_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so that readers never see partial results
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                np.save(f, pixels)
+            os.replace(f.name, path)
+
+    def get(self, key: tuple):
+        pixels = self.pixels.get(key)
+        if pixels is not None:
+            self.pixels.move_to_end(key)
+            return pixels
+        try:
+            pixels = np.load(self.get_path(key))
+        except FileNotFoundError:
+            return None
+        self.put(key, pixels, shared=False)
+        return pixels
+
+    def get_many(self, geoms, zoom: int) -> list:
+        """
+        Pixels of the polygons, the polygons missing in the cache are pixelated together
+
+        :param geoms: Array of polygons or multipolygons (EPSG:4326)
+        :param zoom: Zoom level of the pixels
+
+        :return: Array of x, y and area in pixels of the pixelate zoom of every polygon
+        """
+        geoms = np.asarray(geoms, dtype=object)
+        keys = [
+            (hashlib.sha256(geom_wkb).hexdigest(), zoom) for geom_wkb in shapely.to_wkb(geoms)
+        ]
+        pixels = [self.get(key) for key in keys]
+        missing = [i for i, polygon_pixels in enumerate(pixels) if polygon_pixels is None]
+        if missing:
+            for i, polygon_pixels in zip(missing, pixelate_polygons(geoms[missing], zoom)):
+                pixels[i] = polygon_pixels
+                self.put(keys[i], polygon_pixels)
+        return pixels
+
+
+polygon_pixel_cache = PolygonPixelCache(settings.POLYGON_PIXEL_CACHE_SIZE)
+
+
+class TravelTimeMatrixCache:
+    """
+    Decoded travel time matrices for a sequence of bulks. The travel time matrices of every bulk
+    are known up front, so the matrix needed again furthest in the future is evicted first.
+    Bulks in spatial order share most of their matrices, which are read once this way.
+    """
+
+    def __init__(self, schedule: list[list[str]], max_size: int):
+        """
+        :param schedule: Keys of the travel time matrices of every bulk, in the order of the bulks
+        :param max_size: Number of matrices kept between bulks
+        """
+        self.max_size = max_size
+        self.matrices = {}
+        self.step = -1
+        self.reads = 0
+        self.uses = defaultdict(deque)
+        for step, keys in enumerate(schedule):
+            for key in keys:
+                self.uses[key].append(step)
+
+    def missing(self, keys: list[str]) -> list[str]:
+        return [key for key in keys if key not in self.matrices]
+
+    def next_use(self, key: str):
+        uses = self.uses[key]
+        return uses[0] if uses else inf
+
+    def update(self, keys: list[str], matrices: dict) -> dict:
+        """
+        Advance to the next bulk
+
+        :param keys: Keys of the travel time matrices of the bulk
+        :param matrices: Matrices read for the keys that were missing
+
+        :return: dict of the matrices of the bulk
+        """
+        self.step += 1
+        self.reads += len(matrices)
+        self.matrices.update(matrices)
+        for key in keys:
+            uses = self.uses[key]
+            while uses and uses[0] <= self.step:
+                uses.popleft()
+        result = {key: self.matrices[key] for key in keys}
+        # Matrices that are not needed anymore are dropped, then the ones needed furthest ahead
+        keep = [key for key in self.matrices if self.next_use(key) < inf]
+        keep = sorted(keep, key=self.next_use)[: self.max_size]
+        self.matrices = {key: self.matrices[key] for key in keep}
+        return result
+
+
 def save_traveltime_matrix(bulk_id: int, traveltimeobjs: dict, output_dir: str):
     # Convert to numpy arrays
     for key in traveltimeobjs.keys():
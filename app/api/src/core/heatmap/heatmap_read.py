@@ -205,11 +205,20 @@ class ReadHeatmap(BaseHeatmap):
             matrix_base_path = os.path.join(
                 settings.OPPORTUNITY_MATRICES_PATH, heatmap_settings.mode.value, profile
             )
-            grids, traveltimes, weights, uids, relation_sizes = self.read_opportunity_matrix(
+            (
+                grids,
+                traveltimes,
+                weights,
+                uids,
+                relation_sizes,
+                opportunity_indexes,
+                opportunity_weights,
+            ) = self.read_opportunity_matrix(
                 matrix_base_path=matrix_base_path,
                 bulk_ids=bulk_ids,
                 heatmap_config=heatmap_settings.heatmap_config,
             )
+            counts = self.get_relation_counts(relation_sizes, opportunity_indexes)
 
             calculations = self.prepare_result(
                 heatmap_settings=heatmap_settings,
@@ -217,6 +226,7 @@ class ReadHeatmap(BaseHeatmap):
                 grid_array=grid_array,
                 traveltimes=traveltimes,
                 weights=weights,
+                counts=counts,
             )
 
             calculations_scenario = None
@@ -230,8 +240,11 @@ class ReadHeatmap(BaseHeatmap):
                     grid_array=grid_array,
                     traveltimes=traveltimes,
                     weights=weights,
+                    counts=counts,
                     uids=uids,
                     relation_sizes=relation_sizes,
+                    opportunity_indexes=opportunity_indexes,
+                    opportunity_weights=opportunity_weights,
                 )
 
             quantiles = self.create_quantile_arrays(
@@ -257,11 +270,19 @@ class ReadHeatmap(BaseHeatmap):
     def read_opportunity_matrix(
         self, matrix_base_path: str, bulk_ids: list[str], heatmap_config: dict
     ):
+        """
+        Read the opportunity matrices of the bulks. Relations are stored per polygon and per
+        aggregate of the points of a category in a pixel, uids per opportunity with the index
+        of their relations.
+        """
         travel_times_dict = {}
         grid_ids_dict = {}
         weight_dict = {}
         uids_dict = {}
         relation_sizes_dict = {}
+        opportunity_indexes_dict = {}
+        opportunity_weights_dict = {}
+        relation_counts = {}
         opportunity_types = list(heatmap_config.keys())
         opportunity_categories = {}
 
@@ -275,6 +296,9 @@ class ReadHeatmap(BaseHeatmap):
                 weight_dict[cat] = []
                 uids_dict[cat] = []
                 relation_sizes_dict[cat] = []
+                opportunity_indexes_dict[cat] = []
+                opportunity_weights_dict[cat] = []
+                relation_counts[cat] = 0
 
         for bulk_id in np.array(bulk_ids):
             for opportunity_type in opportunity_types:
@@ -307,13 +331,48 @@ class ReadHeatmap(BaseHeatmap):
                         os.path.join(base_path, "relation_size.npy"),
                         allow_pickle=True,
                     )
+                    try:
+                        opportunity_index = np.load(
+                            os.path.join(base_path, "opportunity_index.npy"),
+                            allow_pickle=True,
+                        )
+                        opportunity_weight = np.load(
+                            os.path.join(base_path, "opportunity_weight.npy"),
+                            allow_pickle=True,
+                        )
+                    except FileNotFoundError:
+                        # Matrices without aggregates have the relations of every opportunity
+                        opportunity_index = opportunity_weight = None
                     for cat in opportunity_categories[opportunity_type]:
                         selected_category_index = np.in1d(categories, np.array([cat]))
+                        if not selected_category_index.any():
+                            continue
                         travel_times_dict[cat].extend(travel_times[selected_category_index])
                         grid_ids_dict[cat].extend(grid_ids[selected_category_index])
                         weight_dict[cat].extend(weight[selected_category_index])
                         uids_dict[cat].extend(uid[selected_category_index])
                         relation_sizes_dict[cat].extend(relation_size[selected_category_index])
+                        n_relations = sum(
+                            len(sizes) for sizes in relation_size[selected_category_index]
+                        )
+                        if opportunity_index is None:
+                            opportunity_indexes_dict[cat].append(
+                                np.arange(n_relations) + relation_counts[cat]
+                            )
+                            opportunity_weights_dict[cat].append(np.ones(n_relations))
+                        else:
+                            opportunity_indexes_dict[cat].append(
+                                np.concatenate(
+                                    opportunity_index[selected_category_index], axis=None
+                                ).astype(np.int64)
+                                + relation_counts[cat]
+                            )
+                            opportunity_weights_dict[cat].append(
+                                np.concatenate(
+                                    opportunity_weight[selected_category_index], axis=None
+                                ).astype(np.float64)
+                            )
+                        relation_counts[cat] += n_relations
 
                 except FileNotFoundError:
                     print(base_path)
@@ -338,6 +397,8 @@ class ReadHeatmap(BaseHeatmap):
                     relation_sizes_dict[cat] = np.concatenate(
                         np.concatenate(relation_sizes_dict[cat], axis=None), axis=None
                     )
+                    opportunity_indexes_dict[cat] = np.concatenate(opportunity_indexes_dict[cat])
+                    opportunity_weights_dict[cat] = np.concatenate(opportunity_weights_dict[cat])
                 except Exception as e:
                     failed_categories.append(cat)
             else:
@@ -346,6 +407,8 @@ class ReadHeatmap(BaseHeatmap):
                 weight_dict[cat] = np.array([], np.float64)
                 uids_dict[cat] = np.array([], np.str_)
                 relation_sizes_dict[cat] = np.array([], np.int64)
+                opportunity_indexes_dict[cat] = np.array([], np.int64)
+                opportunity_weights_dict[cat] = np.array([], np.float64)
 
         # remove failed categories: #todo: fix this in the opportunity matrix creation
         for cat in failed_categories:
@@ -354,16 +417,44 @@ class ReadHeatmap(BaseHeatmap):
             uids_dict[cat] = np.array([], np.str_)
             relation_sizes_dict[cat] = np.array([], np.int64)
             grid_ids_dict[cat] = np.array([], np.int64)
+            opportunity_indexes_dict[cat] = np.array([], np.int64)
+            opportunity_weights_dict[cat] = np.array([], np.float64)
+
+        return (
+            grid_ids_dict,
+            travel_times_dict,
+            weight_dict,
+            uids_dict,
+            relation_sizes_dict,
+            opportunity_indexes_dict,
+            opportunity_weights_dict,
+        )
 
-        return grid_ids_dict, travel_times_dict, weight_dict, uids_dict, relation_sizes_dict
+    def get_relation_counts(self, relation_sizes: dict, opportunity_indexes: dict) -> dict:
+        """
+        Number of opportunities behind every relation of the opportunity matrix
+
+        :param relation_sizes: Dictionary with the size of every relation block per category
+        :param opportunity_indexes: Dictionary with the relation block of every opportunity per category
+
+        :return: Dictionary with the number of opportunities of every relation per category
+        """
+        counts = {}
+        for category, sizes in relation_sizes.items():
+            opportunities = np.bincount(opportunity_indexes[category], minlength=len(sizes))
+            counts[category] = np.repeat(opportunities, sizes).astype(np.float64)
+        return counts
 
     def prepare_result_scenario(
         self,
         heatmap_settings: HeatmapSettings,
         uids: dict,
         relation_sizes: dict,
+        opportunity_indexes: dict,
+        opportunity_weights: dict,
         traveltimes: dict,
         weights: dict,
+        counts: dict,
         grid_ids: dict,
         grid_array,
     ):
@@ -378,10 +469,16 @@ class ReadHeatmap(BaseHeatmap):
             Dictionary with opportunity categories as keys and numpy arrays with uids as values
         relation_sizes : dict
             Dictionary with opportunity categories as keys and numpy arrays with relation sizes as values
+        opportunity_indexes : dict
+            Dictionary with opportunity categories as keys and numpy arrays with the relation block of every uid as values
+        opportunity_weights : dict
+            Dictionary with opportunity categories as keys and numpy arrays with the weight of every uid as values
         traveltimes : dict
             Dictionary with opportunity categories as keys and numpy arrays with travel times as values
         weights : dict
             Dictionary with opportunity categories as keys and numpy arrays with weights as values
+        counts : dict
+            Dictionary with opportunity categories as keys and numpy arrays with opportunity counts as values
         grid_ids : dict
 
         Returns
@@ -424,11 +521,16 @@ class ReadHeatmap(BaseHeatmap):
                 weights_scenario,
                 uids_scenario,
                 relation_sizes_scenario,
+                opportunity_indexes_scenario,
+                opportunity_weights_scenario,
             ) = self.read_opportunity_matrix(
                 matrix_base_path=scenario_matrix_base_path,
                 bulk_ids=bulk_ids,
                 heatmap_config=heatmap_settings_scenario.heatmap_config,
             )
+            counts_scenario = self.get_relation_counts(
+                relation_sizes_scenario, opportunity_indexes_scenario
+            )
 
         uids_to_exclude = opportunities_modified.loc[
             opportunities_modified["edit_type"] != "n", "uid"
@@ -445,6 +547,7 @@ class ReadHeatmap(BaseHeatmap):
             "grid_ids": {},
             "traveltimes": {},
             "weights": {},
+            "counts": {},
             "relation_sizes": {},
         }
 
@@ -452,6 +555,7 @@ class ReadHeatmap(BaseHeatmap):
             diff_data["grid_ids"][category] = []
             diff_data["traveltimes"][category] = []
             diff_data["weights"][category] = []
+            diff_data["counts"][category] = []
             diff_data["relation_sizes"][category] = []
 
         uid_keys = list(uids.keys())
@@ -463,20 +567,33 @@ class ReadHeatmap(BaseHeatmap):
             indexes_diff = np.intersect1d(uids_in_category, uids_to_exclude, return_indices=True)[
                 1
             ]
-            values_to_exclude = []
-            for index_diff in indexes_diff:
-                slice_start = relation_sizes[category][:index_diff].sum()
-                slice_end = slice_start + relation_sizes[category][index_diff]
-                values_to_exclude.extend(np.arange(slice_start, slice_end))
-
-            travel_times_filtered = np.delete(traveltimes[category], values_to_exclude)
-            grid_ids_filtered = np.delete(grid_ids[category], values_to_exclude)
-            weights_filtered = np.delete(weights[category], values_to_exclude)
-            relation_sizes_filtered = np.delete(relation_sizes[category], indexes_diff)
+            # Relation blocks are removed when all of their opportunities are excluded, otherwise
+            # the weights of the excluded opportunities are subtracted from the aggregate
+            n_blocks = len(relation_sizes[category])
+            block_counts = np.bincount(opportunity_indexes[category], minlength=n_blocks)
+            excluded_blocks = opportunity_indexes[category][indexes_diff]
+            excluded_counts = np.bincount(excluded_blocks, minlength=n_blocks)
+            excluded_weights = np.bincount(
+                excluded_blocks,
+                weights=opportunity_weights[category][indexes_diff],
+                minlength=n_blocks,
+            )
+            blocks_to_exclude = excluded_counts == block_counts
+            relation_blocks = np.repeat(np.arange(n_blocks), relation_sizes[category])
+            values_to_keep = ~blocks_to_exclude[relation_blocks]
+
+            travel_times_filtered = traveltimes[category][values_to_keep]
+            grid_ids_filtered = grid_ids[category][values_to_keep]
+            weights_filtered = (weights[category] - excluded_weights[relation_blocks])[
+                values_to_keep
+            ]
+            counts_filtered = (counts[category] - excluded_counts[relation_blocks])[values_to_keep]
+            relation_sizes_filtered = relation_sizes[category][~blocks_to_exclude]
 
             diff_data["grid_ids"][category].extend(grid_ids_filtered)
             diff_data["traveltimes"][category].extend(travel_times_filtered)
             diff_data["weights"][category].extend(weights_filtered)
+            diff_data["counts"][category].extend(counts_filtered)
             diff_data["relation_sizes"][category].extend(relation_sizes_filtered)
 
         if not not_deleted_features.empty:
@@ -488,11 +605,13 @@ class ReadHeatmap(BaseHeatmap):
                     diff_data["grid_ids"][category].extend(grid_ids[category])
                     diff_data["traveltimes"][category].extend(traveltimes[category])
                     diff_data["weights"][category].extend(weights[category])
+                    diff_data["counts"][category].extend(counts[category])
                     diff_data["relation_sizes"][category].extend(relation_sizes[category])
 
                 diff_data["grid_ids"][category].extend(grid_ids_scenario[category])
                 diff_data["traveltimes"][category].extend(traveltimes_scenario[category])
                 diff_data["weights"][category].extend(weights_scenario[category])
+                diff_data["counts"][category].extend(counts_scenario[category])
                 diff_data["relation_sizes"][category].extend(relation_sizes_scenario[category])
 
         for category in diff_data["grid_ids"].keys():
@@ -501,6 +620,7 @@ class ReadHeatmap(BaseHeatmap):
                 diff_data["traveltimes"][category], np.int8
             )
             diff_data["weights"][category] = np.array(diff_data["weights"][category], np.float64)
+            diff_data["counts"][category] = np.array(diff_data["counts"][category], np.float64)
             diff_data["relation_sizes"][category] = np.array(
                 diff_data["relation_sizes"][category], np.int64
             )
@@ -511,6 +631,7 @@ class ReadHeatmap(BaseHeatmap):
             grid_array=grid_array,
             traveltimes=diff_data["traveltimes"],
             weights=diff_data["weights"],
+            counts=diff_data["counts"],
         )
 
         return calculations
@@ -522,8 +643,10 @@ class ReadHeatmap(BaseHeatmap):
         heatmap_settings,
         traveltimes,
         weights,
+        counts,
     ):
         grid_ids = self.convert_grid_ids_to_parent(grids, heatmap_settings.resolution)
+        weights = self.get_calculation_weights(weights, counts, heatmap_settings)
         travel_times_sorted, weights_sorted, uniques = self.sort_and_unique(
             grid_ids, traveltimes, weights
         )
@@ -533,6 +656,18 @@ class ReadHeatmap(BaseHeatmap):
         calculations = self.reorder_calculations(calculations, grid_array, uniques)
         return calculations
 
+    def get_calculation_weights(self, weights: dict, counts: dict, heatmap_settings):
+        """
+        Weights of the relations for the heatmap method. The weights of aggregated point
+        opportunities are summed, the cumulative heatmap counts the opportunities behind a relation
+        and the closest average uses the mean weight of them.
+        """
+        if heatmap_settings.heatmap_type == HeatmapType.cumulative:
+            return counts
+        if heatmap_settings.heatmap_type == HeatmapType.closest_average:
+            return {category: weights[category] / counts[category] for category in weights}
+        return weights
+
     def read_connectivity_heatmaps_sorted(
         self, bulk_ids: np.ndarray, heatmap_settings: HeatmapSettings, profile: str
     ) -> dict:
@@ -631,7 +766,6 @@ class ReadHeatmap(BaseHeatmap):
             "modified_gaussian": "modified_gaussian_per_grid",
             "combined_cumulative_modified_gaussian": "combined_modified_gaussian_per_grid",
             "connectivity": "connectivity",
-            "cumulative": "counts",
             "closest_average": "mins",
         }
         output = {}
@@ -662,6 +796,15 @@ class ReadHeatmap(BaseHeatmap):
                         heatmap_config["static_traveltime"],
                         weights_sorted[category],
                     )
+        elif heatmap_settings.heatmap_type.value == "cumulative":
+            # The weights are the number of opportunities of every relation
+            for opportunity_type in heatmap_settings.heatmap_config.keys():
+                categories = heatmap_settings.heatmap_config[opportunity_type]
+                for category in categories:
+                    output[category] = heatmap_cython.sums(
+                        weights_sorted[category], uniques[category]
+                    )
+
         else:
             method_name = method_map[heatmap_settings.heatmap_type.value]
             method = getattr(heatmap_core, method_name)
@@ -1,83 +1,98 @@
 import asyncio
 import heapq
 import math
-import time
+from collections import namedtuple
+from itertools import chain
 from multiprocessing import Pool
-from time import time
 
 import numpy as np
-from numba import njit
-from numba.core import types
+import shapely
+from numba import get_num_threads, njit, prange
 from numba.pycc import CC
-from numba.typed import Dict, List
-from scipy import spatial
+from scipy import ndimage
+
+from src.core.config import settings
 
 from src.utils import (
     coordinate_to_pixel,
+    pixel_x_to_web_mercator_x,
+    pixel_y_to_web_mercator_y,
     web_mercator_x_to_pixel_x,
     web_mercator_y_to_pixel_y,
 )
 
 
-@njit(cache=True)
-def construct_adjacency_list_(n, edge_source, edge_target, edge_cost, edge_reverse_cost):
+AdjacencyCSR = namedtuple("AdjacencyCSR", ["offsets", "targets", "costs"])
+ReachedNodes = namedtuple("ReachedNodes", ["offsets", "nodes", "costs"])
+NodeEdges = namedtuple("NodeEdges", ["offsets", "edges"])
+DialBuffers = namedtuple(
+    "DialBuffers",
+    ["distances", "touched", "touched_count", "bucket_head", "node_next", "node_prev", "node_bucket"],
+)
+
+# Bucket width of the bucket queue in minutes (one second)
+DIAL_BUCKET_WIDTH = 1.0 / 60.0
+
+
+def construct_csr_graph_(n, edge_source, edge_target, edge_cost, edge_reverse_cost):
     """
-    Construct adjacency list from edges
+    Construct a compressed sparse row (CSR) graph from edges
     :param n: Number of nodes
-    :param edge_source: List of edge source nodes
-    :param edge_target: List of edge target nodes
-    :param edge_cost: List of edge costs
-    :param edge_reverse_cost: List of edge reverse costs
-    :return: Adjacency list
-    """
-    adj_list = List([List([List([-1.001, -1.001])])] * n)
-    for i in range(len(edge_source)):
-        if edge_cost[i] >= 0.0:
-            if adj_list[edge_source[i]][0][0] == -1.001:
-                adj_list[edge_source[i]] = List([List([edge_target[i], edge_cost[i]])])
-            else:
-                adj_list[edge_source[i]].append(List([edge_target[i], edge_cost[i]]))
-        if edge_reverse_cost[i] >= 0.0:
-            if adj_list[edge_target[i]][0][0] == -1.001:
-                adj_list[edge_target[i]] = List([List([edge_source[i], edge_reverse_cost[i]])])
-            else:
-                adj_list[edge_target[i]].append(List([edge_source[i], edge_reverse_cost[i]]))
-    return adj_list
+    :param edge_source: Array of edge source nodes
+    :param edge_target: Array of edge target nodes
+    :param edge_cost: Array of edge costs (seconds)
+    :param edge_reverse_cost: Array of edge reverse costs (seconds)
+    :return: AdjacencyCSR with the outgoing arcs of node i in targets/costs[offsets[i]:offsets[i + 1]], costs in minutes
+    """
+    # Interleave forward and reverse arcs per edge, negative costs mark a closed direction
+    arc_source = np.column_stack((edge_source, edge_target)).ravel()
+    arc_target = np.column_stack((edge_target, edge_source)).ravel()
+    arc_cost = np.column_stack((edge_cost, edge_reverse_cost)).ravel()
+    valid = arc_cost >= 0.0
+    arc_source = arc_source[valid].astype(np.int64)
+    arc_target = arc_target[valid].astype(np.int64)
+    arc_cost = arc_cost[valid].astype(np.double) / 60.0  # convert cost to minutes
+
+    order = np.argsort(arc_source, kind="stable")
+    offsets = np.zeros(n + 1, np.int64)
+    np.cumsum(np.bincount(arc_source, minlength=n), out=offsets[1:])
+    return AdjacencyCSR(offsets, arc_target[order], arc_cost[order])
 
 
 @njit(cache=True)
-def dijkstra(start_vertices, adj_list, travel_time):
+def dijkstra(start_vertices, graph, travel_time):
     """
     Dijkstra's algorithm one-to-all shortest path search
     :param start_vertices: List of start vertices
-    :param adj_list: Adjacency list
-    :param travel_time: Travel time matrix
-    :return: List of shortest paths and costs
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :return: Array of shortest path costs for every node
     """
-    n = len(adj_list)
-    # distances = [np.Inf for _ in range(n)]
-    distances = np.full(n, np.Inf, np.double)
+    offsets = graph.offsets
+    targets = graph.targets
+    costs = graph.costs
+    n = len(offsets) - 1
+    distances = np.full(n, np.inf, np.double)
     # loop over all start vertices
     for start_vertex in start_vertices:
         distances[start_vertex] = 0.0
-        # visited = [False for _ in range(n)]
-        visited = np.full(n, False, np.bool8)
+        visited = np.full(n, False, np.bool_)
         # set up priority queue
         pq = [(0.0, start_vertex)]
         while len(pq) > 0:
             if pq[0][0] >= travel_time:
                 break
-            # get the root, discard current distance (!!!distances in the data are in seconds)
+            # get the root, discard current distance
             _, u = heapq.heappop(pq)
             # if the node is visited, skip
             if visited[u]:
                 continue
             # set the node to visited
             visited[u] = True
-            # check the distance and node and distance
-            for v, l in adj_list[u]:
-                v = int(v)
-                l = l / 60.0  # convert cost to minutes
+            # check the outgoing arcs of the node
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                l = costs[i]
                 # if the current node's distance + distance to the node we're visiting
                 # is less than the distance of the node we're visiting on file
                 # replace that distance and push the node we're visiting into the priority queue
@@ -87,6 +102,361 @@ def dijkstra(start_vertices, adj_list, travel_time):
     return distances
 
 
+@njit(cache=True)
+def create_dial_buffers(n, travel_time):
+    """
+    Allocate the buffers of the bucket queue search, they can be reused for every search on the same graph
+    :param n: Number of nodes
+    :param travel_time: Travel time limit in minutes
+    :return: DialBuffers
+    """
+    return DialBuffers(
+        np.full(n, np.inf, np.double),
+        np.empty(n, np.int64),
+        np.zeros(1, np.int64),
+        np.full(int(travel_time / DIAL_BUCKET_WIDTH) + 2, -1, np.int64),
+        np.empty(n, np.int64),
+        np.empty(n, np.int64),
+        np.full(n, -1, np.int64),
+    )
+
+
+@njit(cache=True)
+def dial_insert_(buffers, v, bucket):
+    head = buffers.bucket_head[bucket]
+    buffers.node_prev[v] = -1
+    buffers.node_next[v] = head
+    if head != -1:
+        buffers.node_prev[head] = v
+    buffers.bucket_head[bucket] = v
+    buffers.node_bucket[v] = bucket
+
+
+@njit(cache=True)
+def dial_remove_(buffers, v):
+    prev = buffers.node_prev[v]
+    next = buffers.node_next[v]
+    if prev != -1:
+        buffers.node_next[prev] = next
+    else:
+        buffers.bucket_head[buffers.node_bucket[v]] = next
+    if next != -1:
+        buffers.node_prev[next] = prev
+    buffers.node_bucket[v] = -1
+
+
+@njit(cache=True)
+def dial_dijkstra(start_vertices, graph, travel_time, buffers):
+    """
+    Bounded one-to-all shortest path search with a bucket queue (Dial's algorithm)
+
+    Nodes are kept in buckets of DIAL_BUCKET_WIDTH minutes. The order inside a bucket is arbitrary,
+    a node that improves after it was expanded is expanded again, so the distances are exact.
+    :param start_vertices: List of start vertices
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :param buffers: DialBuffers from create_dial_buffers, reset and reused by every call
+    :return: Array of shortest path costs for every node, a view on the buffers valid until the next call
+    """
+    offsets = graph.offsets
+    targets = graph.targets
+    costs = graph.costs
+    distances = buffers.distances
+    touched = buffers.touched
+    n_buckets = len(buffers.bucket_head)
+
+    # reset the nodes reached by the previous search
+    for i in range(buffers.touched_count[0]):
+        distances[touched[i]] = np.inf
+    touched_count = 0
+
+    for start_vertex in start_vertices:
+        if distances[start_vertex] == np.inf:
+            touched[touched_count] = start_vertex
+            touched_count += 1
+        elif distances[start_vertex] == 0.0:
+            continue
+        distances[start_vertex] = 0.0
+        dial_insert_(buffers, start_vertex, 0)
+
+    for bucket in range(n_buckets):
+        # nodes can be added to the current bucket while it is processed
+        while buffers.bucket_head[bucket] != -1:
+            u = buffers.bucket_head[bucket]
+            dial_remove_(buffers, u)
+            if distances[u] >= travel_time:
+                continue
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                cost = distances[u] + costs[i]
+                if cost < distances[v]:
+                    if distances[v] == np.inf:
+                        touched[touched_count] = v
+                        touched_count += 1
+                    distances[v] = cost
+                    if buffers.node_bucket[v] != -1:
+                        dial_remove_(buffers, v)
+                    if cost < travel_time:
+                        dial_insert_(buffers, v, min(int(cost / DIAL_BUCKET_WIDTH), n_buckets - 1))
+
+    buffers.touched_count[0] = touched_count
+    return distances
+
+
+@njit(parallel=True, cache=True)
+def dijkstra_chunk_(start_vertices, graph, travel_time, use_buckets):
+    """
+    Run one search per start vertex in parallel and compact the reached nodes
+    :param start_vertices: Array of start vertices (one search each)
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :param use_buckets: Use the bucket queue search instead of the heap
+    :return: Offsets, reached nodes and costs, the nodes of start i are in nodes[offsets[i]:offsets[i + 1]]
+    """
+    n = len(graph.offsets) - 1
+    k = len(start_vertices)
+    distances = np.empty((k, n), np.double)
+    counts = np.zeros(k, np.int64)
+    # every group runs its searches one after the other and reuses its buffers
+    n_groups = min(k, get_num_threads())
+    for group in prange(n_groups):
+        buffers = create_dial_buffers(n if use_buckets else 0, travel_time)
+        for i in range(group, k, n_groups):
+            if use_buckets:
+                distances[i] = dial_dijkstra(start_vertices[i : i + 1], graph, travel_time, buffers)
+            else:
+                distances[i] = dijkstra(start_vertices[i : i + 1], graph, travel_time)
+            counts[i] = np.sum(np.isfinite(distances[i]))
+
+    offsets = np.zeros(k + 1, np.int64)
+    offsets[1:] = np.cumsum(counts)
+    nodes = np.empty(offsets[-1], np.int64)
+    node_costs = np.empty(offsets[-1], np.double)
+    for i in prange(k):
+        pointer = offsets[i]
+        for v in range(n):
+            if distances[i, v] != np.inf:
+                nodes[pointer] = v
+                node_costs[pointer] = distances[i, v]
+                pointer += 1
+    return offsets, nodes, node_costs
+
+
+def dijkstra_many(
+    start_vertices, graph, travel_time, chunk_size: int = None, algorithm: str = "heap"
+):
+    """
+    One-to-all searches for many start vertices, run across all cores
+    :param start_vertices: Array of start vertices (one search each)
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :param chunk_size: Number of searches that hold a dense distance row at the same time,
+        by default as many rows as fit into ROUTING_SEARCH_CHUNK_MEMORY
+    :param algorithm: Shortest path search, "heap" (dijkstra) or "dial" (dial_dijkstra)
+    :return: ReachedNodes of the unique start vertices and the index into them for every start vertex
+    """
+    if chunk_size is None:
+        n_nodes = len(graph.offsets) - 1
+        chunk_size = max(1, settings.ROUTING_SEARCH_CHUNK_MEMORY // (max(n_nodes, 1) * 8))
+    # Start vertices that snapped to the same node share one search
+    unique_starts, inverse = np.unique(np.asarray(start_vertices, np.int64), return_inverse=True)
+    offsets = [np.zeros(1, np.int64)]
+    nodes = []
+    costs = []
+    for chunk_start in range(0, len(unique_starts), chunk_size):
+        chunk_offsets, chunk_nodes, chunk_costs = dijkstra_chunk_(
+            unique_starts[chunk_start : chunk_start + chunk_size],
+            graph,
+            travel_time,
+            algorithm == "dial",
+        )
+        offsets.append(chunk_offsets[1:] + offsets[-1][-1])
+        nodes.append(chunk_nodes)
+        costs.append(chunk_costs)
+    reached = ReachedNodes(
+        np.concatenate(offsets),
+        np.concatenate(nodes) if nodes else np.empty(0, np.int64),
+        np.concatenate(costs) if costs else np.empty(0, np.double),
+    )
+    return reached, inverse
+
+
+@njit(cache=True)
+def dijkstra_targets_(start_vertex, graph, travel_time, is_target, n_targets, distances, visited, touched):
+    """
+    Dijkstra's algorithm that stops once all targets are settled or the travel time is reached
+    :param start_vertex: Start vertex
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :param is_target: Mask of the target vertices
+    :param n_targets: Number of target vertices
+    :param distances: Buffer of the costs, inf for all vertices (the settled costs are written to it)
+    :param visited: Buffer of the settled vertices, False for all vertices
+    :param touched: Buffer of the vertices with a cost, to reset the buffers
+    :return: Number of touched vertices
+    """
+    offsets = graph.offsets
+    targets = graph.targets
+    costs = graph.costs
+    distances[start_vertex] = 0.0
+    touched[0] = start_vertex
+    touched_count = 1
+    settled_targets = 0
+    pq = [(0.0, start_vertex)]
+    while len(pq) > 0 and settled_targets < n_targets:
+        if pq[0][0] >= travel_time:
+            break
+        _, u = heapq.heappop(pq)
+        if visited[u]:
+            continue
+        visited[u] = True
+        if is_target[u]:
+            settled_targets += 1
+        for i in range(offsets[u], offsets[u + 1]):
+            v = targets[i]
+            cost = distances[u] + costs[i]
+            if cost < distances[v]:
+                if distances[v] == np.inf:
+                    touched[touched_count] = v
+                    touched_count += 1
+                distances[v] = cost
+                heapq.heappush(pq, (cost, v))
+    return touched_count
+
+
+@njit(parallel=True, cache=True)
+def od_matrix_(origin_vertices, destination_vertices, graph, travel_time):
+    """
+    Travel times from every origin to every destination, one early stopping search per origin
+    :param origin_vertices: Array of origin vertices
+    :param destination_vertices: Array of destination vertices
+    :param graph: AdjacencyCSR graph (costs in minutes)
+    :param travel_time: Travel time limit in minutes
+    :return: Matrix of the travel times in minutes (origins x destinations, inf if not reached)
+    """
+    n = len(graph.offsets) - 1
+    k = len(origin_vertices)
+    m = len(destination_vertices)
+    matrix = np.full((k, m), np.inf, np.float32)
+    is_target = np.zeros(n, np.bool_)
+    is_target[destination_vertices] = True
+    n_targets = np.sum(is_target)
+    # every group runs its searches one after the other and reuses its buffers
+    n_groups = min(k, get_num_threads())
+    for group in prange(n_groups):
+        distances = np.full(n, np.inf, np.double)
+        visited = np.zeros(n, np.bool_)
+        touched = np.empty(n, np.int64)
+        for i in range(group, k, n_groups):
+            touched_count = dijkstra_targets_(
+                origin_vertices[i], graph, travel_time, is_target, n_targets, distances, visited, touched
+            )
+            for j in range(m):
+                if visited[destination_vertices[j]]:
+                    matrix[i, j] = distances[destination_vertices[j]]
+            for t in range(touched_count):
+                distances[touched[t]] = np.inf
+                visited[touched[t]] = False
+    return matrix
+
+
+def compute_od_matrix(edge_network_input, origin_ids, destination_ids, travel_time):
+    """
+    Compute the travel times between two sets of vertices
+
+    :param edge_network_input: Edge Network DataFrame or PreparedNetwork
+    :param origin_ids: Node ids of the origins (-1 or ids outside of the network are not reached)
+    :param destination_ids: Node ids of the destinations (-1 or ids outside of the network are not reached)
+    :param travel_time: Travel time limit in minutes
+    :return: Matrix of the travel times in minutes (origins x destinations, inf if not reached)
+    """
+    if isinstance(edge_network_input, PreparedNetwork):
+        network = edge_network_input
+    else:
+        network = prepare_network_isochrone(edge_network_input=edge_network_input)
+
+    origins, valid_origins = network.get_node_index(origin_ids)
+    destinations, valid_destinations = network.get_node_index(destination_ids)
+    # Origins that snapped to the same node share one search
+    unique_origins, inverse = np.unique(origins[valid_origins], return_inverse=True)
+    matrix = np.full((len(origins), len(destinations)), np.inf, np.float32)
+    if len(unique_origins) > 0 and np.any(valid_destinations):
+        unique_matrix = od_matrix_(
+            unique_origins, destinations[valid_destinations], network.graph, travel_time
+        )
+        matrix[np.ix_(valid_origins, valid_destinations)] = unique_matrix[inverse]
+    return matrix
+
+
+def reached_to_distances(reached, index, n):
+    """
+    Expand the reached nodes of one search to a dense distance array
+    :param reached: ReachedNodes
+    :param index: Index of the search
+    :param n: Number of nodes
+    :return: Array of shortest path costs for every node
+    """
+    distances = np.full(n, np.inf, np.double)
+    start, end = reached.offsets[index], reached.offsets[index + 1]
+    distances[reached.nodes[start:end]] = reached.costs[start:end]
+    return distances
+
+
+def construct_node_edges_(n, edge_source, edge_target):
+    """
+    Index of the edges incident to every node
+    :param n: Number of nodes
+    :param edge_source: Array of edge source nodes
+    :param edge_target: Array of edge target nodes
+    :return: NodeEdges with the edges of node i in edges[offsets[i]:offsets[i + 1]]
+    """
+    nodes = np.concatenate((edge_source, edge_target)).astype(np.int64)
+    edges = np.tile(np.arange(len(edge_source), dtype=np.int64), 2)
+    order = np.argsort(nodes, kind="stable")
+    offsets = np.zeros(n + 1, np.int64)
+    np.cumsum(np.bincount(nodes, minlength=n), out=offsets[1:])
+    return NodeEdges(offsets, edges[order])
+
+
+@njit(cache=True)
+def get_reached_edges_(reached_nodes, node_edges):
+    """
+    Edges with a reached source or target node
+    :param reached_nodes: Array of nodes with a finite cost
+    :param node_edges: NodeEdges index
+    :return: Sorted array of the reached edge indices
+    """
+    count = 0
+    for v in reached_nodes:
+        count += node_edges.offsets[v + 1] - node_edges.offsets[v]
+    edges = np.empty(count, np.int64)
+    pointer = 0
+    for v in reached_nodes:
+        for i in range(node_edges.offsets[v], node_edges.offsets[v + 1]):
+            edges[pointer] = node_edges.edges[i]
+            pointer += 1
+    return np.unique(edges)
+
+
+@njit(cache=True)
+def get_reached_extent_(reached_edges, geom_address, geom_array):
+    """
+    Extent of the reached edges
+    :param reached_edges: Array of reached edge indices
+    :param geom_address: Start of every edge geometry in geom_array
+    :param geom_array: Coordinates of all edge geometries
+    :return: Extent [min_x, min_y, max_x, max_y]
+    """
+    extent = np.array([np.inf, np.inf, -np.inf, -np.inf])
+    for i in reached_edges:
+        for j in range(geom_address[i], geom_address[i + 1]):
+            extent[0] = min(extent[0], geom_array[j, 0])
+            extent[1] = min(extent[1], geom_array[j, 1])
+            extent[2] = max(extent[2], geom_array[j, 0])
+            extent[3] = max(extent[3], geom_array[j, 1])
+    return extent
+
+
 @njit(cache=True)
 def array_equals(vertex, array):
     pointer = 0
@@ -112,38 +482,6 @@ def get_adj_count(edge_source, edge_target):
     return len(unique)
 
 
-@njit(cache=True)
-def filter_nodes(node_coords_list, node_costs_list, zoom, width, west, north):
-    """
-    Filter out nodes that fall inside the same pixel (keep the one with the lowest cost)
-    :param node_coords_list: List of node coordinates
-    :param node_costs_list: List of node costs
-    :param zoom: Zoom level
-    :param width: Width of the grid
-    :param west: West coordinate of the grid
-    :param north: North coordinate of the grid
-    :return: List of filtered nodes and costs
-    """
-    index_cost = {}
-    for idx, node_coord in enumerate(node_coords_list):
-        node_coord_pixel = [
-            round(web_mercator_x_to_pixel_x(node_coord[0], zoom)),
-            round(web_mercator_y_to_pixel_y(node_coord[1], zoom)),
-        ]
-        pixel_x = node_coord_pixel[0]
-        pixel_y = node_coord_pixel[1]
-        x = pixel_x - west
-        y = pixel_y - north
-        index = y * width + x
-        if node_costs_list[idx] != np.inf and (
-            index not in index_cost or node_costs_list[idx] < index_cost[index]
-        ):
-            index_cost[index] = idx
-    node_coords_list = [node_coords_list[idx] for idx in index_cost.values()]
-    node_costs_list = [node_costs_list[idx] for idx in index_cost.values()]
-    return node_coords_list, node_costs_list
-
-
 def check_extent(extent, coord):
     """
     Check and update extent
@@ -164,120 +502,106 @@ def check_extent(extent, coord):
 
 
 def get_extent(geom_array):
-    extent = np.empty((2, 2), np.double)  # [min_x, min_y, max_x, max_y]
-    geom_array.min(0, extent[0])
-    geom_array.max(0, extent[1])
-    return extent.flat
+    # [min_x, min_y, max_x, max_y]
+    return np.concatenate((geom_array.min(0), geom_array.max(0)))
 
 
 @njit(cache=True)
-def remap_edges(edge_source, edge_target, geom_address, geom_array):
+def write_min_cost_(grid_costs, grid_coords, x, y, cost, zoom, west, north):
     """
-    Remap edges to start from 0
-    :param edge_source: List of source nodes
-    :param edge_target: List of target nodes
-    :param edge_geom: List of edge geometries
+    Write the cost of a point into its pixel if it is lower than the current one
     """
-    unordered_map = Dict.empty(
-        key_type=types.int64,
-        value_type=types.int64,
-    )
-    node_coords = np.empty((len(edge_source), 2), np.double)
-    id = 0
-    for i in range(len(edge_source)):
-        edge_geom = geom_array[geom_address[i] : geom_address[i + 1], :]
-        # source
-        if unordered_map.get(edge_source[i]) is None:
-            unordered_map[edge_source[i]] = id
-            edge_source[i] = id
-            node_coords[id] = edge_geom[0]
-            id += 1
-        else:
-            edge_source[i] = unordered_map.get(edge_source[i])
-        # target
-        if unordered_map.get(edge_target[i]) is None:
-            unordered_map[edge_target[i]] = id
-            edge_target[i] = id
-            node_coords[id] = edge_geom[-1]
-            id += 1
-        else:
-            edge_target[i] = unordered_map.get(edge_target[i])
-    return unordered_map, node_coords[: len(unordered_map)]
+    pixel_x = int(round(web_mercator_x_to_pixel_x(x, zoom))) - west
+    pixel_y = int(round(web_mercator_y_to_pixel_y(y, zoom))) - north
+    if 0 <= pixel_y < grid_costs.shape[0] and 0 <= pixel_x < grid_costs.shape[1]:
+        if cost < grid_costs[pixel_y, pixel_x]:
+            grid_costs[pixel_y, pixel_x] = cost
+            grid_coords[pixel_y, pixel_x, 0] = x
+            grid_coords[pixel_y, pixel_x, 1] = y
 
 
 @njit(cache=True)
-def estimate_split_edges_size(edge_length, geom_array, split_distance):
-    full_edge_length = np.sum(edge_length)
-    number_of_geoms = len(geom_array) - 2 * len(edge_length)
-    minimum_size = full_edge_length / split_distance + 1
-    maximum_size = minimum_size + number_of_geoms
-    return int(maximum_size)
-
-
-@njit(cache=True)
-def split_edges(
-    edge_source, edge_target, edge_length, geom_address, geom_array, agg_costs, split_distance
+def rasterize_network_(
+    edge_source,
+    edge_target,
+    edge_length,
+    geom_address,
+    geom_array,
+    agg_costs,
+    reached_edges,
+    node_coords,
+    split_distance,
+    zoom,
+    west,
+    north,
+    width,
+    height,
 ):
     """
-    Split edges into multiple edges
+    Rasterize the reached network, every pixel keeps the lowest cost of the nodes and of the points
+    interpolated along the edges every split_distance
     :param edge_source: List of source nodes
     :param edge_target: List of target nodes
     :param edge_length: List of edge lengths
-    :param edge_geom: List of edge geometries
+    :param geom_address: Start of every edge geometry in geom_array
+    :param geom_array: Coordinates of all edge geometries
     :param agg_costs: List of aggregated costs from dijkstra algorithm
-    :param split_distance: Distance to split edges in meters
-    :return: List of interpolated coordinates and costs along the line every x meters, including vertices
-    """
-    # start_time = time()
-    est_size = estimate_split_edges_size(edge_length, geom_array, split_distance)
-    coords = np.empty((est_size, 2), np.double)
-    costs = np.empty(est_size, np.double)
-
-    counter = -1
-    for i in range(len(edge_source)):
-        source_id = edge_source[i]
-        target_id = edge_target[i]
-        source_cost = agg_costs[source_id]
-        target_cost = agg_costs[target_id]
+    :param reached_edges: Array of reached edge indices, only these are rasterized
+    :param node_coords: Coordinates of the nodes
+    :param split_distance: Distance to interpolate points along the edges in meters
+    :param zoom: Zoom level
+    :param west: West pixel coordinate of the grid
+    :param north: North pixel coordinate of the grid
+    :param width: Width of the grid
+    :param height: Height of the grid
+    :return: Grid of the lowest costs (inf if not reached) and grid of the coordinates they come from
+    """
+    grid_costs = np.full((height, width), np.inf, np.double)
+    grid_coords = np.empty((height, width, 2), np.double)
+
+    # every reached node is a source or target of a reached edge
+    for i in reached_edges:
+        for v in (edge_source[i], edge_target[i]):
+            if agg_costs[v] != np.inf:
+                write_min_cost_(
+                    grid_costs, grid_coords, node_coords[v, 0], node_coords[v, 1], agg_costs[v], zoom, west, north
+                )
+
+    for i in reached_edges:
+        source_cost = agg_costs[edge_source[i]]
+        target_cost = agg_costs[edge_target[i]]
         total_length = edge_length[i]
         geom = geom_array[geom_address[i] : geom_address[i + 1], :]
-        if np.inf not in [source_cost, target_cost]:
-            if total_length > split_distance or len(geom) > 2:
-                # split edge into multiple edges
-                previous_agg_dist = 0.0
-                for idx, coord in enumerate(geom[:-1]):
-                    # find distance between current and next point
-                    next_coord = geom[idx + 1]
-                    dist = math.sqrt(
-                        (coord[0] - next_coord[0]) ** 2 + ((coord[1] - next_coord[1])) ** 2
-                    )
-                    agg_dist = previous_agg_dist + dist
-
-                    n_splits = math.floor(dist / split_distance)
-                    for n in range(1, n_splits + 1):
-                        counter += 1
-                        distance_to_next = n * split_distance
-                        x = coord[0] - ((distance_to_next * (coord[0] - next_coord[0])) / dist)
-                        y = coord[1] - ((distance_to_next * (coord[1] - next_coord[1])) / dist)
-                        coords[counter] = [x, y]
-                        cost = source_cost + (
-                            (previous_agg_dist + distance_to_next) / total_length
-                        ) * (target_cost - source_cost)
-                        costs[counter] = cost
-                    # if next point is vertex, add it and update previous
-                    if idx + 1 <= len(geom) - 2:
-                        counter += 1
-                        coords[counter] = geom[idx + 1]
-                        cost = source_cost + (agg_dist / total_length) * (
-                            target_cost - source_cost
-                        )
-                        costs[counter] = cost
-                        previous_agg_dist = agg_dist
-
-    # print(f"estimated size: {est_size}, calculated size: {counter}")
-    if counter == -1:
-        counter = 0
-    return coords[:counter, :], costs[:counter]
+        if source_cost == np.inf or target_cost == np.inf:
+            continue
+        if total_length <= split_distance and len(geom) <= 2:
+            continue
+        previous_agg_dist = 0.0
+        for idx in range(len(geom) - 1):
+            # find distance between current and next point
+            coord = geom[idx]
+            next_coord = geom[idx + 1]
+            dist = math.sqrt((coord[0] - next_coord[0]) ** 2 + (coord[1] - next_coord[1]) ** 2)
+            agg_dist = previous_agg_dist + dist
+
+            n_splits = math.floor(dist / split_distance)
+            for n in range(1, n_splits + 1):
+                distance_to_next = n * split_distance
+                x = coord[0] - ((distance_to_next * (coord[0] - next_coord[0])) / dist)
+                y = coord[1] - ((distance_to_next * (coord[1] - next_coord[1])) / dist)
+                cost = source_cost + ((previous_agg_dist + distance_to_next) / total_length) * (
+                    target_cost - source_cost
+                )
+                write_min_cost_(grid_costs, grid_coords, x, y, cost, zoom, west, north)
+            # if next point is vertex, add it and update previous
+            if idx + 1 <= len(geom) - 2:
+                cost = source_cost + (agg_dist / total_length) * (target_cost - source_cost)
+                write_min_cost_(
+                    grid_costs, grid_coords, next_coord[0], next_coord[1], cost, zoom, west, north
+                )
+                previous_agg_dist = agg_dist
+
+    return grid_costs, grid_coords
 
 
 def get_single_depth_grid_(zoom, west, north, data):
@@ -305,102 +629,241 @@ def get_single_depth_grid_(zoom, west, north, data):
 
 
 def get_geom_array(edges_geom):
-    geom_count = np.empty(len(edges_geom) + 1, dtype=np.intc)
-    geom_count[0] = 0
-    address = 1
-    for geom in edges_geom:
-        geom_count[address] = len(geom)
-        address += 1
-
-    all_geom_count = np.sum(geom_count)
-    geom_array = np.empty([all_geom_count, 2], dtype=np.double)
-    address = 0
-    for geom in edges_geom:
-        for point in geom:
-            geom_array[address] = point
-            address += 1
-
-    geom_address = np.cumsum(geom_count)
+    """
+    Pack the edge geometries into one coordinate buffer
+    :param edges_geom: List of edge geometries (lists of coordinates)
+    :return: Start of every edge geometry in geom_array (plus the end) and the coordinate buffer
+    """
+    geom_count = np.fromiter(map(len, edges_geom), np.int64, len(edges_geom))
+    geom_address = np.zeros(len(edges_geom) + 1, np.int64)
+    np.cumsum(geom_count, out=geom_address[1:])
+    geom_array = np.array(list(chain.from_iterable(edges_geom)), np.double).reshape(-1, 2)
+    return geom_address, geom_array
+
 
+def get_geom_array_wkb(edges_wkb):
+    """
+    Pack WKB edge geometries into one coordinate buffer
+    :param edges_wkb: List of edge geometries as WKB (2D LineStrings)
+    :return: Start of every edge geometry in geom_array (plus the end) and the coordinate buffer
+    """
+    edges_wkb = [bytes(g) for g in edges_wkb]
+    wkb_size = np.fromiter(map(len, edges_wkb), np.int64, len(edges_wkb))
+    wkb_address = np.zeros(len(edges_wkb) + 1, np.int64)
+    np.cumsum(wkb_size, out=wkb_address[1:])
+    buffer = np.frombuffer(b"".join(edges_wkb), np.uint8)
+
+    # WKB LineString: byte order (1 byte), geometry type (4 bytes), number of points (4 bytes), points
+    headers = wkb_address[:-1, None] + np.arange(9)
+    header_bytes = buffer[headers]
+    little_endian_linestring = (header_bytes[:, 0] == 1) & np.all(
+        header_bytes[:, 1:5] == np.array([2, 0, 0, 0], np.uint8), axis=1
+    )
+    if not little_endian_linestring.all():
+        geoms = shapely.from_wkb(np.array(edges_wkb, dtype=object))
+        geom_array, index = shapely.get_coordinates(geoms, return_index=True)
+        geom_address = np.zeros(len(geoms) + 1, np.int64)
+        np.cumsum(np.bincount(index, minlength=len(geoms)), out=geom_address[1:])
+        return geom_address, geom_array
+
+    is_coordinate = np.ones(len(buffer), np.bool_)
+    is_coordinate[headers] = False
+    geom_array = buffer[is_coordinate].view("<f8").reshape(-1, 2).astype(np.double)
+    geom_address = (wkb_address - 9 * np.arange(len(edges_wkb) + 1)) // 16
     return geom_address, geom_array
 
 
-def build_grid_interpolate_(points, costs, extent, step_x, step_y, speed, max_traveltime):
+def fill_grid_distance_transform_(
+    grid_costs, grid_coords, zoom, west, north, speed, max_distance=200, max_traveltime=None
+):
     """
-    Build grid interpolate
-    :param points: List of points
-    :param costs: List of costs
-    :param extent: Extent of the grid
-    :param step_x: Step size in x direction
-    :param step_y: Step size in y direction
-    :return: Grid interpolate
+    Fill the pixels around the reached network with the walking time to the closest reached pixel
+    :param grid_costs: Grid of the network costs in minutes (inf if not reached)
+    :param grid_coords: Grid of the coordinates the network costs come from
+    :param zoom: Zoom level
+    :param west: West pixel coordinate of the grid
+    :param north: North pixel coordinate of the grid
+    :param speed: Speed in m/s
+    :param max_distance: Maximum distance to the network in meters
+    :param max_traveltime: Travel time limit in minutes, pixels beyond it are NaN
+    :return: Filled grid (NaN if not reached), west and north pixel coordinate of the filled grid
     """
-    X = np.arange(start=extent[0], stop=extent[2], step=step_x)
-    Y = np.arange(start=extent[1], stop=extent[3], step=step_y)
-    X, Y = np.meshgrid(X, Y)  # 2D grid for interpolation
+    reached = np.isfinite(grid_costs)
+    if not reached.any():
+        return np.full(grid_costs.shape, np.nan), west, north
+
+    # crop to the reached pixels plus the maximum distance
+    pixel_size = pixel_x_to_web_mercator_x(1, zoom) - pixel_x_to_web_mercator_x(0, zoom)
+    margin = math.ceil(max_distance / pixel_size) + 1
+    rows = np.flatnonzero(reached.any(axis=1))
+    cols = np.flatnonzero(reached.any(axis=0))
+    row_min = max(rows[0] - margin, 0)
+    row_max = min(rows[-1] + margin + 1, grid_costs.shape[0])
+    col_min = max(cols[0] - margin, 0)
+    col_max = min(cols[-1] + margin + 1, grid_costs.shape[1])
+    grid_costs = grid_costs[row_min:row_max, col_min:col_max]
+    grid_coords = grid_coords[row_min:row_max, col_min:col_max]
+
+    # closest reached pixel for every pixel
+    nearest_rows, nearest_cols = ndimage.distance_transform_edt(
+        ~reached[row_min:row_max, col_min:col_max], return_distances=False, return_indices=True
+    )
+    nearest_coords = grid_coords[nearest_rows, nearest_cols]
+    x = pixel_x_to_web_mercator_x(np.arange(west + col_min, west + col_max, dtype=np.double), zoom)
+    y = pixel_y_to_web_mercator_y(np.arange(north + row_min, north + row_max, dtype=np.double), zoom)
+    distances = np.hypot(x[None, :] - nearest_coords[:, :, 0], y[:, None] - nearest_coords[:, :, 1])
 
-    tree = spatial.KDTree(points)
-    grid_points = np.stack((X.flatten(), Y.flatten()), axis=1)
-    distances, indices = tree.query(grid_points, k=1, distance_upper_bound=200, workers=-1)
-    distances[distances == np.inf] = np.NaN
-    additional_costs = (distances / speed) / 60
-    indices_flatten = indices.flatten()
+    Z = np.rint(grid_costs[nearest_rows, nearest_cols] + (distances / speed) / 60)
+    Z[distances > max_distance] = np.nan
+    if max_traveltime is not None:
+        Z[Z > max_traveltime] = np.nan
+    return Z, west + col_min, north + row_min
 
-    unvalid_indices = np.asarray(indices_flatten == len(costs)).nonzero()[0]
-    mapped_costs = np.take(costs, indices_flatten, mode="clip")
-    np.put(mapped_costs, unvalid_indices, np.NaN)
-    mapped_costs = np.rint(mapped_costs + additional_costs)
-    distances[distances > max_traveltime] = np.NaN
-    Z = mapped_costs
-    Z = Z.reshape(len(X), len(X[0]))
 
-    return np.flip(Z, 0)
+class PreparedNetwork:
+    """
+    Routing network prepared for the isochrone calculation. The nodes are numbered from 0 in the
+    order of their ids, the CSR graph and the node edge index are built on first use and kept.
+    """
+
+    def __init__(
+        self, edges_source_ids, edges_target_ids, edges_cost, edges_reverse_cost, edges_length, geom_address, geom_array
+    ):
+        """
+        :param edges_source_ids: Array of edge source node ids
+        :param edges_target_ids: Array of edge target node ids
+        :param edges_cost: Array of edge costs (seconds)
+        :param edges_reverse_cost: Array of edge reverse costs (seconds)
+        :param edges_length: Array of edge lengths
+        :param geom_address: Start of every edge geometry in geom_array (plus the end)
+        :param geom_array: Coordinates of all edge geometries (EPSG:3857)
+        """
+        n_edges = len(edges_source_ids)
+        self.node_ids, nodes = np.unique(
+            np.concatenate((edges_source_ids, edges_target_ids)).astype(np.int64), return_inverse=True
+        )
+        self.edges_source = nodes[:n_edges]
+        self.edges_target = nodes[n_edges:]
+        self.edges_cost = np.asarray(edges_cost, np.double)
+        self.edges_reverse_cost = np.asarray(edges_reverse_cost, np.double)
+        self.edges_length = np.asarray(edges_length, np.double)
+        self.geom_address = geom_address
+        self.geom_array = geom_array
+
+        # nodes take the first and last coordinate of their edges
+        self.node_coords = np.empty((len(self.node_ids), 2), np.double)
+        self.node_coords[self.edges_target] = geom_array[geom_address[1:] - 1]
+        self.node_coords[self.edges_source] = geom_array[geom_address[:-1]]
+
+        self.extent = get_extent(geom_array)
+        self.extent[0] -= 200
+        self.extent[1] -= 200
+        self.extent[2] += 200
+        self.extent[3] += 200
+
+        self._graph = None
+        self._node_edges = None
+
+    @classmethod
+    def from_dataframe(cls, edge_network):
+        """
+        :param edge_network: Edges with source, target, cost, reverse_cost, length and geom (EPSG:3857 WKB or coordinates)
+        """
+        if len(edge_network) > 0 and isinstance(edge_network["geom"].iloc[0], (bytes, memoryview)):
+            geom_address, geom_array = get_geom_array_wkb(edge_network["geom"])
+        else:
+            geom_address, geom_array = get_geom_array(edge_network["geom"])
+        return cls(
+            edge_network["source"].to_numpy(np.int64),
+            edge_network["target"].to_numpy(np.int64),
+            edge_network["cost"].to_numpy(np.double),
+            edge_network["reverse_cost"].to_numpy(np.double),
+            edge_network["length"].to_numpy(np.double),
+            geom_address,
+            geom_array,
+        )
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            self._graph = construct_csr_graph_(
+                self.n_nodes, self.edges_source, self.edges_target, self.edges_cost, self.edges_reverse_cost
+            )
+        return self._graph
+
+    @property
+    def node_edges(self):
+        if self._node_edges is None:
+            self._node_edges = construct_node_edges_(self.n_nodes, self.edges_source, self.edges_target)
+        return self._node_edges
+
+    def get_node_index(self, vertex_ids):
+        """
+        Map node ids to graph nodes
+        :param vertex_ids: Array of node ids
+        :return: Array of graph nodes and mask of the ids that are part of the network
+        """
+        vertex_ids = np.asarray(vertex_ids, np.int64)
+        index = np.searchsorted(self.node_ids, vertex_ids)
+        valid = index < len(self.node_ids)
+        valid[valid] = self.node_ids[index[valid]] == vertex_ids[valid]
+        return index, valid
+
+
+class DistanceTree:
+    """
+    Shortest path tree of a network whose costs are the lengths divided by the speed (walking),
+    computed at 1 m/s. The tree serves every speed and every travel time up to its reach, the
+    travel times at a speed are the tree costs divided by the speed.
+    """
+
+    def __init__(self, network: PreparedNetwork, start_vertices, reach):
+        """
+        :param network: PreparedNetwork with the costs at 1 m/s
+        :param start_vertices: List of start vertices
+        :param reach: Travel time limit at 1 m/s in minutes (meters / 60)
+        """
+        self.network = network
+        self.reach = reach
+        start_vertices_ids, valid_starts = network.get_node_index(start_vertices)
+        self.distances = dijkstra(start_vertices_ids[valid_starts], network.graph, reach)
+
+    def covers(self, travel_time, speed) -> bool:
+        """
+        Check if the tree reaches as far as the travel time at the speed
+        """
+        return travel_time * speed <= self.reach
+
+    def get_distances(self, travel_time, speed):
+        """
+        Travel times of the nodes at the speed, as a search limited to the travel time returns them
+
+        :param travel_time: Travel time in minutes
+        :param speed: Speed in m/s
+        :return: Array of travel times in minutes for every node (inf if not reached)
+        """
+        distances = self.distances / speed
+        settled = distances < travel_time
+        # The search also keeps the costs of the neighbors of the settled nodes
+        graph = self.network.graph
+        arc_source = np.repeat(np.arange(self.network.n_nodes), np.diff(graph.offsets))
+        reached = settled.copy()
+        reached[graph.targets[settled[arc_source]]] = True
+        distances[~reached] = np.inf
+        return distances
 
 
 def prepare_network_isochrone(edge_network_input):
-    edge_network = edge_network_input.copy()
-    edge_network.astype(
-        {
-            "id": np.int64,
-            "source": np.int64,
-            "target": np.int64,
-            "cost": np.double,
-            "reverse_cost": np.double,
-            "length": np.double,
-        }
-    )
-    # remap edges
-    edges_source = edge_network["source"].to_numpy()
-    edges_target = edge_network["target"].to_numpy()
-    edges_cost = edge_network["cost"].to_numpy()
-    edges_reverse_cost = edge_network["reverse_cost"].to_numpy()
-    start_time = time()
-    geom_address, geom_array = get_geom_array(edge_network["geom"])
-    end_time = time()
-    # print(f"Convert geom array time: \t {end_time - start_time} s")
-    edges_length = np.array(edge_network["length"])
-    start_time = time()
-    unordered_map, node_coords = remap_edges(edges_source, edges_target, geom_address, geom_array)
-    end_time = time()
-    # print(f"Remap edges time: \t\t {end_time-start_time} s")
-
-    extent = get_extent(geom_array)
-    extent[0] -= 200
-    extent[1] -= 200
-    extent[2] += 200
-    extent[3] += 200
-    return (
-        edges_source,
-        edges_target,
-        edges_cost,
-        edges_reverse_cost,
-        edges_length,
-        unordered_map,
-        node_coords,
-        extent,
-        geom_address,
-        geom_array,
-    )
+    """
+    Prepare the edge network for the isochrone calculation
+    :param edge_network_input: Edge Network DataFrame
+    :return: PreparedNetwork
+    """
+    return PreparedNetwork.from_dataframe(edge_network_input)
 
 
 def network_to_grid(
@@ -412,8 +875,9 @@ def network_to_grid(
     geom_address,
     geom_array,
     distances,
+    reached_edges,
     node_coords,
-    speed, 
+    speed,
     max_traveltime,
 ):
     # minx, miny, maxx, maxy
@@ -441,91 +905,118 @@ def network_to_grid(
     web_mercator_x_step = width_meter / width_pixel
     web_mercator_y_step = height_meter / height_pixel
 
-    # split edges based on resolution
-    interpolated_coords = []
-    interpolated_costs = []
-    interpolated_coords, interpolated_costs = split_edges(
+    # rasterize the reached network, the grid has one extra pixel as points are rounded to pixels
+    grid_costs, grid_coords = rasterize_network_(
         edges_source,
         edges_target,
         edges_length,
         geom_address,
         geom_array,
         distances,
+        reached_edges,
+        node_coords,
         min([web_mercator_x_step, web_mercator_y_step]),
+        zoom,
+        xy_bottom_left[0],
+        xy_top_right[1],
+        width_pixel + 2,
+        height_pixel + 2,
     )
-
-    node_coords_list = np.concatenate((node_coords, interpolated_coords))
-    node_costs_list = np.concatenate((distances, interpolated_costs))
-
-    node_coords_list, node_costs_list = filter_nodes(
-        node_coords_list, node_costs_list, zoom, width_pixel, xy_bottom_left[0], xy_top_right[1]
-    )
-
-    Z = build_grid_interpolate_(
-        node_coords_list,
-        node_costs_list,
-        extent,
-        step_x=web_mercator_x_step,
-        step_y=web_mercator_y_step,
-        speed=speed,
+    Z, west, north = fill_grid_distance_transform_(
+        grid_costs,
+        grid_coords,
+        zoom,
+        xy_bottom_left[0],
+        xy_top_right[1],
+        speed,
         max_traveltime=max_traveltime,
     )
 
     # build grid data (single depth)
-    grid_data = get_single_depth_grid_(zoom, xy_bottom_left[0], xy_top_right[1], Z)
+    grid_data = get_single_depth_grid_(zoom, west, north, Z)
 
     return grid_data
 
 
 def compute_isochrone(
-    edge_network_input, start_vertices, travel_time, speed, zoom: int = 10, return_network: bool = True
+    edge_network_input,
+    start_vertices,
+    travel_time,
+    speed,
+    zoom: int = 10,
+    return_network: bool = True,
+    algorithm: str = "heap",
 ):
     """
     Compute isochrone for a given start vertices
 
-    :param edge_network: Edge Network DataFrame
+    :param edge_network: Edge Network DataFrame or PreparedNetwork
     :param start_vertices: List of start vertices
     :param travel_time: Travel time in minutes
+    :param algorithm: Shortest path search, "heap" (dijkstra) or "dial" (dial_dijkstra)
     :return: R5 Grid
     """
-    (
-        edges_source,
-        edges_target,
-        edges_cost,
-        edges_reverse_cost,
-        edges_length,
-        unordered_map,
-        node_coords,
-        extent,
-        geom_address,
-        geom_array,
-    ) = prepare_network_isochrone(edge_network_input=edge_network_input)
+    if isinstance(edge_network_input, PreparedNetwork):
+        network = edge_network_input
+    else:
+        network = prepare_network_isochrone(edge_network_input=edge_network_input)
 
     # run dijkstra
-    adj_list = construct_adjacency_list_(
-        len(unordered_map), edges_source, edges_target, edges_cost, edges_reverse_cost
-    )
-    start_vertices_ids = np.array([unordered_map[v] for v in start_vertices])
-    distances = dijkstra(start_vertices_ids, adj_list, travel_time)
+    graph = network.graph
+    start_vertices_ids, valid_starts = network.get_node_index(start_vertices)
+    start_vertices_ids = start_vertices_ids[valid_starts]
+    if algorithm == "dial":
+        buffers = create_dial_buffers(network.n_nodes, travel_time)
+        distances = dial_dijkstra(start_vertices_ids, graph, travel_time, buffers)
+    else:
+        distances = dijkstra(start_vertices_ids, graph, travel_time)
+
+    return distances_to_isochrone(network, distances, travel_time, speed, zoom, return_network)
+
+
+def distances_to_isochrone(
+    network, distances, travel_time, speed, zoom: int = 10, return_network: bool = True
+):
+    """
+    Convert the shortest path costs of the network nodes to the isochrone grid
+
+    :param network: PreparedNetwork
+    :param distances: Array of shortest path costs in minutes for every node (inf if not reached)
+    :param travel_time: Travel time in minutes
+    :param speed: Speed in m/s
+    :return: R5 Grid and reached network (None if return_network is False)
+    """
+    # only the reached edges are converted
+    reached_edges = get_reached_edges_(np.flatnonzero(np.isfinite(distances)), network.node_edges)
+    extent = network.extent
+    if len(reached_edges) > 0:
+        extent = get_reached_extent_(reached_edges, network.geom_address, network.geom_array)
+        extent[0] -= 200
+        extent[1] -= 200
+        extent[2] += 200
+        extent[3] += 200
 
     # convert results to grid
     grid_data = network_to_grid(
         extent,
         zoom,
-        edges_source,
-        edges_target,
-        edges_length,
-        geom_address,
-        geom_array,
+        network.edges_source,
+        network.edges_target,
+        network.edges_length,
+        network.geom_address,
+        network.geom_array,
         distances,
-        node_coords,
-        speed, 
+        reached_edges,
+        network.node_coords,
+        speed,
         travel_time,
     )
 
     # Convert network to geojson
     if return_network == True:
-        edges_length = range(len(edges_source))
+        geom_address = network.geom_address
+        geom_array = network.geom_array
+        edges_target = network.edges_target
         network = {
             "type": "FeatureCollection",
             "features": [
@@ -537,7 +1028,7 @@ def compute_isochrone(
                     },
                     "properties": {"cost": distances[edges_target[idx]]},
                 }
-                for idx in edges_length
+                for idx in reached_edges
                 if distances[edges_target[idx]] != np.inf
             ],
         }
@@ -549,7 +1040,6 @@ def compute_isochrone(
 
 async def main():
     edges_network, starting_ids, obj_in = await get_sample_network(minutes=5)
-    edge_network = edge_network.iloc[1:, :]
     grid_data = compute_isochrone(
         edges_network,
         starting_ids,
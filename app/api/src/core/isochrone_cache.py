@@ -0,0 +1,123 @@
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+from src.core.config import settings
+from src.core.data_version import data_versions
+
+
+class IsochroneCache:
+    """
+    Cache of isochrone results.
+
+    The first tier is an LRU cache per process. The optional second tier is shared by all
+    processes through files in the cache directory. The files of a scenario are stored in the
+    scenario cache directory, which is removed on scenario edits.
+
+    The keys contain the version of the base tables (basic.data_version), so that any change
+    of the network or the opportunities invalidates the cached results in both tiers. Scenario
+    edits only invalidate the results of their scenario (invalidate). Files of the shared tier without a hit for ISOCHRONE_CACHE_SHARED_MAX_AGE seconds are
+    removed, which includes the results of old versions.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.last_cleanup = 0.0
+
+    def get_version(self) -> int:
+        """
+        Version of the source tables, changed by every committed insert, update or delete
+        """
+        return data_versions.get("isochrone")
+
+    def get_path(self, key: tuple) -> str:
+        """
+        File of the key in the shared tier. Key entry 0 is the scenario id.
+        """
+        name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        scenario_id = key[0]
+        if scenario_id:
+            return f"{settings.CACHE_PATH}/user/scenario/{scenario_id}/isochrone/{name}"
+        return f"{settings.CACHE_PATH}/isochrone/{name}"
+
+    def get(self, key: tuple):
+        """
+        Get the cached result of the key, None on a miss
+        """
+        result = self.results.get(key)
+        if result is not None:
+            self.results.move_to_end(key)
+            return result
+        if not settings.ISOCHRONE_CACHE_SHARED:
+            return None
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+            # The age of the files counts from their last hit
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self.put(key, result, shared=False)
+        return result
+
+    def put(self, key: tuple, result, shared: bool = True):
+        """
+        Cache the result of the key
+        """
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+        if shared and settings.ISOCHRONE_CACHE_SHARED:
+            path = self.get_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so that readers never see partial results
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, path)
+            self.cleanup()
+
+    def cleanup(self):
+        """
+        Remove the files of the shared tier without a hit for ISOCHRONE_CACHE_SHARED_MAX_AGE
+        """
+        now = time.time()
+        if now - self.last_cleanup < settings.ISOCHRONE_CACHE_SHARED_MAX_AGE / 10:
+            return
+        self.last_cleanup = now
+        max_age = settings.ISOCHRONE_CACHE_SHARED_MAX_AGE
+        directories = [f"{settings.CACHE_PATH}/isochrone"] + glob.glob(
+            f"{settings.CACHE_PATH}/user/scenario/*/isochrone"
+        )
+        for directory in directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if now - entry.stat().st_mtime > max_age:
+                                os.remove(entry.path)
+                        except FileNotFoundError:
+                            # Removed by another process
+                            pass
+            except FileNotFoundError:
+                continue
+
+    def invalidate(self, scenario_id: int):
+        """
+        Drop the results of a scenario from both tiers
+        """
+        for key in [key for key in self.results if key[0] == scenario_id]:
+            del self.results[key]
+        shutil.rmtree(
+            f"{settings.CACHE_PATH}/user/scenario/{scenario_id}/isochrone", ignore_errors=True
+        )
+
+
+isochrone_cache = IsochroneCache(settings.ISOCHRONE_CACHE_SIZE)
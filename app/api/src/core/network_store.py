@@ -0,0 +1,607 @@
+from collections import OrderedDict
+
+import connectorx as cx
+import numpy as np
+import pandas as pd
+import shapely
+import shapely.ops
+from shapely import wkt
+from shapely.geometry import Point, box
+from shapely.prepared import prep
+from sqlalchemy.sql import text
+
+from src.core.config import settings
+from src.core.data_version import data_versions
+from src.core.isochrone import DistanceTree, PreparedNetwork, dijkstra
+from src.db.session import legacy_engine
+from src.utils import project, unproject, wgs84_to_web_mercator
+
+# Same ids the SQL routing functions use for the artificial start node and edges
+MAX_NEW_NODE_ID = 2147483647
+MAX_NEW_EDGE_ID = 2147483647
+# Width of the web mercator projection in meters
+WEB_MERCATOR_EXTENT = 40075016.68557849
+
+
+class StudyAreaNetwork:
+    """
+    Routing network of one study area and routing profile, held in memory.
+    """
+
+    def __init__(self, edges: pd.DataFrame, extent_geom, edge_version: int):
+        """
+        :param edges: Edges with id, source, target, cost, reverse_cost, geom (EPSG:3857 WKB) and length
+        :param extent_geom: Geometry (EPSG:3857) the network was loaded for
+        :param edge_version: Version of basic.edge at load time
+        """
+        self.edges = edges
+        self.extent_geom = prep(extent_geom)
+        self.edge_version = edge_version
+        self.network = PreparedNetwork.from_dataframe(edges)
+        geom_address = self.network.geom_address
+        self.lines = shapely.linestrings(
+            self.network.geom_array,
+            indices=np.repeat(np.arange(len(edges)), np.diff(geom_address)),
+        )
+        self.tree = shapely.STRtree(self.lines)
+
+    def covers(self, x: float, y: float, radius: float) -> bool:
+        """
+        Check if the circle around x, y (EPSG:3857) lies within the loaded extent
+        """
+        return self.extent_geom.contains(Point(x, y).buffer(radius, 16))
+
+    def subset(self, x, y, radius) -> pd.DataFrame:
+        """
+        Edges within radius of any of the points x, y (EPSG:3857)
+        """
+        points = shapely.points(np.atleast_1d(x), np.atleast_1d(y))
+        _, edge_index = self.tree.query(points, predicate="dwithin", distance=radius)
+        return self.edges.iloc[np.unique(edge_index)]
+
+    def snap(self, x, y, snap_distance):
+        """
+        Find the closest edge of every point x, y (EPSG:3857)
+
+        :param x: Array of x coordinates
+        :param y: Array of y coordinates
+        :param snap_distance: Array of the maximum distance of every point (EPSG:3857 units)
+
+        :return: Index of the closest edge (-1 if none within snap_distance) and fraction of the closest point along it
+        """
+        points = shapely.points(x, y)
+        (point_index, edge_index), distance = self.tree.query_nearest(
+            points, max_distance=np.max(snap_distance), return_distance=True, all_matches=False
+        )
+        within = distance <= snap_distance[point_index]
+        point_index = point_index[within]
+        edge_index = edge_index[within]
+        snapped_edges = np.full(len(points), -1, np.int64)
+        snapped_edges[point_index] = edge_index
+        fractions = np.zeros(len(points), np.double)
+        fractions[point_index] = shapely.line_locate_point(
+            self.lines[edge_index], points[point_index], normalized=True
+        )
+        return snapped_edges, fractions
+
+    def create_artificial_edges(self, snapped_edges, fractions):
+        """
+        Split the snapped edges at the snapped points. Points on the same edge split it into several
+        parts, points at the same location share one node.
+
+        :param snapped_edges: Index of the snapped edge of every point (-1 if not snapped)
+        :param fractions: Fraction of every point along its edge
+
+        :return: Node id of every point (-1 if not snapped), coordinates of the nodes (EPSG:3857, NaN if not snapped) and the artificial edges with the id of the split edge (wid)
+        """
+        node_ids = np.full(len(snapped_edges), -1, np.int64)
+        valid = np.flatnonzero(snapped_edges != -1)
+        node_points = np.full((len(snapped_edges), 2), np.nan)
+        node_points[valid] = shapely.get_coordinates(
+            shapely.line_interpolate_point(
+                self.lines[snapped_edges[valid]], fractions[valid], normalized=True
+            )
+        )
+        order = valid[np.lexsort((fractions[valid], snapped_edges[valid]))]
+        new_node_id = MAX_NEW_NODE_ID
+        new_edge_id = MAX_NEW_EDGE_ID
+        rows = []
+        group_start = 0
+        while group_start < len(order):
+            edge_index = snapped_edges[order[group_start]]
+            group_end = group_start
+            while group_end < len(order) and snapped_edges[order[group_end]] == edge_index:
+                group_end += 1
+
+            # one node for every distinct location along the edge
+            split_fractions = [0.0]
+            split_nodes = [self.edges["source"].iat[edge_index]]
+            for point in order[group_start:group_end]:
+                if len(split_fractions) == 1 or fractions[point] != split_fractions[-1]:
+                    split_fractions.append(fractions[point])
+                    split_nodes.append(new_node_id)
+                    new_node_id -= 1
+                node_ids[point] = split_nodes[-1]
+            split_fractions.append(1.0)
+            split_nodes.append(self.edges["target"].iat[edge_index])
+
+            edge = self.edges.iloc[edge_index]
+            for i in range(len(split_fractions) - 1):
+                part = split_fractions[i + 1] - split_fractions[i]
+                geom = shapely.ops.substring(
+                    self.lines[edge_index], split_fractions[i], split_fractions[i + 1], normalized=True
+                )
+                if geom.geom_type == "Point":
+                    geom = shapely.linestrings([geom.coords[0], geom.coords[0]])
+                rows.append(
+                    (
+                        edge["id"],
+                        new_edge_id,
+                        split_nodes[i],
+                        split_nodes[i + 1],
+                        edge["cost"] * part if edge["cost"] >= 0 else edge["cost"],
+                        edge["reverse_cost"] * part if edge["reverse_cost"] >= 0 else edge["reverse_cost"],
+                        shapely.to_wkb(geom),
+                        edge["length"] * part,
+                    )
+                )
+                new_edge_id -= 1
+            group_start = group_end
+
+        artificial_edges = pd.DataFrame(
+            rows, columns=["wid", "id", "source", "target", "cost", "reverse_cost", "geom", "length"]
+        )
+        return node_ids, node_points, artificial_edges
+
+
+def get_tile_size(zoom: int) -> float:
+    """
+    Width of a web mercator tile of the zoom level (EPSG:3857 units)
+    """
+    return WEB_MERCATOR_EXTENT / 2**zoom
+
+
+def get_tile_bounds(tiles, zoom: int) -> np.ndarray:
+    """
+    Bounds (xmin, ymin, xmax, ymax in EPSG:3857) of every tile (tile_x, tile_y)
+    """
+    tiles = np.asarray(tiles, np.double).reshape(-1, 2)
+    size = get_tile_size(zoom)
+    xmin = tiles[:, 0] * size - WEB_MERCATOR_EXTENT / 2
+    ymax = WEB_MERCATOR_EXTENT / 2 - tiles[:, 1] * size
+    return np.column_stack([xmin, ymax - size, xmin + size, ymax])
+
+
+class TiledNetwork:
+    """
+    Routing network around starting points, loaded lazily in web mercator tiles.
+
+    Every tile holds all edges intersecting it, so the edges of every node inside a loaded tile
+    are complete. The search is exact once all reached nodes lie in loaded tiles. The network
+    starts with the tiles around the starting points and grows by the tiles the frontier of the
+    search enters, until it stays inside the loaded tiles.
+    """
+
+    def __init__(self, get_tiles, zoom: int):
+        """
+        :param get_tiles: Function returning the edges (id, source, target, cost, reverse_cost, geom as EPSG:3857 WKB and length) of every requested tile as dict of (tile_x, tile_y) to DataFrame
+        :param zoom: Zoom level of the tiles
+        """
+        self.get_tiles = get_tiles
+        self.zoom = zoom
+        self.tiles = {}
+
+    def get_tile_index(self, x, y) -> np.ndarray:
+        """
+        Tile (tile_x, tile_y) of every point x, y (EPSG:3857)
+        """
+        size = get_tile_size(self.zoom)
+        tile_x = np.floor((np.asarray(x) + WEB_MERCATOR_EXTENT / 2) / size)
+        tile_y = np.floor((WEB_MERCATOR_EXTENT / 2 - np.asarray(y)) / size)
+        return np.column_stack([tile_x, tile_y]).astype(np.int64)
+
+    def add_tiles(self, tiles) -> int:
+        """
+        Load the tiles that are not loaded yet
+
+        :return: Number of loaded tiles
+        """
+        missing = {tuple(tile) for tile in np.asarray(tiles).tolist()} - self.tiles.keys()
+        if missing:
+            self.tiles.update(self.get_tiles(sorted(missing)))
+        return len(missing)
+
+    @property
+    def edges(self) -> pd.DataFrame:
+        # Edges crossing tile borders are part of several tiles
+        edges = pd.concat(self.tiles.values(), ignore_index=True)
+        return edges.drop_duplicates("id", ignore_index=True)
+
+    def read_network(self, x, y, travel_time: float, snap_distance, cost_factor: float = 1.0):
+        """
+        Load the network reached from the starting points within the travel time
+
+        :param x: Array of x coordinates of the starting points (EPSG:3857)
+        :param y: Array of y coordinates of the starting points (EPSG:3857)
+        :param travel_time: Travel time limit in minutes
+        :param snap_distance: Array of the maximum snap distance of every point (EPSG:3857 units)
+        :param cost_factor: Factor of the edge costs of the tiles (load speed / speed)
+
+        :return: Edges network, starting ids (-1 if a point is not snapped) and starting points (EPSG:3857)
+        """
+        # The tiles within the snap distance of the starting points (tile_y grows southwards)
+        tile_min = self.get_tile_index(x - snap_distance, y + snap_distance)
+        tile_max = self.get_tile_index(x + snap_distance, y - snap_distance)
+        for (xmin, ymin), (xmax, ymax) in zip(tile_min, tile_max):
+            self.add_tiles(
+                [(tile_x, tile_y) for tile_x in range(xmin, xmax + 1) for tile_y in range(ymin, ymax + 1)]
+            )
+
+        start_network = StudyAreaNetwork(self.edges, box(0, 0, 0, 0), 0)
+        snapped_edges, fractions = start_network.snap(x, y, snap_distance)
+        starting_ids, starting_points, artificial_edges = start_network.create_artificial_edges(
+            snapped_edges, fractions
+        )
+        if np.all(starting_ids == -1):
+            return None, starting_ids, starting_points
+
+        while True:
+            edges_network = self.edges
+            edges_network = edges_network[~edges_network["id"].isin(artificial_edges["wid"])]
+            edges_network = pd.concat(
+                [edges_network, artificial_edges[edges_network.columns]], ignore_index=True
+            )
+            if cost_factor != 1.0:
+                # Negative costs (closed directions) stay negative
+                edges_network["cost"] *= cost_factor
+                edges_network["reverse_cost"] *= cost_factor
+            network = PreparedNetwork.from_dataframe(edges_network)
+            start_vertices, valid = network.get_node_index(starting_ids)
+            distances = dijkstra(start_vertices[valid], network.graph, travel_time)
+            reached = distances < travel_time
+            reached_tiles = self.get_tile_index(
+                network.node_coords[reached, 0], network.node_coords[reached, 1]
+            )
+            if self.add_tiles(reached_tiles) == 0:
+                return edges_network, starting_ids, starting_points
+
+
+class RoutingNetworkStore:
+    """
+    Per worker store of the routing networks of the study areas.
+
+    Every network is loaded once per study area, routing profile and speed (the edge costs
+    depend on the speed) and reused by all following requests. The store is reloaded when
+    basic.edge changes.
+
+    Requests reaching beyond the buffered study area (e.g. long cycling isochrones) are served
+    by networks loaded in tiles, the tiles are kept in an LRU cache.
+    """
+
+    def __init__(self):
+        self.networks = {}
+        self.distance_trees = OrderedDict()
+        self.tiles = OrderedDict()
+        self.tiles_edge_version = None
+        self.snap_distances = {}
+
+    def get_edge_version(self) -> int:
+        """
+        Version of basic.edge in basic.data_version, changed by every committed insert, update
+        or delete. It is read at most every DATA_VERSION_CHECK_INTERVAL seconds.
+        """
+        return data_versions.get("edge")
+
+    def load_network(self, study_area_id: int, routing_profile: str, speed: float):
+        """
+        Load the network of the buffered study area
+        """
+        buffer_wkt = legacy_engine.execute(
+            text(
+                """SELECT ST_ASTEXT(ST_Buffer(geom::geography, :buffer)::geometry)
+                FROM basic.study_area
+                WHERE id = :study_area_id"""
+            ),
+            buffer=settings.ROUTING_NETWORK_STORE_BUFFER,
+            study_area_id=study_area_id,
+        ).scalar()
+        if buffer_wkt is None:
+            return None
+        edges = self.query_edges(buffer_wkt, routing_profile, speed)
+        extent_geom = wgs84_to_web_mercator(wkt.loads(buffer_wkt))
+        return StudyAreaNetwork(edges, extent_geom, self.get_edge_version())
+
+    def query_edges(self, area_wkt: str, routing_profile: str, speed: float) -> pd.DataFrame:
+        """
+        Query the edges of the default network intersecting the area (WKT in EPSG:4326)
+        """
+        sql_network = legacy_engine.execute(
+            text(
+                """SELECT basic.query_edges_routing(:area_wkt, 'default', 0, :speed, :routing_profile, FALSE)"""
+            ),
+            area_wkt=area_wkt,
+            speed=speed,
+            routing_profile=routing_profile,
+        ).scalar()
+        # Binary transfer, the geometries arrive as WKB bytes
+        edges = cx.read_sql(
+            settings.POSTGRES_DATABASE_URI,
+            f"""SELECT id, source, target, cost, reverse_cost, ST_AsBinary(ST_Transform(geom, 3857)) AS geom, length_3857 AS length
+            FROM ({sql_network}) e""",
+            return_type="pandas",
+        )
+        return edges.astype(
+            {
+                "id": np.int64,
+                "source": np.int64,
+                "target": np.int64,
+                "cost": np.double,
+                "reverse_cost": np.double,
+                "length": np.double,
+            }
+        )
+
+    def load_tiles(self, tiles: list, routing_profile: str, speed: float) -> dict:
+        """
+        Load the edges of several tiles with one query
+
+        :return: Edges of every tile (tile_x, tile_y)
+        """
+        bounds = get_tile_bounds(tiles, settings.ROUTING_NETWORK_TILE_ZOOM)
+        # Tile borders are meridians and parallels, the corners define the tiles in EPSG:4326 too
+        lon_min, lat_min = unproject(bounds[:, 0], bounds[:, 1])
+        lon_max, lat_max = unproject(bounds[:, 2], bounds[:, 3])
+        area = shapely.multipolygons(shapely.box(lon_min, lat_min, lon_max, lat_max))
+        edges = self.query_edges(shapely.to_wkt(area), routing_profile, speed)
+
+        boxes = shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+        lines = shapely.from_wkb(edges["geom"].to_numpy())
+        edge_index, tile_index = shapely.STRtree(boxes).query(lines, predicate="intersects")
+        return {
+            tuple(tile): edges.iloc[edge_index[tile_index == i]]
+            for i, tile in enumerate(tiles)
+        }
+
+    def get_tiles(self, tiles: list, routing_profile: str, speed: float) -> dict:
+        """
+        Get the edges of the tiles from the tile cache, load the missing tiles
+        """
+        edge_version = self.get_edge_version()
+        if edge_version != self.tiles_edge_version:
+            self.tiles.clear()
+            self.tiles_edge_version = edge_version
+
+        zoom = settings.ROUTING_NETWORK_TILE_ZOOM
+        keys = {tuple(tile): (routing_profile, round(speed, 3), zoom) + tuple(tile) for tile in tiles}
+        missing = [tile for tile, key in keys.items() if key not in self.tiles]
+        if missing:
+            for tile, edges in self.load_tiles(missing, routing_profile, speed).items():
+                self.tiles[keys[tile]] = edges
+        result = {}
+        for tile, key in keys.items():
+            self.tiles.move_to_end(key)
+            result[tile] = self.tiles[key]
+        while len(self.tiles) > settings.ROUTING_NETWORK_TILE_CACHE_SIZE:
+            self.tiles.popitem(last=False)
+        return result
+
+    def get_load_speed(self, routing_profile: str, speed: float) -> float:
+        """
+        Speed the network of the routing profile is loaded with. The walking costs are the lengths
+        divided by the speed, one network loaded at 1 m/s serves all speeds.
+        """
+        if routing_profile.startswith("walking"):
+            return 1.0
+        return speed
+
+    def get_network(self, study_area_id: int, routing_profile: str, speed: float):
+        """
+        Get the network from the store, load it on first use or if basic.edge changed.
+        The costs of the network are at get_load_speed.
+        """
+        speed = self.get_load_speed(routing_profile, speed)
+        key = (study_area_id, routing_profile, round(speed, 3))
+        network = self.networks.get(key)
+        if network is None or network.edge_version != self.get_edge_version():
+            network = self.load_network(study_area_id, routing_profile, speed)
+            self.networks[key] = network
+        return network
+
+    def get_snap_distance(self, study_area_id: int) -> float:
+        """
+        Snap distance of the study area in meters
+        """
+        if study_area_id not in self.snap_distances:
+            self.snap_distances[study_area_id] = legacy_engine.execute(
+                text("SELECT basic.select_customization('snap_distance_network', :study_area_id)::integer"),
+                study_area_id=study_area_id,
+            ).scalar()
+        return self.snap_distances[study_area_id]
+
+    def get_reference_study_area(self, x: float, y: float):
+        """
+        Id of the study area the point (EPSG:4326) belongs to
+        """
+        return legacy_engine.execute(
+            text("SELECT basic.get_reference_study_area(ST_SETSRID(ST_POINT(:x, :y), 4326))"),
+            x=float(x),
+            y=float(y),
+        ).scalar()
+
+    def get_reference_network(self, x: float, y: float, routing_profile: str, speed: float):
+        """
+        Study area id and network of the study area the point (EPSG:4326) belongs to
+        """
+        study_area_id = self.get_reference_study_area(x, y)
+        if study_area_id is None:
+            return None, None
+        return study_area_id, self.get_network(study_area_id, routing_profile, speed)
+
+    def snap_start(self, x: float, y: float, routing_profile: str, speed: float):
+        """
+        Snap a starting point to the network without reading the network around it.
+
+        :param x: Longitude of the starting point
+        :param y: Latitude of the starting point
+        :param routing_profile: Routing profile (e.g. walking_standard)
+        :param speed: Speed in m/s
+
+        :return: Study area id, edge id, offset along the edge (rounded to meters) and edge version, or None if the point is not snapped
+        """
+        study_area_id, network = self.get_reference_network(x, y, routing_profile, speed)
+        if network is None:
+            return None
+        points_x, points_y = project(np.array([x], np.double), np.array([y], np.double))
+        scale = 1 / np.cos(np.radians(y))
+        snap_distance = np.array([self.get_snap_distance(study_area_id) * scale])
+        snapped_edges, fractions = network.snap(points_x, points_y, snap_distance)
+        if snapped_edges[0] == -1:
+            return None
+        edge = network.edges.iloc[snapped_edges[0]]
+        # The length is in web mercator units, scale it to meters
+        offset = round(float(fractions[0] * edge["length"] / scale))
+        return study_area_id, int(edge["id"]), offset, network.edge_version
+
+    def read_network_multi(
+        self, x, y, max_cutoff: float, speed: float, routing_profile: str
+    ):
+        """
+        Read the routing network around several starting points from the store. The starting points
+        are snapped to the network in memory.
+
+        :param x: Longitudes of the starting points
+        :param y: Latitudes of the starting points
+        :param max_cutoff: Maximum travel time in seconds
+        :param speed: Speed in m/s
+        :param routing_profile: Routing profile (e.g. walking_standard)
+
+        :return: Edges network, starting ids (-1 if a point is not snapped) and snapped starting points (EPSG:3857), or None if the store can't serve the request
+        """
+        x = np.asarray(x, np.double)
+        y = np.asarray(y, np.double)
+        study_area_id, network = self.get_reference_network(x[0], y[0], routing_profile, speed)
+        if network is None:
+            return None
+
+        # The SQL functions buffer in meters on the sphere, scale to web mercator units
+        points_x, points_y = project(x, y)
+        scale = 1 / np.cos(np.radians(y))
+        radius = max_cutoff * speed * scale
+        for i in range(len(x)):
+            if not network.covers(points_x[i], points_y[i], radius[i]):
+                if settings.ROUTING_NETWORK_TILES_ENABLED:
+                    return self.read_network_tiled(x, y, max_cutoff, speed, routing_profile)
+                return None
+
+        snap_distance = self.get_snap_distance(study_area_id) * scale
+        snapped_edges, fractions = network.snap(points_x, points_y, snap_distance)
+        starting_ids, starting_points, artificial_edges = network.create_artificial_edges(
+            snapped_edges, fractions
+        )
+
+        edges_network = network.subset(points_x, points_y, radius)
+        edges_network = edges_network[~edges_network["id"].isin(artificial_edges["wid"])]
+        edges_network = pd.concat(
+            [edges_network, artificial_edges[edges_network.columns]], ignore_index=True
+        )
+        load_speed = self.get_load_speed(routing_profile, speed)
+        if load_speed != speed:
+            # Negative costs (closed directions) stay negative
+            edges_network["cost"] *= load_speed / speed
+            edges_network["reverse_cost"] *= load_speed / speed
+        return edges_network, starting_ids, starting_points
+
+    def read_network_tiled(
+        self, x, y, max_cutoff: float, speed: float, routing_profile: str
+    ):
+        """
+        Read the routing network around several starting points in tiles. Only the tiles the
+        search reaches are loaded, the tiles are cached for the following requests.
+
+        :param x: Longitudes of the starting points
+        :param y: Latitudes of the starting points
+        :param max_cutoff: Maximum travel time in seconds
+        :param speed: Speed in m/s
+        :param routing_profile: Routing profile (e.g. walking_standard)
+
+        :return: Edges network, starting ids (-1 if a point is not snapped) and snapped starting points (EPSG:3857), or None if no point is snapped
+        """
+        x = np.asarray(x, np.double)
+        y = np.asarray(y, np.double)
+        study_area_id = self.get_reference_study_area(x[0], y[0])
+        if study_area_id is None:
+            return None
+
+        load_speed = self.get_load_speed(routing_profile, speed)
+        tiled_network = TiledNetwork(
+            lambda tiles: self.get_tiles(tiles, routing_profile, load_speed),
+            settings.ROUTING_NETWORK_TILE_ZOOM,
+        )
+        points_x, points_y = project(x, y)
+        # The SQL functions snap in meters on the sphere, scale to web mercator units
+        snap_distance = self.get_snap_distance(study_area_id) / np.cos(np.radians(y))
+        edges_network, starting_ids, starting_points = tiled_network.read_network(
+            points_x, points_y, max_cutoff / 60, snap_distance, load_speed / speed
+        )
+        if edges_network is None:
+            return None
+        return edges_network, starting_ids, starting_points
+
+    def read_network(
+        self, x: float, y: float, max_cutoff: float, speed: float, routing_profile: str
+    ):
+        """
+        Read the routing network around a starting point from the store.
+
+        :param x: Longitude of the starting point
+        :param y: Latitude of the starting point
+        :param max_cutoff: Maximum travel time in seconds
+        :param speed: Speed in m/s
+        :param routing_profile: Routing profile (e.g. walking_standard)
+
+        :return: Edges network, starting ids and snapped starting point (EPSG:3857), or None if the store can't serve the request
+        """
+        network = self.read_network_multi([x], [y], max_cutoff, speed, routing_profile)
+        if network is None or network[1][0] == -1:
+            return None
+        edges_network, starting_ids, starting_points = network
+        return edges_network, [starting_ids[0]], Point(starting_points[0])
+
+    def read_distance_tree(
+        self, x: float, y: float, travel_time: float, speed: float, routing_profile: str
+    ):
+        """
+        Shortest path tree of a walking isochrone. The trees are kept per snapped starting point
+        and reused for all speeds and shorter travel times.
+
+        :param x: Longitude of the starting point
+        :param y: Latitude of the starting point
+        :param travel_time: Travel time in minutes
+        :param speed: Speed in m/s
+        :param routing_profile: Walking routing profile (e.g. walking_standard)
+
+        :return: DistanceTree and starting point (EPSG:3857), or None if the store can't serve the request
+        """
+        snapped_start = self.snap_start(x, y, routing_profile, speed)
+        if snapped_start is None:
+            return None
+        key = (routing_profile, snapped_start)
+        cached = self.distance_trees.get(key)
+        if cached is not None and cached[0].covers(travel_time, speed):
+            self.distance_trees.move_to_end(key)
+            return cached
+
+        reach = travel_time * speed
+        network = self.read_network(x, y, reach * 60, 1.0, routing_profile)
+        if network is None:
+            return None
+        edges_network, starting_ids, starting_point = network
+        tree = DistanceTree(PreparedNetwork.from_dataframe(edges_network), starting_ids, reach)
+        self.distance_trees[key] = (tree, starting_point)
+        self.distance_trees.move_to_end(key)
+        while len(self.distance_trees) > settings.ROUTING_DISTANCE_TREE_CACHE_SIZE:
+            self.distance_trees.popitem(last=False)
+        return tree, starting_point
+
+
+network_store = RoutingNetworkStore()
@@ -398,16 +398,18 @@ class OpportunityIsochroneCount(OpportunityIntersect):
             self, input_geometries, user_id, user_active_upload_ids, scenario_id, hexagon_size
         )
 
-    def count_poi(self, group_by_column: str):
+    def count_poi(self, group_by_column: str, poi_gdf: GeoDataFrame = None):
         """
         Count the number of poi for each cutoff.
 
         :param group_by: The input_geometries column to group by.
+        :param poi_gdf: Part of the intersected poi (self.poi()) to count, all if None.
 
         :return: A dictionary with the cummulative number of opportunities for each cutoff .
 
         """
-        poi_gdf = self.poi()
+        if poi_gdf is None:
+            poi_gdf = self.poi()
         poi_count = defaultdict(dict)
         # Poi with one entrance.
         poi_one_entrance_gdf = poi_gdf[poi_gdf["entrance_type"] == "one"]
@@ -446,17 +448,21 @@ class OpportunityIsochroneCount(OpportunityIntersect):
 
         return dict(poi_count)
 
-    def count_population(self, group_by_columns: list[str]):
+    def count_population(
+        self, group_by_columns: list[str], population_gdf_join: GeoDataFrame = None
+    ):
         """
         Count the number of population for each cutoff.
 
         :param group_by: The input_geometries column to group by.
+        :param population_gdf_join: Part of the intersected population (self.population()) to count, all if None.
 
         :return: A dictionary with the cummulative number of opportunities for each cutoff.
 
         """
         population_count = defaultdict(dict)
-        population_gdf_join = self.population()
+        if population_gdf_join is None:
+            population_gdf_join = self.population()
         population_gdf_grouped = population_gdf_join.groupby(group_by_columns).agg(
             {"population": "sum"}
         )
@@ -465,18 +471,20 @@ class OpportunityIsochroneCount(OpportunityIntersect):
 
         return dict(population_count)
 
-    def count_aoi(self, group_by_columns: list[str]):
+    def count_aoi(self, group_by_columns: list[str], aoi_gdf: GeoDataFrame = None):
         """
         Count the number of aoi for each cutoff.
 
         :param group_by: The input_geometries column to group by.
+        :param aoi_gdf: Part of the intersected aoi (self.aoi()) to count, all if None.
 
         :return: A dictionary with the cummulative number of opportunities for each cutoff.
 
         """
 
         aoi_count = defaultdict(dict)
-        aoi_gdf = self.aoi()
+        if aoi_gdf is None:
+            aoi_gdf = self.aoi()
         if aoi_gdf is None or len(aoi_gdf) == 0:
             return dict(aoi_count)
         aoi_gdf_grouped = aoi_gdf.groupby(group_by_columns).apply(lambda x: x.area.sum())
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+
+from src.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ResultStore:
+    """
+    Store for large task results, shared by the workers and the API.
+
+    The workers write the results as raw bytes to the store (a shared directory or the S3 bucket)
+    and only pass a reference with key, size and checksum through the Celery result backend.
+    The API streams the bytes back from the store.
+    """
+
+    def __init__(self):
+        self.last_cleanup = 0.0
+
+    def put(self, data: bytes) -> dict:
+        """
+        Write the result to the store
+
+        :param data: Raw bytes of the result
+
+        :return: Reference with key, size and sha256 checksum of the result
+        """
+        key = uuid.uuid4().hex
+        if settings.RESULT_STORE == "s3":
+            settings.S3_CLIENT.put_object(
+                Bucket=settings.AWS_BUCKET_NAME,
+                Key=f"{settings.RESULT_STORE_PATH}/{key}",
+                Body=data,
+            )
+        else:
+            os.makedirs(settings.RESULT_STORE_PATH, exist_ok=True)
+            # Write to a temporary file first so that readers never see partial results
+            with tempfile.NamedTemporaryFile(dir=settings.RESULT_STORE_PATH, delete=False) as f:
+                f.write(data)
+            os.replace(f.name, os.path.join(settings.RESULT_STORE_PATH, key))
+            self.cleanup()
+        return {"key": key, "size": len(data), "checksum": hashlib.sha256(data).hexdigest()}
+
+    def read_chunks(self, key: str):
+        if settings.RESULT_STORE == "s3":
+            response = settings.S3_CLIENT.get_object(
+                Bucket=settings.AWS_BUCKET_NAME, Key=f"{settings.RESULT_STORE_PATH}/{key}"
+            )
+            yield from response["Body"].iter_chunks(CHUNK_SIZE)
+        else:
+            with open(os.path.join(settings.RESULT_STORE_PATH, key), "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    yield chunk
+
+    def stream(self, reference: dict):
+        """
+        Stream the result in chunks. The checksum is verified at the end of the stream.
+
+        :param reference: Reference returned by put
+        """
+        checksum = hashlib.sha256()
+        size = 0
+        for chunk in self.read_chunks(reference["key"]):
+            checksum.update(chunk)
+            size += len(chunk)
+            yield chunk
+        if size != reference["size"] or checksum.hexdigest() != reference["checksum"]:
+            raise ValueError(f"Result {reference['key']} is corrupted")
+
+    def get(self, reference: dict) -> bytes:
+        """
+        Read the whole result
+
+        :param reference: Reference returned by put
+        """
+        return b"".join(self.stream(reference))
+
+    def cleanup(self):
+        """
+        Remove the results older than RESULT_STORE_EXPIRES from the directory. In S3 an
+        expiration rule of the bucket removes them.
+        """
+        now = time.time()
+        if now - self.last_cleanup < settings.RESULT_STORE_EXPIRES / 10:
+            return
+        self.last_cleanup = now
+        with os.scandir(settings.RESULT_STORE_PATH) as entries:
+            for entry in entries:
+                try:
+                    if now - entry.stat().st_mtime > settings.RESULT_STORE_EXPIRES:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    # Removed by another worker
+                    pass
+
+    def store_results(self, results: dict) -> dict:
+        """
+        Move the entries of the task results that go through Celery to the store. Bytes are
+        always stored as the JSON serializer of the result backend can't encode them, other
+        entries as JSON if they are larger than RESULT_STORE_MIN_SIZE. Without Celery the
+        results are returned to the API directly and are left as they are.
+
+        :param results: Task results with data, return_type and data_source
+
+        :return: Task results with the stored entries replaced by their references
+        """
+        if not settings.CELERY_BROKER_URL:
+            return results
+        stored = {}
+        for name, value in results["data"].items():
+            if isinstance(value, (bytes, bytearray)):
+                data, data_format = bytes(value), "bytes"
+            else:
+                data, data_format = json.dumps(value).encode("utf-8"), "json"
+            if data_format == "bytes" or len(data) >= settings.RESULT_STORE_MIN_SIZE:
+                results["data"][name] = self.put(data) | {"format": data_format}
+                stored[name] = True
+        results["stored"] = stored
+        return results
+
+    def load(self, results: dict, name: str):
+        """
+        Entry of the task results, read from the store if it was stored
+        """
+        value = results["data"][name]
+        if not results.get("stored", {}).get(name):
+            return value
+        data = self.get(value)
+        return data if value["format"] == "bytes" else json.loads(data)
+
+
+result_store = ResultStore()
@@ -5,6 +5,7 @@ import os
 import shutil
 import time
 import uuid
+import zipfile
 from collections import defaultdict
 from errno import ELOOP
 from typing import Any
@@ -14,29 +15,43 @@ import pandas as pd
 import geopandas as gpd
 import pyproj
 import requests
+from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 from geopandas import GeoDataFrame, GeoSeries, clip, read_postgis
 from pandas.io.sql import read_sql
+from shapely import wkb
 from shapely.geometry import Point, shape
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.sql import text
 
 from src import crud
 from src.core.config import settings
-from src.core.isochrone import compute_isochrone
+from src.core.isochrone import (
+    PreparedNetwork,
+    compute_isochrone,
+    compute_od_matrix,
+    dijkstra_many,
+    distances_to_isochrone,
+    reached_to_distances,
+)
+from src.core.isochrone_cache import isochrone_cache
+from src.core.network_store import network_store
 from src.core.opportunity import OpportunityIsochroneCount
 from src.db import models
 from src.db.session import legacy_engine
 from src.jsoline import generate_jsolines
 from src.resources.enums import IsochroneExportType
 from src.schemas.isochrone import (
+    CalculationTypes,
+    IsochroneBatchDTO,
     IsochroneDTO,
     IsochroneMode,
     IsochroneMultiRegionType,
     IsochroneOutputType,
     IsochroneStartingPointCoord,
     IsochroneTypeEnum,
+    ODMatrixDTO,
     R5AvailableDates,
     R5TravelTimePayloadTemplate,
 )
@@ -111,31 +126,87 @@ class CRUDIsochrone:
         # Step 5: Return the newly created dictionary
         return new_dict
 
+    def get_routing_profile(self, obj_in: IsochroneDTO):
+        routing_profile = None
+        if obj_in.mode.value == IsochroneMode.WALKING.value:
+            routing_profile = obj_in.mode.value + "_" + obj_in.settings.walking_profile.value
+
+        if obj_in.mode.value == IsochroneMode.CYCLING.value:
+            routing_profile = obj_in.mode.value + "_" + obj_in.settings.cycling_profile.value
+        return routing_profile
+
+    def save_calculation(
+        self, db, obj_in: IsochroneDTO, current_user, isochrone_type, starting_point_geom
+    ):
+        obj_starting_point = models.IsochroneCalculation(
+            calculation_type=isochrone_type,
+            user_id=current_user.id,
+            scenario_id=None if obj_in.scenario.id == 0 else obj_in.scenario.id,
+            starting_point=starting_point_geom,
+            routing_profile=self.get_routing_profile(obj_in),
+            speed=obj_in.settings.speed,
+            modus=obj_in.scenario.modus.value,
+            parent_id=None,
+        )
+        db.add(obj_starting_point)
+        db.commit()
+
+    def get_cache_key(self, obj_in: IsochroneDTO, current_user, isochrone_type):
+        """
+        Key of the isochrone in the isochrone cache, None if the isochrone is not cached.
+        Only single walking and cycling isochrones without scenario network are cached, as their
+        starting point is snapped in the network store.
+        """
+        if (
+            not settings.ISOCHRONE_CACHE_SIZE
+            or not settings.ROUTING_NETWORK_STORE_ENABLED
+            or isochrone_type != IsochroneTypeEnum.single.value
+            or obj_in.mode.value not in [IsochroneMode.WALKING.value, IsochroneMode.CYCLING.value]
+            or obj_in.scenario.modus.value != CalculationTypes.default.value
+        ):
+            return None
+        routing_profile = self.get_routing_profile(obj_in)
+        speed = obj_in.settings.speed / 3.6
+        snapped_start = network_store.snap_start(
+            obj_in.starting_point.input[0].lon,
+            obj_in.starting_point.input[0].lat,
+            routing_profile,
+            speed,
+        )
+        if snapped_start is None:
+            return None
+        # The scenario id comes first, see IsochroneCache.get_path
+        return (
+            obj_in.scenario.id,
+            routing_profile,
+            round(speed, 3),
+            snapped_start,
+            obj_in.settings.travel_time,
+            obj_in.output.resolution,
+            tuple(sorted(current_user.active_data_upload_ids or [])),
+            isochrone_cache.get_version(),
+        )
+
     def read_network(
         self, db, obj_in: IsochroneDTO, current_user, isochrone_type, table_prefix=None
     ) -> Any:
         sql_text = ""
         if isochrone_type == IsochroneTypeEnum.single.value:
-            sql_text = f"""SELECT id, source, target, cost, reverse_cost, coordinates_3857 as geom, length_3857 AS length, starting_ids, starting_geoms
+            sql_text = f"""SELECT id, source, target, cost, reverse_cost, geom_3857 AS geom, length_3857 AS length, starting_ids, starting_geoms
             FROM basic.fetch_network_routing(ARRAY[:x],ARRAY[:y], :max_cutoff, :speed, :modus, :scenario_id, :routing_profile)
             """
         elif isochrone_type == IsochroneTypeEnum.multi.value:
-            sql_text = f"""SELECT id, source, target, cost, reverse_cost, coordinates_3857 as geom, length_3857 AS length, starting_ids, starting_geoms
+            sql_text = f"""SELECT id, source, target, cost, reverse_cost, geom_3857 AS geom, length_3857 AS length, starting_ids, starting_geoms
             FROM basic.fetch_network_routing_multi(:x,:y, :max_cutoff, :speed, :modus, :scenario_id, :routing_profile)
             """
         elif isochrone_type == IsochroneTypeEnum.heatmap.value:
             sql_text = f"""
-            SELECT id, source, target, cost, reverse_cost, coordinates_3857 as geom, length_3857 AS length, starting_ids, starting_geoms
+            SELECT id, source, target, cost, reverse_cost, geom_3857 AS geom, length_3857 AS length, starting_ids, starting_geoms
             FROM basic.fetch_network_routing_heatmap(:x,:y, :max_cutoff, :speed, :modus, :scenario_id, :routing_profile, :table_prefix)
             """
 
         read_network_sql = text(sql_text)
-        routing_profile = None
-        if obj_in.mode.value == IsochroneMode.WALKING.value:
-            routing_profile = obj_in.mode.value + "_" + obj_in.settings.walking_profile.value
-
-        if obj_in.mode.value == IsochroneMode.CYCLING.value:
-            routing_profile = obj_in.mode.value + "_" + obj_in.settings.cycling_profile.value
+        routing_profile = self.get_routing_profile(obj_in)
 
         x = y = None
         if (
@@ -153,27 +224,21 @@ class CRUDIsochrone:
             x = obj_in.starting_point.input[0].lon
             y = obj_in.starting_point.input[0].lat
 
-        edges_network = read_sql(
-            read_network_sql,
-            legacy_engine,
-            params={
-                "x": x,
-                "y": y,
-                "max_cutoff": obj_in.settings.travel_time * 60,  # in seconds
-                "speed": obj_in.settings.speed / 3.6,
-                "modus": obj_in.scenario.modus.value,
-                "scenario_id": obj_in.scenario.id,
-                "routing_profile": routing_profile,
-                "table_prefix": table_prefix,
-            },
-        )
-        starting_ids = edges_network.iloc[0].starting_ids
-        if len(obj_in.starting_point.input) == 1 and isinstance(
-            obj_in.starting_point.input[0], IsochroneStartingPointCoord
+        max_cutoff = obj_in.settings.travel_time * 60  # in seconds
+        speed = obj_in.settings.speed / 3.6
+        store_network = None
+        if (
+            settings.ROUTING_NETWORK_STORE_ENABLED
+            and isochrone_type == IsochroneTypeEnum.single.value
+            and obj_in.scenario.modus.value == CalculationTypes.default.value
         ):
+            store_network = network_store.read_network(x, y, max_cutoff, speed, routing_profile)
+
+        if store_network is not None:
+            edges_network, starting_ids, starting_point = store_network
             starting_point_geom = str(
                 GeoDataFrame(
-                    {"geometry": Point(edges_network.iloc[-1:]["geom"].values[0][0])},
+                    {"geometry": starting_point},
                     crs="EPSG:3857",
                     index=[0],
                 )
@@ -182,30 +247,49 @@ class CRUDIsochrone:
                 .iloc[0]
             )
         else:
-            starting_point_geom = str(edges_network["starting_geoms"].iloc[0])
+            edges_network = read_sql(
+                read_network_sql,
+                legacy_engine,
+                params={
+                    "x": x,
+                    "y": y,
+                    "max_cutoff": max_cutoff,
+                    "speed": speed,
+                    "modus": obj_in.scenario.modus.value,
+                    "scenario_id": obj_in.scenario.id,
+                    "routing_profile": routing_profile,
+                    "table_prefix": table_prefix,
+                },
+            )
+            starting_ids = edges_network.iloc[0].starting_ids
+            if len(obj_in.starting_point.input) == 1 and isinstance(
+                obj_in.starting_point.input[0], IsochroneStartingPointCoord
+            ):
+                starting_point_geom = str(
+                    GeoDataFrame(
+                        {"geometry": Point(wkb.loads(bytes(edges_network["geom"].iloc[-1])).coords[0])},
+                        crs="EPSG:3857",
+                        index=[0],
+                    )
+                    .to_crs("EPSG:4326")
+                    .to_wkt()["geometry"]
+                    .iloc[0]
+                )
+            else:
+                starting_point_geom = str(edges_network["starting_geoms"].iloc[0])
 
-        edges_network = edges_network.drop(["starting_ids", "starting_geoms"], axis=1)
+            # The first row only carries the starting ids and geometries
+            edges_network = edges_network.drop(["starting_ids", "starting_geoms"], axis=1)
+            edges_network = edges_network.iloc[1:, :]
 
         if (
             isochrone_type == IsochroneTypeEnum.single.value
             or isochrone_type == IsochroneTypeEnum.multi.value
         ):
-            obj_starting_point = models.IsochroneCalculation(
-                calculation_type=isochrone_type,
-                user_id=current_user.id,
-                scenario_id=None if obj_in.scenario.id == 0 else obj_in.scenario.id,
-                starting_point=starting_point_geom,
-                routing_profile=routing_profile,
-                speed=obj_in.settings.speed,
-                modus=obj_in.scenario.modus.value,
-                parent_id=None,
-            )
-
-            db.add(obj_starting_point)
-            db.commit()
+            self.save_calculation(db, obj_in, current_user, isochrone_type, starting_point_geom)
 
         # return edges_network and obj_starting_point
-        edges_network.astype(
+        edges_network = edges_network.astype(
             {
                 "id": np.int64,
                 "source": np.int64,
@@ -375,12 +459,53 @@ class CRUDIsochrone:
         else:
             isochrone_type = IsochroneTypeEnum.multi.value
 
+        cache_key = self.get_cache_key(obj_in, current_user, isochrone_type)
+        if cache_key is not None:
+            cached = isochrone_cache.get(cache_key)
+            if cached is not None:
+                starting_point_geom, result = cached
+                self.save_calculation(db, obj_in, current_user, isochrone_type, starting_point_geom)
+                # The callers replace entries of the result
+                return dict(result)
+
+        distance_tree = None
+        if (
+            settings.ROUTING_NETWORK_STORE_ENABLED
+            and isochrone_type == IsochroneTypeEnum.single.value
+            and obj_in.mode.value == IsochroneMode.WALKING.value
+            and obj_in.scenario.modus.value == CalculationTypes.default.value
+        ):
+            distance_tree = network_store.read_distance_tree(
+                obj_in.starting_point.input[0].lon,
+                obj_in.starting_point.input[0].lat,
+                obj_in.settings.travel_time,
+                obj_in.settings.speed / 3.6,
+                self.get_routing_profile(obj_in),
+            )
+
+        # == Walking isochrone from a shortest path tree of the same starting point ==
+        if distance_tree is not None:
+            tree, starting_point = distance_tree
+            starting_point_geom = str(
+                GeoDataFrame({"geometry": starting_point}, crs="EPSG:3857", index=[0])
+                .to_crs("EPSG:4326")
+                .to_wkt()["geometry"]
+                .iloc[0]
+            )
+            self.save_calculation(db, obj_in, current_user, isochrone_type, starting_point_geom)
+            speed = obj_in.settings.speed / 3.6
+            grid, network = distances_to_isochrone(
+                tree.network,
+                tree.get_distances(obj_in.settings.travel_time, speed),
+                obj_in.settings.travel_time,
+                speed,
+                obj_in.output.resolution,
+            )
         # == Walking and cycling isochrone ==
-        if obj_in.mode.value in [IsochroneMode.WALKING.value, IsochroneMode.CYCLING.value]:
+        elif obj_in.mode.value in [IsochroneMode.WALKING.value, IsochroneMode.CYCLING.value]:
             network, starting_ids, starting_point_geom = self.read_network(
                 db, obj_in, current_user, isochrone_type
             )
-            network = network.iloc[1:, :]
             grid, network = compute_isochrone(
                 network,
                 starting_ids,
@@ -458,7 +583,10 @@ class CRUDIsochrone:
             }
         else:
             isochrone_shapes = generate_jsolines(
-                grid=grid, travel_time=obj_in.settings.travel_time, percentile=5
+                grid=grid,
+                travel_time=obj_in.settings.travel_time,
+                percentile=5,
+                simplify_tolerance=settings.ISOCHRONE_SIMPLIFY_TOLERANCE,
             )
             group_by_column = "minute"
         # Opportunity intersect
@@ -589,7 +717,7 @@ class CRUDIsochrone:
                 "distance": obj_in.settings.buffer_distance,
                 "geojson": isochrone_shapes["full"].to_json(),
             }
-        grid_encoded = encode_r5_grid(grid)
+        grid_encoded = encode_r5_grid(grid, settings.ISOCHRONE_GRID_COMPRESSION)
         if isochrone_type == IsochroneTypeEnum.single.value:
             geojson_result = self.build_geojson_single(isochrone_shapes, opportunities)
         elif isochrone_type == IsochroneTypeEnum.multi.value:
@@ -600,8 +728,171 @@ class CRUDIsochrone:
             "geojson": geojson_result,
             "network": network,
         }
+        if cache_key is not None:
+            isochrone_cache.put(cache_key, (starting_point_geom, dict(result)))
         return result
 
+    def calculate_batch(
+        self, db: AsyncSession, obj_in: IsochroneBatchDTO, current_user: models.User
+    ) -> Any:
+        """
+        Calculate a separate isochrone for every starting point with common settings. The network
+        around all starting points is read once and the searches run in one parallel pass, the
+        opportunities of all isochrones are read once.
+
+        :return: Zip of the grids (grid_<index>.bin) and GeoJSON of all isochrones with the index of their starting point
+        """
+        travel_time = obj_in.settings.travel_time
+        speed = obj_in.settings.speed / 3.6
+        routing_profile = self.get_routing_profile(obj_in)
+        x = [point.lon for point in obj_in.starting_points]
+        y = [point.lat for point in obj_in.starting_points]
+        store_network = None
+        if (
+            settings.ROUTING_NETWORK_STORE_ENABLED
+            and obj_in.scenario.modus.value == CalculationTypes.default.value
+        ):
+            store_network = network_store.read_network_multi(
+                x, y, travel_time * 60, speed, routing_profile
+            )
+        if store_network is None:
+            # Scenario networks are read for every starting point
+            results = {}
+            for index, point in enumerate(obj_in.starting_points):
+                results[index] = self.calculate(
+                    db, obj_in.to_single(point), current_user, study_area_bounds=None
+                )
+            return self.build_batch_result(results)
+
+        edges_network, starting_ids, _ = store_network
+        network = PreparedNetwork.from_dataframe(edges_network)
+        start_vertices, valid_starts = network.get_node_index(starting_ids)
+        valid_starts &= np.asarray(starting_ids) != -1
+        start_indices = np.flatnonzero(valid_starts)
+        reached, search_index = dijkstra_many(
+            start_vertices[start_indices], network.graph, travel_time
+        )
+
+        isochrone_shapes = {}
+        grids = {}
+        for i, index in enumerate(start_indices):
+            distances = reached_to_distances(reached, search_index[i], network.n_nodes)
+            grid, _ = distances_to_isochrone(
+                network,
+                distances,
+                travel_time,
+                speed,
+                obj_in.output.resolution,
+                return_network=False,
+            )
+            grids[index] = grid
+            isochrone_shapes[index] = generate_jsolines(
+                grid=grid,
+                travel_time=travel_time,
+                percentile=5,
+                simplify_tolerance=settings.ISOCHRONE_SIMPLIFY_TOLERANCE,
+            )
+        if not grids:
+            return self.build_batch_result({})
+
+        # Intersect the opportunities with the isochrones of all starting points at once
+        incremental = pd.concat(
+            [shapes["incremental"].assign(start=index) for index, shapes in isochrone_shapes.items()],
+            ignore_index=True,
+        )
+        opportunity_count = OpportunityIsochroneCount(
+            input_geometries=incremental,
+            user_id=current_user.id,
+            user_active_upload_ids=current_user.active_data_upload_ids,
+            scenario_id=obj_in.scenario.id,
+        )
+        poi_gdf = opportunity_count.poi()
+        population_gdf = opportunity_count.population()
+        aoi_gdf = opportunity_count.aoi()
+        poi_gdf_start = dict(tuple(poi_gdf.groupby("start")))
+        population_gdf_start = dict(tuple(population_gdf.groupby("start")))
+        aoi_gdf_start = {} if aoi_gdf is None else dict(tuple(aoi_gdf.groupby("start")))
+
+        results = {}
+        for index, grid in grids.items():
+            opportunities = [
+                opportunity_count.count_poi("minute", poi_gdf_start.get(index, poi_gdf.iloc[:0])),
+                opportunity_count.count_population(
+                    ["minute"], population_gdf_start.get(index, population_gdf.iloc[:0])
+                ),
+            ]
+            if index in aoi_gdf_start:
+                opportunities.append(
+                    opportunity_count.count_aoi(["minute", "category"], aoi_gdf_start[index])
+                )
+            opportunities = self.restructure_dict(merge_dicts(*opportunities), step=1)
+            grid["accessibility"] = {
+                "starting_points": Point(x[index], y[index]).wkt,
+                "opportunities": opportunities,
+            }
+            results[index] = {
+                "grid": encode_r5_grid(grid, settings.ISOCHRONE_GRID_COMPRESSION),
+                "geojson": self.build_geojson_single(isochrone_shapes[index], opportunities),
+            }
+        return self.build_batch_result(results)
+
+    def calculate_od_matrix(self, obj_in: ODMatrixDTO) -> np.ndarray:
+        """
+        Calculate the travel times from every origin to every destination. Origins and destinations
+        are snapped once to a network read from the store, every search stops as soon as all
+        destinations are settled or the travel time is reached.
+
+        :return: Travel times in minutes (origins x destinations, inf if not reached within the travel time)
+        """
+        if not settings.ROUTING_NETWORK_STORE_ENABLED:
+            raise HTTPException(
+                status_code=400, detail="Travel time matrices require the routing network store"
+            )
+        travel_time = obj_in.settings.travel_time
+        speed = obj_in.settings.speed / 3.6
+        points = obj_in.origins + obj_in.destinations
+        store_network = network_store.read_network_multi(
+            [point.lon for point in points],
+            [point.lat for point in points],
+            travel_time * 60,
+            speed,
+            self.get_routing_profile(obj_in),
+        )
+        if store_network is None:
+            raise HTTPException(
+                status_code=400, detail="Origins and destinations are outside of the routing network"
+            )
+        edges_network, point_ids, _ = store_network
+        point_ids = np.asarray(point_ids)
+        n_origins = len(obj_in.origins)
+        return compute_od_matrix(
+            PreparedNetwork.from_dataframe(edges_network),
+            point_ids[:n_origins],
+            point_ids[n_origins:],
+            travel_time,
+        )
+
+    def build_batch_result(self, results: dict) -> dict:
+        """
+        Combine the results of the batch isochrones
+
+        :param results: Result (grid and geojson) of every starting point index
+        """
+        grids = io.BytesIO()
+        features = []
+        with zipfile.ZipFile(grids, "w") as zip_file:
+            for index, result in sorted(results.items()):
+                zip_file.writestr(f"grid_{index}.bin", result["grid"])
+                # The results may come from the isochrone cache, the features are copied
+                for feature in result["geojson"]["features"]:
+                    properties = feature["properties"] | {"start": int(index)}
+                    features.append(feature | {"properties": properties})
+        return {
+            "grid": grids.getvalue(),
+            "geojson": {"type": "FeatureCollection", "features": features},
+            "network": None,
+        }
+
     def build_geojson_single(self, isochrone_shapes, opportunities):
         geojson = json.loads(isochrone_shapes["full"].to_json())
         for key, opportunity in opportunities.items():
@@ -11,6 +11,7 @@ from sqlalchemy import and_, func, or_, text
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.sql import delete, select
 from src import schemas
+from src.core.isochrone_cache import isochrone_cache
 from src.core.opportunity import opportunity
 from src.core.config import settings
 from src.crud.base import CRUDBase
@@ -122,6 +123,7 @@ class CRUDScenario(CRUDBase[models.Scenario, schemas.ScenarioCreate, schemas.Sce
         layer = scenario_layer_models[layer_name.value]
         await db.execute(delete(layer).where(layer.scenario_id == scenario_id))
         await db.commit()
+        isochrone_cache.invalidate(scenario_id)
         scenario_dir = f"{settings.CACHE_PATH}/user/scenario/{scenario_id}"
         shutil.rmtree(scenario_dir, ignore_errors=True)
         return {"msg": "Features deleted successfully"}
@@ -140,6 +142,7 @@ class CRUDScenario(CRUDBase[models.Scenario, schemas.ScenarioCreate, schemas.Sce
             delete(layer).where(and_(layer.id.in_(feature_ids), layer.scenario_id == scenario_id))
         )
         await db.commit()
+        isochrone_cache.invalidate(scenario_id)
         if layer_name.value == schemas.ScenarioLayerFeatureEnum.population_modified.value:
             await db.execute(func.basic.population_modification(scenario_id))
             await db.commit()
@@ -224,6 +227,7 @@ class CRUDScenario(CRUDBase[models.Scenario, schemas.ScenarioCreate, schemas.Sce
 
         db.add_all(features_in_db)
         await db.commit()
+        isochrone_cache.invalidate(scenario_id)
         # Execute population distribution on population modified
         if layer_name.value in (
             schemas.ScenarioLayerFeatureEnum.building_modified.value,
@@ -300,6 +304,7 @@ class CRUDScenario(CRUDBase[models.Scenario, schemas.ScenarioCreate, schemas.Sce
 
         db.add_all(features_in_db)
         await db.commit()
+        isochrone_cache.invalidate(scenario_id)
 
         # Execute population distribution on population modified
         if layer_name.value in (
@@ -331,6 +336,7 @@ class CRUDScenario(CRUDBase[models.Scenario, schemas.ScenarioCreate, schemas.Sce
         if statement.is_delete == True:
             # Remove scenario cache
             for id in ids:
+                isochrone_cache.invalidate(id)
                 scenario_dir = f"{settings.CACHE_PATH}/user/scenario/{id}"
                 shutil.rmtree(scenario_dir, ignore_errors=True)
         else:
@@ -7,6 +7,7 @@ from ._link_model import (
 from .aoi import Aoi, AoiBase, AoiModified, AoiUser
 from .building import Building, BuildingBase, BuildingModified
 from .customization import Customization, CustomizationBase, UserCustomization
+from .data_version import DataVersion
 from .data_upload import DataUpload
 from .edge import Edge, EdgeBase, WayModified
 from .geostore import Geostore
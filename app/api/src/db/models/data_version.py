@@ -0,0 +1,14 @@
+from sqlmodel import BigInteger, Column, Field, SQLModel, Text, text
+
+
+class DataVersion(SQLModel, table=True):
+    """
+    Version counters of the source data, increased by basic.trigger_data_version in the
+    transaction of every change.
+    """
+
+    __tablename__ = "data_version"
+    __table_args__ = {"schema": "basic"}
+
+    name: str = Field(sa_column=Column(Text, primary_key=True))
+    version: int = Field(sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
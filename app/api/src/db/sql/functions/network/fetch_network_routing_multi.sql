@@ -15,12 +15,12 @@ BEGIN
 
 	/*Fetch Network*/
 	RETURN query EXECUTE 
-	'SELECT 1, 1, 1, 1, 1, 1, NULL, ''[[1.1,1.1],[1.1,1.1]]''::json, $1, $2
+	'SELECT 1, 1, 1, 1, 1, 1, NULL, NULL::bytea, $1, $2
 	 UNION ALL ' || 
 	basic.query_edges_routing(ST_ASTEXT(union_buffer_network),modus,scenario_id,speed,routing_profile,True) || 
     ' AND id NOT IN (SELECT wid FROM artificial_edges WHERE wid IS NOT NULL)
 	UNION ALL 
-	SELECT id, source, target, ST_LENGTH(ST_TRANSFORM(geom, 3857)) AS length_3857, cost, reverse_cost, NULL AS death_end, ST_AsGeoJSON(ST_Transform(geom,3857))::json->''coordinates'', NULL AS starting_ids, NULL AS starting_geoms
+	SELECT id, source, target, ST_LENGTH(ST_TRANSFORM(geom, 3857)) AS length_3857, cost, reverse_cost, NULL AS death_end, ST_AsBinary(ST_Transform(geom,3857)), NULL AS starting_ids, NULL AS starting_geoms
 	FROM artificial_edges 
 	WHERE wid IS NOT NULL' USING (SELECT array_agg(s.id) FROM starting_vertices s), (SELECT array_agg(ST_ASTEXT(s.geom)) FROM starting_vertices s); 
 
@@ -15,7 +15,7 @@ DECLARE
 	sql_select_ways text;
 	sql_cost TEXT;
 	time_loss_intersections jsonb := '{}'::jsonb;
-	geom_column TEXT = 'geom';
+	sql_geom_column TEXT = 'geom';
 	setting_study_area_id integer;
 
 BEGIN 
@@ -74,12 +74,12 @@ BEGIN
 	END IF;
 	
 	IF coordinates_only = TRUE THEN
-		geom_column = 'coordinates_3857'; 
+		sql_geom_column = 'ST_AsBinary(ST_Transform(geom, 3857))'; 
 	END IF; 
 
 
 	sql_select_ways = 
-		'SELECT id::integer, source, target, length_3857,'||sql_cost||',death_end,'||quote_ident(geom_column)||', NULL AS starting_ids, NULL AS starting_geoms
+		'SELECT id::integer, source, target, length_3857,'||sql_cost||',death_end,'||sql_geom_column||', NULL AS starting_ids, NULL AS starting_geoms
 		FROM basic.edge
 		WHERE class_id NOT IN ('||excluded_class_id||')
     	AND ('||quote_ident(category)||' NOT IN ('||filter_categories||') 
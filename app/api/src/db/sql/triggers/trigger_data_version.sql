@@ -0,0 +1,39 @@
+CREATE OR REPLACE FUNCTION basic.trigger_data_version() 
+RETURNS TRIGGER AS $trigger_data_version$
+BEGIN
+	-- The trigger arguments are the names of the versions that depend on the table
+	UPDATE basic.data_version SET version = version + 1 WHERE name = ANY(TG_ARGV); 
+	RETURN NULL;
+END;
+$trigger_data_version$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_data_version ON basic.edge; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON basic.edge
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('edge', 'isochrone');
+
+DROP TRIGGER IF EXISTS trigger_data_version ON basic.poi; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON basic.poi
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('isochrone');
+
+DROP TRIGGER IF EXISTS trigger_data_version ON basic.aoi; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON basic.aoi
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('isochrone');
+
+DROP TRIGGER IF EXISTS trigger_data_version ON basic.population; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON basic.population
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('isochrone');
+
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.poi_user; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON customer.poi_user
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('isochrone');
+
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.aoi_user; 
+CREATE TRIGGER trigger_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON customer.aoi_user
+FOR EACH STATEMENT EXECUTE PROCEDURE basic.trigger_data_version('isochrone');
+
+-- Scenario results are invalidated per scenario, the scenario tables don't raise the versions
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.way_modified; 
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.poi_modified; 
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.aoi_modified; 
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.population_modified; 
+DROP TRIGGER IF EXISTS trigger_data_version ON customer.building_modified; 
@@ -111,6 +111,37 @@ async def create_opportunity_matrices(
     return JSONResponse("Ok")
 
 
+@router.post("/opportunity-matrices/regions")
+async def create_opportunity_matrices_regions(
+    *,
+    current_super_user: models.User = Depends(deps.get_current_active_superuser),
+    parameters: schemas.OpportunityMatrixParameters = Body(
+        ..., examples=schemas.examples["opportunity_matrix"]
+    )
+):
+    """
+    Opportunity matrices for regions of spatially ordered bulks, one task per region.
+    The tasks read the travel time matrices of neighbouring bulks once instead of once per bulk.
+    """
+    crud_compute_heatmap = ComputeHeatmap(current_super_user)
+    bulk_ids = crud_compute_heatmap.order_bulk_ids(parameters.bulk_id)
+    parameters = json.loads(parameters.json())
+    parameters_serialized = parameters.copy()
+    current_super_user = json.loads(current_super_user.json())
+    region_size = settings.OPPORTUNITY_MATRIX_REGION_SIZE
+    for i in range(0, len(bulk_ids), region_size):
+        parameters_serialized["bulk_id"] = bulk_ids[i : i + region_size]
+        if settings.CELERY_BROKER_URL:
+            heatmap_active_mobility.create_opportunity_matrices_region_sync.delay(
+                current_super_user, parameters_serialized
+            )
+        else:
+            await method_connector.create_opportunity_matrices_region_async(
+                current_super_user, parameters_serialized
+            )
+    return JSONResponse("Ok")
+
+
 @router.post("/connectivity-matrices")
 async def create_connectivity_matrices(
     *,
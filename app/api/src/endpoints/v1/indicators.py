@@ -24,9 +24,11 @@ from src.schemas.indicators import (
 )
 
 from src.schemas.isochrone import (
+    IsochroneBatchDTO,
     IsochroneDTO,
     IsochroneMultiCountPois,
     IsochroneOutputType,
+    ODMatrixDTO,
     request_examples,
 )
 from src.schemas.utils import validate_return_type
@@ -44,7 +46,11 @@ from src.workers.read_heatmap import (
 from src.workers.celery_app import celery_app
 from celery.result import AsyncResult
 
-from src.workers.isochrone import task_calculate_isochrone
+from src.workers.isochrone import (
+    task_calculate_isochrone,
+    task_calculate_isochrone_batch,
+    task_calculate_od_matrix,
+)
 
 
 router = APIRouter()
@@ -84,6 +90,67 @@ async def calculate_isochrone(
         return {"task_id": task.id}
 
 
+@router.post("/isochrone/batch")
+async def calculate_isochrone_batch(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    isochrone_in: IsochroneBatchDTO = Body(..., examples=request_examples["isochrone_batch"]),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Calculate a separate isochrone for every starting point with common settings.
+    The grids are returned as zip (grid_<index>.bin), the GeoJSON features have the index of their starting point.
+    """
+    if isochrone_in.scenario.id:
+        await deps.check_user_owns_scenario(db, isochrone_in.scenario.id, current_user)
+
+    user_access_starting_point = await crud.user.user_study_area_starting_point_access(
+        db, current_user.id, isochrone_in.starting_points
+    )
+    if not user_access_starting_point:
+        raise HTTPException(detail="User has no access to starting points", status_code=403)
+
+    isochrone_in = json.loads(isochrone_in.json())
+    current_user = json.loads(current_user.json())
+
+    if not settings.CELERY_BROKER_URL:
+        results = task_calculate_isochrone_batch(isochrone_in, current_user)
+        return read_results(results)
+
+    else:
+        task = task_calculate_isochrone_batch.delay(isochrone_in, current_user)
+        return {"task_id": task.id}
+
+
+@router.post("/od-matrix")
+async def calculate_od_matrix(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    od_matrix_in: ODMatrixDTO = Body(..., examples=request_examples["od_matrix"]),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Calculate the walking or cycling travel times from every origin to every destination.
+    npy returns the dense matrix in minutes (NaN if not reached within the travel time),
+    arrow and csv return the origin index, destination index and travel time of the reached pairs.
+    """
+    user_access_starting_point = await crud.user.user_study_area_starting_point_access(
+        db, current_user.id, od_matrix_in.origins + od_matrix_in.destinations
+    )
+    if not user_access_starting_point:
+        raise HTTPException(detail="User has no access to origins or destinations", status_code=403)
+
+    od_matrix_in = json.loads(od_matrix_in.json())
+
+    if not settings.CELERY_BROKER_URL:
+        results = task_calculate_od_matrix(od_matrix_in)
+        return read_results(results)
+
+    else:
+        task = task_calculate_od_matrix.delay(od_matrix_in)
+        return {"task_id": task.id}
+
+
 @router.post("/isochrone/multi/count-pois", response_class=JSONResponse)
 async def count_pois_multi_isochrones(
     *,
@@ -1,12 +1,11 @@
 from typing import Any, Dict
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from starlette.responses import JSONResponse
 import json
-import binascii
 from src import crud
 from src.workers.isochrone import task_calculate_isochrone
 from src.db import models
@@ -19,7 +18,7 @@ from src.schemas.isochrone import (
     request_examples,
 )
 from src.db.session import sync_session
-from src.utils import return_geojson_or_geobuf
+from src.utils import read_results, return_geojson_or_geobuf
 
 router = APIRouter()
 
@@ -54,8 +53,7 @@ async def get_task(
     if task.ready():
         try:
             result = task.get()
-            response = Response(bytes(binascii.unhexlify(bytes(result, 'utf-8'))), media_type="application/octet-stream")
-            return response
+            return read_results(result, "grid")
         except Exception as e:
             raise HTTPException(status_code=500, detail="Task failed")
 
@@ -5,121 +5,146 @@ Translated from https://github.com/goat-community/goat/blob/0089611acacbebf4e297
 import math
 
 import numpy as np
+import shapely
 from geopandas import GeoDataFrame
-from numba import njit
-from shapely.geometry import shape
+from numba import njit, prange
+from shapely.geometry import MultiPolygon
 
-from src.utils import compute_r5_surface, coordinate_from_pixel, decode_r5_grid
+from src.utils import (
+    compute_r5_surface,
+    decode_r5_grid,
+    pixel_x_to_web_mercator_x,
+    pixel_y_to_web_mercator_y,
+    z_scale,
+)
 
 MAX_COORDS = 20000
+MIN_FRACTION = 0.001
 
 
-@njit
-def get_contour(surface, width, height, cutoff):
+def get_band_index(surface, width, height, cutoffs):
     """
-    Get a contouring grid. Exported for testing purposes, not generally used
-    outside jsolines testing
-    """
-    contour = np.zeros((width - 1) * (height - 1), dtype=np.int8)
-
-    # compute contour values for each cell
-    for x in range(width - 1):
-        for y in range(height - 1):
-            index = y * width + x
-            topLeft = surface[index] < cutoff
-            topRight = surface[index + 1] < cutoff
-            botLeft = surface[index + width] < cutoff
-            botRight = surface[index + width + 1] < cutoff
-
-            # if we're at the edge of the area, set the outer sides to false, so that
-            # isochrones always close even when they actually extend beyond the edges
-            # of the surface
+    Classify every grid point against all cutoffs at once. The band index is the number of
+    cutoffs the value is not below, so a point lies inside the isoline of the k-th cutoff
+    if its band index is at most k.
 
-            if x == 0:
-                topLeft = botLeft = False
-            if x == width - 2:
-                topRight = botRight = False
-            if y == 0:
-                topLeft = topRight = False
-            if y == height - 2:
-                botRight = botLeft = False
+    The edges of the surface are set outside of all isolines, so that isochrones always close
+    even when they actually extend beyond the edges of the surface.
 
-            idx = 0
+    :param surface: Flat surface of width * height values
+    :param cutoffs: Sorted cutoff values
 
-            if topLeft:
-                idx |= 1 << 3
-            if topRight:
-                idx |= 1 << 2
-            if botRight:
-                idx |= 1 << 1
-            if botLeft:
-                idx |= 1
-
-            contour[y * (width - 1) + x] = idx
+    :return: Flat array of band indices
+    """
+    band = np.searchsorted(cutoffs, surface, side="right").astype(np.int32)
+    band_2d = band.reshape(height, width)
+    band_2d[0, :] = band_2d[-1, :] = len(cutoffs)
+    band_2d[:, 0] = band_2d[:, -1] = len(cutoffs)
+    return band
 
-    return contour
 
+@njit(cache=True)
+def get_cell_index(band, width, x, y, level):
+    """
+    Marching squares index of the cell at x, y for one level
+    """
+    index = y * width + x
+    idx = 0
+    if band[index] <= level:
+        idx |= 1 << 3
+    if band[index + 1] <= level:
+        idx |= 1 << 2
+    if band[index + width + 1] <= level:
+        idx |= 1 << 1
+    if band[index + width] <= level:
+        idx |= 1
+    return idx
+
+
+@njit(cache=True)
+def get_level_cells(band, width, height, n_levels):
+    """
+    Cells that have a line in them, grouped by level. A cell has a line for every level
+    between the lowest and the highest band index of its corners.
 
-@njit
-def followLoop(idx, xy, prev_xy):
+    :return: Offsets of every level and the cell indices (sorted by row and column within a level)
+    """
+    cWidth = width - 1
+    n_cells = (width - 1) * (height - 1)
+    band_min = np.empty(n_cells, np.int32)
+    band_max = np.empty(n_cells, np.int32)
+    level_offsets = np.zeros(n_levels + 1, np.int64)
+    for y in range(height - 1):
+        for x in range(width - 1):
+            index = y * width + x
+            lo = min(band[index], band[index + 1], band[index + width], band[index + width + 1])
+            hi = max(band[index], band[index + 1], band[index + width], band[index + width + 1])
+            band_min[y * cWidth + x] = lo
+            band_max[y * cWidth + x] = hi
+            for level in range(lo, hi):
+                level_offsets[level + 1] += 1
+    level_offsets = np.cumsum(level_offsets)
+
+    level_cells = np.empty(level_offsets[-1], np.int64)
+    position = level_offsets[:-1].copy()
+    for cell in range(n_cells):
+        for level in range(band_min[cell], band_max[cell]):
+            level_cells[position[level]] = cell
+            position[level] += 1
+    return level_offsets, level_cells
+
+
+@njit(cache=True)
+def followLoop(idx, x, y, prevx, prevy):
     """
     Follow the loop
     We keep track of which contour cell we're in, and we always keep the filled
     area to our left. Thus we always indicate only which direction we exit the
     cell.
     """
-    x = xy[0]
-    y = xy[1]
-    prevx = prev_xy[0]
-    prevy = prev_xy[1]
-
     if idx in (1, 3, 7):
-        return [x - 1, y]
+        return x - 1, y
     elif idx in (2, 6, 14):
-        return [x, y + 1]
+        return x, y + 1
     elif idx in (4, 12, 13):
-        return [x + 1, y]
+        return x + 1, y
     elif idx == 5:
         # Assume that saddle has // orientation (as opposed to \\). It doesn't
         # really matter if we're wrong, we'll just have two disjoint pieces
         # where we should have one, or vice versa.
         # From Bottom:
         if prevy > y:
-            return [x + 1, y]
+            return x + 1, y
 
         # From Top:
         if prevy < y:
-            return [x - 1, y]
+            return x - 1, y
 
-        return [x, y]
+        return x, y
     elif idx in (8, 9, 11):
-        return [x, y - 1]
+        return x, y - 1
     elif idx == 10:
         # From left
         if prevx < x:
-            return [x, y + 1]
+            return x, y + 1
 
         # From right
         if prevx > x:
-            return [x, y - 1]
+            return x, y - 1
 
-        return [x, y]
+        return x, y
 
     else:
-        return [x, y]
+        return x, y
 
 
-@njit
-def interpolate(pos, cutoff, start, surface, width, height):
+@njit(cache=True)
+def interpolate(x, y, cutoff, startx, starty, surface, width, height):
     """
     Do linear interpolation
     """
     #   The edges are always considered unreachable to avoid edge effects so set
     #   them to the cutoff.
-    x = pos[0]
-    y = pos[1]
-    startx = start[0]
-    starty = start[1]
     index = y * width + x
     topLeft = surface[index]
     topRight = surface[index + 1]
@@ -136,196 +161,482 @@ def interpolate(pos, cutoff, start, surface, width, height):
     # From left
     if startx < x:
         frac = (cutoff - topLeft) / (botLeft - topLeft)
-        return [x, y + ensureFractionIsNumber(frac, "left")]
+        return x, y + ensureFractionIsNumber(frac, "left")
     # From right
     if startx > x:
         frac = (cutoff - topRight) / (botRight - topRight)
-        return [x + 1, y + ensureFractionIsNumber(frac, "right")]
+        return x + 1, y + ensureFractionIsNumber(frac, "right")
     # From bottom
     if starty > y:
         frac = (cutoff - botLeft) / (botRight - botLeft)
-        return [x + ensureFractionIsNumber(frac, "bottom"), y + 1]
+        return x + ensureFractionIsNumber(frac, "bottom"), y + 1
     # From top
-    if starty < y:
-        frac = (cutoff - topLeft) / (topRight - topLeft)
-        return [x + ensureFractionIsNumber(frac, "top"), y]
-    pass
-
-
-@njit
-def noInterpolate(pos, start):
-    x = pos[0]
-    y = pos[1]
-    startx = start[0]
-    starty = start[1]
+    frac = (cutoff - topLeft) / (topRight - topLeft)
+    return x + ensureFractionIsNumber(frac, "top"), y
+
+
+@njit(cache=True)
+def noInterpolate(x, y, startx, starty):
     # From left
     if startx < x:
-        return [x, y + 0.5]
+        return x, y + 0.5
     # From right
     if startx > x:
-        return [x + 1, y + 0.5]
+        return x + 1, y + 0.5
     # From bottom
     if starty > y:
-        return [x + 0.5, y + 1]
+        return x + 0.5, y + 1
     # From top
-    if starty < y:
-        return [x + 0.5, y]
-    pass
+    return x + 0.5, y
 
 
 # Calculated fractions may not be numbers causing interpolation to fail.
-@njit
+# Lines are kept off the grid points, rings would touch where the surface equals the cutoff.
+@njit(cache=True)
 def ensureFractionIsNumber(frac, direction):
     if math.isnan(frac) or math.isinf(frac):
         return 0.5
-    return frac
+    return min(max(frac, MIN_FRACTION), 1 - MIN_FRACTION)
 
 
-@njit
-def calculate_jsolines(
-    surface, width, height, west, north, zoom, cutoffs, interpolation=True, web_mercator=True
+@njit(cache=True)
+def get_saddle_piece(idx, x, y, prevx, prevy):
+    """
+    Saddles have two line pieces, we tell them apart by the side we enter the cell from.
+    Other cells only have one.
+    """
+    if idx == 5:
+        # From Bottom or from Top
+        return 1 if prevy > y else 2
+    if idx == 10:
+        # From left or from right
+        return 1 if prevx < x else 2
+    return 1
+
+
+@njit(cache=True)
+def trace_ring(
+    level,
+    cutoff,
+    band,
+    surface,
+    width,
+    height,
+    west,
+    north,
+    cells,
+    interpolation,
+    found,
+    coords,
+    n_coords,
+    position,
+    prevx,
+    prevy,
 ):
-    geometries = []
-    for _, cutoff in np.ndenumerate(cutoffs):
-        contour = get_contour(surface, width, height, cutoff)
-        cWidth = width - 1
-        # Store warnings
-        warnings = []
-
-        # JavaScript does not have boolean arrays.
-        found = np.zeros((width - 1) * (height - 1), dtype=np.int8)
-
-        # DEBUG, comment out to save memory
-        indices = []
-
-        # We'll sort out what shell goes with what hole in a bit.
-        shells = []
-        holes = []
-
-        # Find a cell that has a line in it, then follow that line, keeping filled
-        # area to your left. This lets us use winding direction to determine holes.
-
-        for origy in range(height - 1):
-            for origx in range(width - 1):
-                index = origy * cWidth + origx
-                if found[index] == 1:
-                    continue
-                idx = contour[index]
+    """
+    Follow the line from the cell at position, entered from prevx, prevy, keeping the filled
+    area to our left until we are back at the start.
 
-                # Continue if there is no line here or if it's a saddle, as we don't know which way the saddle goes.
-                if idx == 0 or idx == 5 or idx == 10 or idx == 15:
+    :param found: Line pieces already followed for every cell
+    :param n_coords: Number of coordinates in the buffer before the ring
+
+    :return: Number of coordinates after the ring (unchanged if the ring is discarded) and the winding direction
+    """
+    cWidth = width - 1
+    origx = cells[position] % cWidth
+    origy = cells[position] // cWidth
+    x, y = origx, origy
+    startx, starty = prevx, prevy
+    idx = get_cell_index(band, width, x, y, level)
+    origin_piece = get_saddle_piece(idx, x, y, startx, starty)
+    ring_coords_start = n_coords
+
+    # Track winding direction
+    direction = 0
+
+    # Make sure we're not traveling in circles.
+    while n_coords < len(coords) - 1:
+        piece = get_saddle_piece(idx, x, y, startx, starty)
+        if found[position] & piece:
+            break
+        found[position] |= piece
+
+        prevx, prevy = startx, starty
+        startx, starty = x, y
+
+        # Follow the loop
+        x, y = followLoop(idx, x, y, prevx, prevy)
+
+        # Keep track of winding direction
+        direction += (x - startx) * (y + starty)
+
+        # Unexpected coordinate shift, discarding ring
+        if x == startx and y == starty:
+            break
+
+        # Shift exact coordinates
+        if interpolation:
+            coordx, coordy = interpolate(x, y, cutoff, startx, starty, surface, width, height)
+        else:
+            coordx, coordy = noInterpolate(x, y, startx, starty)
+        coords[n_coords, 0] = coordx + west
+        coords[n_coords, 1] = coordy + north
+        n_coords += 1
+
+        idx = get_cell_index(band, width, x, y, level)
+
+        # We're back at the start of the ring
+        if x == origx and y == origy and get_saddle_piece(idx, x, y, startx, starty) == origin_piece:
+            # close the ring
+            coords[n_coords] = coords[ring_coords_start]
+            return n_coords + 1, direction
+
+        # Ran off outside of ring
+        if idx == 0 or idx == 15:
+            break
+        position = np.searchsorted(cells, y * cWidth + x)
+
+    return ring_coords_start, direction
+
+
+@njit(cache=True)
+def trace_level(
+    level,
+    cutoff,
+    band,
+    surface,
+    width,
+    height,
+    west,
+    north,
+    cells,
+    interpolation,
+    coords,
+    ring_start,
+    ring_end,
+    ring_shell,
+):
+    """
+    Trace the rings of one level. We'll sort out what shell goes with what hole later.
+
+    :param cells: Cells with a line in them at this level
+    :param coords: Buffer for the pixel coordinates of the rings, 3 rows per cell
+    :param ring_start: Buffer for the first coordinate of every ring
+    :param ring_end: Buffer for the end of the coordinates of every ring
+    :param ring_shell: Buffer for the winding direction of every ring, True for shells
+
+    :return: Number of rings
+    """
+    cWidth = width - 1
+    found = np.zeros(len(cells), dtype=np.uint8)
+    n_coords = 0
+    n_rings = 0
+
+    # Find a cell that has a line in it, then follow that line, keeping filled
+    # area to your left. This lets us use winding direction to determine holes.
+    # Saddles are left for the second pass, as we don't know which way the saddle goes.
+    # Rings that only pass saddles are followed from both sides of their saddles.
+    for saddles in (False, True):
+        for i in range(len(cells)):
+            if found[i] == 3 or n_rings == len(ring_start):
+                continue
+            x = cells[i] % cWidth
+            y = cells[i] // cWidth
+            idx = get_cell_index(band, width, x, y, level)
+            if (idx == 5 or idx == 10) != saddles:
+                continue
+
+            for piece in (1, 2):
+                if found[i] & piece or (piece == 2 and not saddles):
+                    continue
+                if idx == 5:
+                    prevx, prevy = x, (y + 1 if piece == 1 else y - 1)
+                elif idx == 10:
+                    prevx, prevy = (x - 1 if piece == 1 else x + 1), y
+                else:
+                    prevx = prevy = -1
+                ring_end_coords, direction = trace_ring(
+                    level,
+                    cutoff,
+                    band,
+                    surface,
+                    width,
+                    height,
+                    west,
+                    north,
+                    cells,
+                    interpolation,
+                    found,
+                    coords,
+                    n_coords,
+                    i,
+                    prevx,
+                    prevy,
+                )
+                if ring_end_coords == n_coords:
                     continue
+                ring_start[n_rings] = n_coords
+                ring_end[n_rings] = ring_end_coords
+                # Check winding direction. Positive here means counter clockwise,
+                # see http:#stackoverflow.com/questions/1165647
+                # +y is down so the signs are reversed from what would be expected
+                ring_shell[n_rings] = direction > 0
+                n_rings += 1
+                n_coords = ring_end_coords
+                if n_rings == len(ring_start):
+                    break
+
+    return n_rings
+
+
+@njit(parallel=True, cache=True)
+def trace_levels(band, surface, width, height, west, north, cutoffs, level_offsets, level_cells, interpolation):
+    """
+    Trace the rings of all levels in one sweep, the levels are independent and traced in parallel.
+    Every level writes into its own part of the buffers, ring indices are relative to the level.
+    """
+    n_levels = len(cutoffs)
+    n_cells = level_offsets[-1]
+    coords = np.zeros((3 * n_cells, 2), dtype=np.double)
+    ring_start = np.zeros(n_cells, dtype=np.int64)
+    ring_end = np.zeros(n_cells, dtype=np.int64)
+    ring_shell = np.zeros(n_cells, dtype=np.bool_)
+    n_rings = np.zeros(n_levels, dtype=np.int64)
+    for level in prange(n_levels):
+        lo = level_offsets[level]
+        hi = level_offsets[level + 1]
+        n_rings[level] = trace_level(
+            level,
+            cutoffs[level],
+            band,
+            surface,
+            width,
+            height,
+            west,
+            north,
+            level_cells[lo:hi],
+            interpolation,
+            coords[3 * lo : 3 * hi],
+            ring_start[lo:hi],
+            ring_end[lo:hi],
+            ring_shell[lo:hi],
+        )
+    return coords, ring_start, ring_end, ring_shell, n_rings
+
+
+def pixels_to_coordinates(pixels, zoom, web_mercator):
+    """
+    Convert pixel coordinates to longitude and latitude (or web mercator)
+    """
+    if web_mercator:
+        x = pixel_x_to_web_mercator_x(pixels[:, 0], zoom)
+        y = pixel_y_to_web_mercator_y(pixels[:, 1], zoom)
+    else:
+        x = (pixels[:, 0] / z_scale(zoom)) * 360 - 180
+        y = np.arctan(np.sinh(np.pi * (1 - (2 * pixels[:, 1]) / z_scale(zoom)))) * 180 / np.pi
+    return np.column_stack((x, y))
 
-                # Huzzah! We have found a line, now follow it, keeping the filled area to our left,
-                # which allows us to use the winding direction to determine what should be a shell and
-                # what should be a hole
-                pos = [origx, origy]
-                prev = [-1, -1]
-                start = [-1, -1]
-
-                # Track winding direction
-                direction = 0
-                coords = []
-
-                # Make sure we're not traveling in circles.
-                # NB using index from _previous_ cell, we have not yet set an index for this cell
-
-                while found[index] != 1:
-                    prev = start
-                    start = pos
-                    idx = contour[index]
-
-                    indices.append(idx)
-
-                    # Mark as found if it's not a saddle because we expect to reach saddles twice.
-                    if idx != 5 and idx != 10:
-                        found[index] = 1
-
-                    if idx == 0 or idx >= 15:
-                        warnings.append("Ran off outside of ring")
-                        break
-
-                    # Follow the loop
-                    pos = followLoop(idx, pos, prev)
-                    index = pos[1] * cWidth + pos[0]
-
-                    # Keep track of winding direction
-                    direction += (pos[0] - start[0]) * (pos[1] + start[1])
-
-                    # Shift exact coordinates
-                    if interpolation:
-                        coord = interpolate(pos, cutoff, start, surface, width, height)
-                    else:
-                        coord = noInterpolate(pos, start)
-
-                    if not coord:
-                        warnings.append(
-                            f"Unexpected coo rdinate shift from ${start[0]}, ${start[1]} to ${pos[0]}, ${pos[1]}, discarding ring"
-                        )
-                        break
-                    xy = coordinate_from_pixel(
-                        [coord[0] + west, coord[1] + north], zoom=zoom, web_mercator=web_mercator
-                    )
-                    coords.append(xy)
-
-                    # We're back at the start of the ring
-                    if pos[0] == origx and pos[1] == origy:
-                        coords.append(coords[0])  # close the ring
-
-                        # make it a fully-fledged GeoJSON object
-                        geom = [coords]
-
-                        # Check winding direction. Positive here means counter clockwise,
-                        # see http:#stackoverflow.com/questions/1165647
-                        # +y is down so the signs are reversed from what would be expected
-                        if direction > 0:
-                            shells.append(geom)
-                        else:
-                            holes.append(geom)
-                        break
-
-        # Shell game time. Sort out shells and holes.
-        for hole in holes:
-            # Only accept holes that are at least 2-dimensional.
-            # Workaroudn (x+y) to avoid float to str type conversion in numba
-            vertices = list(set([(x + y) for x, y in hole[0]]))
-
-            if len(vertices) >= 3:
-                # NB this is checking whether the first coordinate of the hole is inside
-                # the shell. This is sufficient as shells don't overlap, and holes are
-                # guaranteed to be completely contained by a single shell.
-                holePoint = hole[0][0]
-                containingShell = []
-                for shell in shells:
-                    if pointinpolygon(holePoint[0], holePoint[1], shell[0]):
-                        containingShell.append(shell)
-                if len(containingShell) == 1:
-                    containingShell[0].append(hole[0])
-
-        geometries.append(list(shells))
-    return geometries
-
-
-@njit
-def pointinpolygon(x, y, poly):
-    n = len(poly)
-    inside = False
-    p2x = 0.0
-    p2y = 0.0
-    xints = 0.0
-    p1x, p1y = poly[0]
-    for i in range(n + 1):
-        p2x, p2y = poly[i % n]
-        if y > min(p1y, p2y):
-            if y <= max(p1y, p2y):
-                if x <= max(p1x, p2x):
-                    if p1y != p2y:
-                        xints = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                    if p1x == p2x or x <= xints:
-                        inside = not inside
-        p1x, p1y = p2x, p2y
-
-    return inside
+
+def get_coordinate_decimals(zoom, web_mercator, pixel_fraction):
+    """
+    Number of decimals of the coordinates to resolve a fraction of a pixel at the zoom
+    """
+    pixel_size = (40075016.68557849 if web_mercator else 360) / z_scale(zoom)
+    return max(0, math.ceil(-math.log10(pixel_size * pixel_fraction)))
+
+
+def simplify_geometries(geometries, tolerance):
+    """
+    Topology-preserving simplification in pixel space
+
+    :param geometries: Array of geometries in pixel coordinates
+    :param tolerance: Tolerance in pixels
+    """
+    return shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+
+def to_multipolygons(geometries):
+    """
+    Wrap the polygons as multipolygons, shapely operations return single polygons where they can
+    """
+    return np.array(
+        [
+            geometry
+            if geometry.geom_type == "MultiPolygon"
+            else MultiPolygon([geometry] if not geometry.is_empty else [])
+            for geometry in geometries
+        ],
+        dtype=object,
+    )
+
+
+def get_rings(coords, ring_start, ring_end, ring_shell, n_rings, level_offsets):
+    """
+    Collect the traced rings of all levels from the buffers of trace_levels.
+
+    :return: Rings as shapely linear rings, their level and winding direction (True for shells)
+    """
+    n_levels = len(n_rings)
+    slot_level = np.repeat(np.arange(n_levels), np.diff(level_offsets))
+    slot_offset = level_offsets[:-1][slot_level]
+    used = np.arange(level_offsets[-1]) - slot_offset < n_rings[slot_level]
+    ring_level = slot_level[used]
+    start = ring_start[used] + 3 * slot_offset[used]
+    length = ring_end[used] - ring_start[used]
+    ring_index = np.repeat(np.arange(len(start)), length)
+    coord_index = np.arange(len(ring_index)) - np.repeat(np.cumsum(length) - length, length)
+    rings = shapely.linearrings(coords[start[ring_index] + coord_index], indices=ring_index)
+    return rings, ring_level, ring_shell[used]
+
+
+def build_multipolygons(rings, ring_group, ring_shell, n_groups, min_area=0.0):
+    """
+    Build one multipolygon per group from shells and holes. Every hole is assigned to the
+    smallest shell of its group that contains it, shells are pre-filtered with an STRtree.
+    Shells of a group don't overlap but may be nested in holes of larger shells.
+
+    :param rings: Rings as shapely linear rings
+    :param ring_group: Group (level or band) of every ring
+    :param ring_shell: True for shells, False for holes
+    :param n_groups: Number of groups
+    :param min_area: Rings up to this area are dropped
+
+    :return: Array with a multipolygon per group
+    """
+    # Only accept rings that are at least 2-dimensional.
+    ring_area = shapely.area(shapely.polygons(rings))
+    shells = np.flatnonzero(ring_shell & (ring_area > min_area))
+    shells = shells[np.argsort(ring_group[shells], kind="stable")]
+    holes = np.flatnonzero(~ring_shell & (ring_area > min_area))
+    shell_polygons = shapely.polygons(rings[shells])
+
+    # NB this is checking whether the first coordinate of the hole is inside
+    # the shell. This is sufficient as the rings of a group don't cross, and holes
+    # are guaranteed to be completely contained by the shell.
+    hole_points = shapely.get_point(rings[holes], 0)
+    hole_index, shell_index = shapely.STRtree(shell_polygons).query(hole_points)
+    same_group = ring_group[holes[hole_index]] == ring_group[shells[shell_index]]
+    hole_index, shell_index = hole_index[same_group], shell_index[same_group]
+    shapely.prepare(shell_polygons)
+    contains = shapely.intersects(shell_polygons[shell_index], hole_points[hole_index])
+    hole_index, shell_index = hole_index[contains], shell_index[contains]
+    order = np.lexsort((ring_area[shells[shell_index]], hole_index))
+    hole_index, shell_index = hole_index[order], shell_index[order]
+    smallest = np.diff(hole_index, prepend=-1) != 0
+    hole_index, shell_index = hole_index[smallest], shell_index[smallest]
+
+    # Rings ordered by polygon, the shell first and then its holes
+    polygon_rings = np.concatenate((shells, holes[hole_index]))
+    polygon_index = np.concatenate((np.arange(len(shells)), shell_index))
+    order = np.lexsort((np.arange(len(polygon_rings)), polygon_index))
+    polygons = shapely.polygons(rings[polygon_rings[order]], indices=polygon_index[order])
+    multipolygons = np.full(n_groups, MultiPolygon(), dtype=object)
+    if len(polygons):
+        shapely.multipolygons(polygons, indices=ring_group[shells], out=multipolygons)
+    return multipolygons
+
+
+def calculate_jsolines(
+    surface,
+    width,
+    height,
+    west,
+    north,
+    zoom,
+    cutoffs,
+    interpolation=True,
+    web_mercator=True,
+    return_isobands=False,
+    simplify_tolerance=None,
+):
+    """
+    Contour the surface at all cutoffs. The grid is classified once against all cutoffs and the
+    rings of all levels are traced in one parallel sweep.
+
+    The isobands (previous cutoff <= t < cutoff) are built from the same rings: the band of a cutoff
+    has the shells of its level and the holes of the previous level as shells, and the holes of its
+    level and the shells of the previous level as holes.
+
+    With a simplify_tolerance (in pixels of the surface) the isolines are prepared for the output:
+    rings smaller than the tolerance are dropped, the isolines are simplified in pixel space and
+    the coordinates are quantized to a quarter of the tolerance before the projection. They are
+    rounded to the decimals that resolve the quantization at the zoom. The isobands are kept
+    exact, they are used to count the opportunities.
+
+    :return: Multipolygons of the isolines for every cutoff and of the isobands if return_isobands
+    """
+    cutoffs = np.asarray(cutoffs)
+    n_levels = len(cutoffs)
+    order = np.argsort(cutoffs, kind="stable")
+    sorted_cutoffs = cutoffs[order]
+    band = get_band_index(surface, width, height, sorted_cutoffs)
+    level_offsets, level_cells = get_level_cells(band, width, height, n_levels)
+    traced = trace_levels(
+        band,
+        surface.astype(np.double),
+        width,
+        height,
+        west,
+        north,
+        sorted_cutoffs.astype(np.double),
+        level_offsets,
+        level_cells,
+        interpolation,
+    )
+    rings, ring_level, ring_shell = get_rings(*traced, level_offsets)
+
+    def to_coordinates(pixels):
+        return pixels_to_coordinates(pixels, zoom, web_mercator)
+
+    isolines = np.empty(n_levels, dtype=object)
+    if simplify_tolerance:
+        quantization = simplify_tolerance / 4
+        decimals = get_coordinate_decimals(zoom, web_mercator, quantization)
+
+        def to_rounded_coordinates(pixels):
+            return np.round(pixels_to_coordinates(pixels, zoom, web_mercator), decimals)
+
+        pixel_isolines = build_multipolygons(
+            rings, ring_level, ring_shell, n_levels, min_area=simplify_tolerance**2
+        )
+        pixel_isolines = simplify_geometries(pixel_isolines, simplify_tolerance)
+        # Snap rounding keeps the rings valid where they nearly touch
+        pixel_isolines = to_multipolygons(shapely.set_precision(pixel_isolines, quantization))
+        isolines[order] = shapely.transform(pixel_isolines, to_rounded_coordinates)
+    else:
+        sorted_isolines = shapely.transform(
+            build_multipolygons(rings, ring_level, ring_shell, n_levels), to_coordinates
+        )
+        isolines[order] = sorted_isolines
+    if not return_isobands:
+        return isolines, None
+
+    isobands = np.empty(n_levels, dtype=object)
+    # Lines of consecutive cutoffs share points if they are not interpolated or if they reach
+    # the edges (where the values are set to the cutoff). Cut the bands from the isolines then.
+    inner_band = band.reshape(height, width)[1:-1, 1:-1]
+    inner_edges = np.concatenate((inner_band[0], inner_band[-1], inner_band[:, 0], inner_band[:, -1]))
+    if not interpolation or np.any(inner_edges < n_levels):
+        if simplify_tolerance:
+            sorted_isolines = shapely.transform(
+                build_multipolygons(rings, ring_level, ring_shell, n_levels), to_coordinates
+            )
+        isobands[order] = np.concatenate(
+            (sorted_isolines[:1], shapely.difference(sorted_isolines[1:], sorted_isolines[:-1]))
+        )
+        return isolines, isobands
+
+    previous_level = ring_level < n_levels - 1
+    isobands[order] = shapely.transform(
+        build_multipolygons(
+            np.concatenate((rings, rings[previous_level])),
+            np.concatenate((ring_level, ring_level[previous_level] + 1)),
+            np.concatenate((ring_shell, ~ring_shell[previous_level])),
+            n_levels,
+        ),
+        to_coordinates,
+    )
+    return isolines, isobands
 
 
 def jsolines(
@@ -339,6 +650,7 @@ def jsolines(
     interpolation=True,
     return_incremental=False,
     web_mercator=False,
+    simplify_tolerance=None,
 ):
     """
     Calculate isolines from a surface.
@@ -351,32 +663,32 @@ def jsolines(
     :param zoom: The zoom level of the surface.
     :param cutoffs: A list of cutoff values.
     :param interpolation: Whether to interpolate between pixels.
-    :param return_incremental: Whether to also return incremental isolines. Takes
+    :param return_incremental: Whether to also return incremental isolines (isobands between consecutive cutoffs).
     :param web_mercator: Whether to use web mercator coordinates.
+    :param simplify_tolerance: Tolerance in pixels to simplify and quantize the isolines with. None to keep all vertices.
 
     :return: A dictionary with full and/or incremental isolines as a geodataframe object.
     """
 
-    isochrone_multipolygon_coordinates = calculate_jsolines(
-        surface, width, height, west, north, zoom, cutoffs, interpolation, web_mercator
+    isochrone_shapes, isoband_shapes = calculate_jsolines(
+        surface,
+        width,
+        height,
+        west,
+        north,
+        zoom,
+        cutoffs,
+        interpolation,
+        web_mercator,
+        return_isobands=return_incremental,
+        simplify_tolerance=simplify_tolerance,
     )
 
     result = {}
-    isochrone_shapes = []
-    for isochrone in isochrone_multipolygon_coordinates:
-        isochrone_shapes.append(shape({"type": "MultiPolygon", "coordinates": isochrone}))
-
     result["full"] = GeoDataFrame({"geometry": isochrone_shapes, "minute": cutoffs})
 
     if return_incremental:
-        isochrone_diff = []
-        for i in range(len(isochrone_shapes)):
-            if i == 0:
-                isochrone_diff.append(isochrone_shapes[i])
-            else:
-                isochrone_diff.append(isochrone_shapes[i].difference(isochrone_shapes[i - 1]))
-
-        result["incremental"] = GeoDataFrame({"geometry": isochrone_diff, "minute": cutoffs})
+        result["incremental"] = GeoDataFrame({"geometry": isoband_shapes, "minute": cutoffs})
 
     crs = "EPSG:4326"
     if web_mercator:
@@ -387,10 +699,12 @@ def jsolines(
     return result
 
 
-def generate_jsolines(grid, travel_time, percentile):
+def generate_jsolines(grid, travel_time, percentile, simplify_tolerance=None):
     """
     Generate the jsolines from the isochrones.
 
+    :param simplify_tolerance: Tolerance in pixels to simplify and quantize the jsolines with. None to keep all vertices.
+
     :return: A GeoDataFrame with the jsolines.
 
     """
@@ -408,6 +722,7 @@ def generate_jsolines(grid, travel_time, percentile):
         grid["zoom"],
         cutoffs=np.arange(1, travel_time + 1),
         return_incremental=True,
+        simplify_tolerance=simplify_tolerance,
     )
     return isochrones
 
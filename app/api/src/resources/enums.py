@@ -21,6 +21,8 @@ class IndicatorResultsReturnType(str, Enum):
     GEOPACKAGE = "geopackage"
     KML = "kml"
     XLSX = "xlsx"
+    NPY = "npy"
+    ARROW = "arrow"
 
 
 class VectorType(str, Enum):
@@ -89,6 +89,12 @@ class IsochroneOutputType(Enum):
     XLSX = "xlsx"
 
 
+class ODMatrixOutputFormat(Enum):
+    NPY = "npy"
+    ARROW = "arrow"
+    CSV = "csv"
+
+
 class IsochroneDecayFunctionType(Enum):
     LOGISTIC = "logistic"
     LINEAR = "linear"
@@ -378,6 +384,111 @@ class IsochroneDTO(BaseModel):
         return not self.is_multi
 
 
+class IsochroneBatchDTO(BaseModel):
+    mode: IsochroneMode = Field(IsochroneAccessMode.WALK, description="Isochrone Mode")
+    settings: IsochroneSettings = Field(..., description="Isochrone settings parameters")
+    scenario: Optional[IsochroneScenario] = Field(
+        {
+            "id": 0,
+            "modus": CalculationTypes.default,
+        },
+        description="Isochrone scenario parameters",
+    )
+    starting_points: List[IsochroneStartingPointCoord] = Field(
+        ...,
+        min_items=1,
+        max_items=500,
+        description="Starting points, a separate isochrone is calculated for every starting point",
+    )
+    output: Optional[IsochroneOutput] = Field(..., description="Isochrone output parameters")
+
+    class Config:
+        extra = "forbid"
+
+    @root_validator
+    def validate_batch(cls, values):
+        """Validate"""
+        if not values.get("mode") or not values.get("settings") or not values.get("output"):
+            return values
+
+        if values["mode"].value not in [IsochroneMode.WALKING.value, IsochroneMode.CYCLING.value]:
+            raise ValueError("Batch isochrones are only supported for walking and cycling")
+
+        if values["settings"].travel_time > 25:
+            raise ValueError(
+                "Travel time maximum for walking and cycling should be less or equal to 25 minutes"
+            )
+
+        if values["output"].type.value not in [
+            IsochroneOutputType.GRID.value,
+            IsochroneOutputType.GEOJSON.value,
+        ]:
+            raise ValueError("Output type of batch isochrones should be grid or geojson")
+
+        if (
+            values["output"].type.value == IsochroneOutputType.GRID.value
+            and values["output"].resolution not in [9, 10, 11, 12]
+        ):
+            raise ValueError(
+                "Resolution must be between 9 and 14 for walking and cycling isochrones"
+            )
+        return values
+
+    def to_single(self, starting_point: IsochroneStartingPointCoord) -> IsochroneDTO:
+        """Single isochrone of one of the starting points"""
+        return IsochroneDTO(
+            mode=self.mode,
+            settings=self.settings,
+            scenario=self.scenario,
+            starting_point=IsochroneStartingPoint(input=[starting_point]),
+            output=self.output,
+        )
+
+
+class ODMatrixDTO(BaseModel):
+    mode: IsochroneMode = Field(IsochroneAccessMode.WALK, description="Routing Mode")
+    settings: IsochroneSettings = Field(
+        ..., description="Routing settings, the travel time is the cutoff of the matrix"
+    )
+    scenario: Optional[IsochroneScenario] = Field(
+        {
+            "id": 0,
+            "modus": CalculationTypes.default,
+        },
+        description="Scenario parameters",
+    )
+    origins: List[IsochroneStartingPointCoord] = Field(
+        ..., min_items=1, max_items=5000, description="Origins, the rows of the matrix"
+    )
+    destinations: List[IsochroneStartingPointCoord] = Field(
+        ..., min_items=1, max_items=5000, description="Destinations, the columns of the matrix"
+    )
+    output_format: ODMatrixOutputFormat = Field(
+        ODMatrixOutputFormat.NPY, description="Output format of the matrix"
+    )
+
+    class Config:
+        extra = "forbid"
+
+    @root_validator
+    def validate_od_matrix(cls, values):
+        """Validate"""
+        if not values.get("mode") or not values.get("settings"):
+            return values
+
+        if values["mode"].value not in [IsochroneMode.WALKING.value, IsochroneMode.CYCLING.value]:
+            raise ValueError("Travel time matrices are only supported for walking and cycling")
+
+        if values["settings"].travel_time > 25:
+            raise ValueError(
+                "Travel time maximum for walking and cycling should be less or equal to 25 minutes"
+            )
+
+        if values.get("scenario") and values["scenario"].modus != CalculationTypes.default:
+            raise ValueError("Travel time matrices are only supported for the default network")
+        return values
+
+
 # R5
 R5AvailableDates = {
     0: "2022-05-16",
@@ -735,4 +846,51 @@ request_examples = {
             },
         },
     },
+    "isochrone_batch": {
+        "walking_schools": {
+            "summary": "Walking isochrones of several schools",
+            "value": {
+                "mode": "walking",
+                "settings": {
+                    "travel_time": "10",
+                    "speed": "5",
+                    "walking_profile": "standard",
+                },
+                "starting_points": [
+                    {"lat": 48.1502132, "lon": 11.5696284},
+                    {"lat": 48.1433211, "lon": 11.5583012},
+                    {"lat": 48.1377443, "lon": 11.5754323},
+                ],
+                "scenario": {"id": 0, "modus": "default"},
+                "output": {
+                    "type": "geojson",
+                    "steps": "2",
+                },
+            },
+        },
+    },
+    "od_matrix": {
+        "walking_schools": {
+            "summary": "Walking travel times from residential points to schools",
+            "value": {
+                "mode": "walking",
+                "settings": {
+                    "travel_time": "15",
+                    "speed": "5",
+                    "walking_profile": "standard",
+                },
+                "origins": [
+                    {"lat": 48.1412432, "lon": 11.5633521},
+                    {"lat": 48.1459871, "lon": 11.5702133},
+                ],
+                "destinations": [
+                    {"lat": 48.1502132, "lon": 11.5696284},
+                    {"lat": 48.1433211, "lon": 11.5583012},
+                    {"lat": 48.1377443, "lon": 11.5754323},
+                ],
+                "scenario": {"id": 0, "modus": "default"},
+                "output_format": "csv",
+            },
+        },
+    },
 }
@@ -1,5 +1,5 @@
 from src.schemas.heatmap import ReturnTypeHeatmap
-from src.schemas.isochrone import IsochroneOutputType
+from src.schemas.isochrone import IsochroneOutputType, ODMatrixOutputFormat
 
 
 def findkeys(node, kv):
@@ -22,6 +22,8 @@ def validate_return_type(results, return_type=None):
     allowed_return_types = {
         "heatmap": {member.value for member in ReturnTypeHeatmap},
         "isochrone": {member.value for member in IsochroneOutputType},
+        "isochrone_batch": {IsochroneOutputType.GRID.value, IsochroneOutputType.GEOJSON.value},
+        "od_matrix": {member.value for member in ODMatrixOutputFormat},
     }
     data_source = results["data_source"]
     if data_source not in allowed_return_types.keys():
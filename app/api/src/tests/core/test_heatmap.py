@@ -1,7 +1,19 @@
 import numpy as np
 import pytest
+import shapely
+from shapely.geometry import MultiPolygon, Polygon, box
 
 from src.core import heatmap
+from src.core.heatmap import heatmap_core
+from src.core.heatmap.heatmap_core import (
+    MatrixExtentIndex,
+    PolygonPixelCache,
+    TravelTimeMatrixCache,
+    aggregate_point_opportunities,
+    pixelate_polygons,
+    point_opportunity_relations,
+)
+from src.utils import coordinates_to_pixels
 
 travel_times = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12])
 unique = (np.array([1,2,3,4,5]),np.array([0, 3, 5, 8, 10]))
@@ -39,4 +51,165 @@ def test_combined_modified_gaussian_per_grid():
     assert np.allclose(results, test_results)
     
     
-    
\ No newline at end of file
+    
+
+
+def test_matrix_extent_index():
+    rng = np.random.default_rng(0)
+    north = rng.integers(1000, 1200, 500)
+    west = rng.integers(2000, 2200, 500)
+    south = north + rng.integers(0, 40, 500)
+    east = west + rng.integers(0, 40, 500)
+    # One large matrix spanning many buckets
+    south[7] = north[7] + 150
+    east[7] = west[7] + 150
+    index = MatrixExtentIndex(north, west, south, east)
+    x = rng.integers(1990, 2250, 200)
+    y = rng.integers(990, 1250, 200)
+    size = rng.integers(0, 10, 200)
+    offsets, indices = index.query_many(x, y, x + size, y + size)
+    for i in range(len(x)):
+        expected = (
+            (north <= y[i]) & (south >= y[i] + size[i]) & (west <= x[i]) & (east >= x[i] + size[i])
+        ).nonzero()[0]
+        assert np.array_equal(index.query(x[i], y[i], x[i] + size[i], y[i] + size[i]), expected)
+        assert np.array_equal(indices[offsets[i] : offsets[i + 1]], expected)
+    # A single pixel
+    expected = ((north <= y[0]) & (south >= y[0]) & (west <= x[0]) & (east >= x[0])).nonzero()[0]
+    assert np.array_equal(index.query(x[0], y[0]), expected)
+    assert len(MatrixExtentIndex([], [], [], []).query(5, 5)) == 0
+
+
+def test_point_opportunity_relations():
+    # Two matrices of 3x2 pixels, the second one shifted by one pixel to the east
+    north = np.array([10, 10])
+    west = np.array([20, 21])
+    width = np.array([3, 3])
+    matrix_travel_times = [np.array([1, 2, 3, 4, 50, 6]), np.array([7, -1, 9, 10, 11, 12])]
+    travel_times_offsets = np.array([0, 6, 12])
+    index = MatrixExtentIndex(north, west, north + 1, west + width - 1)
+    x = np.array([20, 21, 22, 25])
+    y = np.array([10, 11, 10, 10])
+    weights = np.array([1.0, 2.0, 3.0, 4.0], np.float32)
+    relevant_offsets, relevant_matrices = index.query_many(x, y)
+    offsets, relation_travel_times, relation_matrices, relation_weights = point_opportunity_relations(
+        x,
+        y,
+        weights,
+        relevant_offsets,
+        relevant_matrices,
+        north,
+        west,
+        width,
+        np.concatenate(matrix_travel_times),
+        travel_times_offsets,
+        15,
+    )
+    # Travel times above the maximum and negative ones are no relations
+    assert np.array_equal(offsets, np.array([0, 1, 2, 3, 3]))
+    assert np.array_equal(relation_travel_times, np.array([1, 10, 3]))
+    assert np.array_equal(relation_matrices, np.array([0, 1, 0]))
+    assert np.allclose(relation_weights, np.array([1.0, 2.0, 3.0]))
+
+
+def test_aggregate_point_opportunities():
+    x = np.array([10, 10, 11, 10, 10])
+    y = np.array([20, 20, 20, 20, 21])
+    categories = np.array([0, 0, 0, 1, 0])
+    weights = np.array([2, 3, 1, 4, 5], np.float32)
+
+    opportunity_aggregates, aggregate_x, aggregate_y, aggregate_weights = (
+        aggregate_point_opportunities(x, y, categories, weights)
+    )
+
+    # Only the first two opportunities share pixel and category
+    assert len(aggregate_weights) == 4
+    assert opportunity_aggregates[0] == opportunity_aggregates[1]
+    assert len(set(opportunity_aggregates[1:].tolist())) == 4
+    np.testing.assert_array_equal(aggregate_x[opportunity_aggregates], x)
+    np.testing.assert_array_equal(aggregate_y[opportunity_aggregates], y)
+    np.testing.assert_allclose(aggregate_weights[opportunity_aggregates], [5, 5, 1, 4, 5])
+    assert aggregate_weights.sum() == weights.sum()
+
+
+def reference_polygon_pixels(geom, zoom, pixelate_zoom=15):
+    """Pixels of a polygon by testing every pixel center of the pixelate zoom"""
+    west, south, east, north = geom.bounds
+    (x0, x1), (y1, y0) = coordinates_to_pixels(
+        np.array([west, east]), np.array([south, north]), pixelate_zoom, round_int=False
+    )
+    xs, ys = np.meshgrid(np.arange(int(x0), int(x1) + 1), np.arange(int(y0), int(y1) + 1))
+    xs, ys = xs.ravel(), ys.ravel()
+    pixel_geom = shapely.transform(
+        geom,
+        lambda coords: np.column_stack(
+            coordinates_to_pixels(coords[:, 0], coords[:, 1], pixelate_zoom, round_int=False)
+        ),
+    )
+    inside = shapely.contains_xy(pixel_geom, xs + 0.5, ys + 0.5)
+    factor = 2 ** (pixelate_zoom - zoom)
+    pixels = np.column_stack(
+        (np.floor((xs[inside] + 0.5) / factor + 0.5), np.floor((ys[inside] + 0.5) / factor + 0.5))
+    ).astype(int)
+    unique, counts = np.unique(pixels, axis=0, return_counts=True)
+    return {(x, y): count for (x, y), count in zip(unique.tolist(), counts.tolist())}
+
+
+def test_pixelate_polygons():
+    square = box(11.55, 48.13, 11.57, 48.145)
+    with_hole = Polygon(
+        square.exterior.coords, [box(11.555, 48.135, 11.565, 48.14).exterior.coords]
+    )
+    multi = MultiPolygon([box(11.50, 48.10, 11.51, 48.11), box(11.52, 48.10, 11.53, 48.11)])
+    tiny = box(11.5, 48.1, 11.500001, 48.100001)
+    geoms = [square, with_hole, multi, tiny]
+
+    pixels = pixelate_polygons(geoms, zoom=12)
+
+    assert len(pixels) == len(geoms)
+    for geom, polygon_pixels in zip(geoms[:3], pixels[:3]):
+        assert polygon_pixels.shape[1] == 3
+        # Rows are sorted by y, then x
+        order = np.lexsort((polygon_pixels[:, 0], polygon_pixels[:, 1]))
+        np.testing.assert_array_equal(order, np.arange(len(polygon_pixels)))
+        result = {(x, y): count for x, y, count in polygon_pixels.tolist()}
+        assert result == reference_polygon_pixels(geom, zoom=12)
+    assert pixels[1][:, 2].sum() < pixels[0][:, 2].sum()
+    assert pixels[3].shape == (0, 3)
+    assert pixelate_polygons([], zoom=12) == []
+
+
+def test_polygon_pixel_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(heatmap_core.settings, "POLYGON_PIXEL_CACHE_PATH", str(tmp_path))
+    geoms = np.array([box(11.55, 48.13, 11.57, 48.145), box(11.50, 48.10, 11.51, 48.11)])
+    cache = PolygonPixelCache(max_size=1)
+
+    pixels = cache.get_many(geoms, zoom=12)
+    assert len(cache.pixels) == 1
+    assert len(list(tmp_path.rglob("*.npy"))) == 2
+
+    # A new process reads the pixels from the shared cache
+    monkeypatch.setattr(
+        heatmap_core, "pixelate_polygons", lambda *args, **kwargs: pytest.fail("not cached")
+    )
+    cached = PolygonPixelCache(max_size=10).get_many(geoms[::-1], zoom=12)
+    for polygon_pixels, cached_pixels in zip(pixels, cached[::-1]):
+        np.testing.assert_array_equal(polygon_pixels, cached_pixels)
+
+
+def test_travel_time_matrix_cache():
+    schedule = [["a", "b", "c"], ["b", "c", "d"], ["a", "e"], ["c", "d"]]
+    cache = TravelTimeMatrixCache(schedule, max_size=2)
+    reads = []
+    for keys in schedule:
+        missing = cache.missing(keys)
+        reads.extend(missing)
+        matrices = cache.update(keys, {key: key.upper() for key in missing})
+        assert matrices == {key: key.upper() for key in keys}
+        assert len(cache.matrices) <= 2
+
+    # a is evicted after the first bulk as it is needed furthest in the future,
+    # c and d are kept over the third bulk for the last one
+    assert reads == ["a", "b", "c", "d", "a", "e"]
+    assert cache.reads == len(reads)
+    assert cache.matrices == {}
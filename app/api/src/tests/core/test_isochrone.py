@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+from src.core import isochrone
+from src.core.config import settings
+from src.core.isochrone import (
+    DistanceTree,
+    PreparedNetwork,
+    compute_od_matrix,
+    construct_csr_graph_,
+    construct_node_edges_,
+    create_dial_buffers,
+    dial_dijkstra,
+    dijkstra,
+    dijkstra_many,
+    fill_grid_distance_transform_,
+    get_reached_edges_,
+    rasterize_network_,
+    reached_to_distances,
+)
+from src.utils import pixel_x_to_web_mercator_x, pixel_y_to_web_mercator_y
+
+# 0 -> 1 -> 2 -> 3 with a one-way shortcut 0 -> 3 and a closed edge 3 -> 4
+edges_source = np.array([0, 1, 2, 0, 3])
+edges_target = np.array([1, 2, 3, 3, 4])
+edges_cost = np.array([60.0, 120.0, 60.0, 600.0, -1.0])
+edges_reverse_cost = np.array([60.0, 120.0, 60.0, -1.0, -1.0])
+
+
+def test_construct_csr_graph():
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    assert np.array_equal(graph.offsets, np.array([0, 2, 4, 6, 7, 7]))
+    assert np.array_equal(graph.targets, np.array([1, 3, 0, 2, 1, 3, 2]))
+    assert np.allclose(graph.costs, np.array([1.0, 10.0, 1.0, 2.0, 2.0, 1.0, 1.0]))
+
+
+def test_dijkstra():
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    distances = dijkstra(np.array([0]), graph, 10)
+    assert np.allclose(distances, np.array([0.0, 1.0, 3.0, 4.0, np.inf]))
+    distances = dijkstra(np.array([3]), graph, 10)
+    assert np.allclose(distances, np.array([4.0, 3.0, 1.0, 0.0, np.inf]))
+
+
+def test_dijkstra_many():
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    start_vertices = np.array([3, 0, 3, 4])
+    for algorithm in ["heap", "dial"]:
+        reached, search_index = dijkstra_many(
+            start_vertices, graph, 10, chunk_size=2, algorithm=algorithm
+        )
+        # Duplicated start vertices share one search
+        assert len(reached.offsets) == 4
+        assert search_index[0] == search_index[2]
+        for idx, start_vertex in enumerate(start_vertices):
+            distances = reached_to_distances(reached, search_index[idx], 5)
+            assert np.allclose(distances, dijkstra(np.array([start_vertex]), graph, 10))
+
+
+def test_dijkstra_many_chunk_memory(monkeypatch):
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    start_vertices = np.array([3, 0, 1, 4])
+    expected, _ = dijkstra_many(start_vertices, graph, 10, chunk_size=4)
+    # Two dense rows of 5 nodes fit into the budget, the searches run in two chunks
+    monkeypatch.setattr(settings, "ROUTING_SEARCH_CHUNK_MEMORY", 2 * 5 * 8)
+    chunks = []
+    dijkstra_chunk = isochrone.dijkstra_chunk_
+    monkeypatch.setattr(
+        isochrone,
+        "dijkstra_chunk_",
+        lambda start_vertices, *args: chunks.append(len(start_vertices))
+        or dijkstra_chunk(start_vertices, *args),
+    )
+    reached, search_index = dijkstra_many(start_vertices, graph, 10)
+    assert chunks == [2, 2]
+    for array, expected_array in zip(reached, expected):
+        assert np.array_equal(array, expected_array)
+
+
+def test_get_reached_edges():
+    node_edges = construct_node_edges_(5, edges_source, edges_target)
+    assert np.array_equal(node_edges.offsets, np.array([0, 2, 4, 6, 9, 10]))
+    assert np.array_equal(get_reached_edges_(np.array([4]), node_edges), np.array([4]))
+    assert np.array_equal(get_reached_edges_(np.array([0, 1]), node_edges), np.array([0, 1, 3]))
+
+
+def test_dial_dijkstra():
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    buffers = create_dial_buffers(5, 10)
+    # The buffers are reused, every search must match the heap search
+    for start_vertices in [[0], [3], [1, 3], [4], [0]]:
+        start_vertices = np.array(start_vertices)
+        distances = dial_dijkstra(start_vertices, graph, 10, buffers)
+        assert np.allclose(distances, dijkstra(start_vertices, graph, 10))
+    # Nodes beyond the travel time keep the cost of their first relaxation
+    distances = dial_dijkstra(np.array([0]), graph, 2, buffers)
+    assert np.allclose(distances, dijkstra(np.array([0]), graph, 2))
+
+
+def test_rasterize_network():
+    zoom = 12
+    west, north = 557878, 363838
+    pixel_size = pixel_x_to_web_mercator_x(1, zoom) - pixel_x_to_web_mercator_x(0, zoom)
+    x0 = pixel_x_to_web_mercator_x(west + 2, zoom)
+    y0 = pixel_y_to_web_mercator_y(north + 2, zoom)
+    # One edge over ten pixels to the east, a zero length edge on the same pixel as the source
+    # and an edge that is not reached
+    node_coords = np.array([[x0, y0], [x0 + 10 * pixel_size, y0], [x0, y0], [x0, y0 + pixel_size]])
+    geom_array = np.concatenate((node_coords[:2], node_coords[[0, 2]], node_coords[[0, 3]]))
+    geom_address = np.array([0, 2, 4, 6])
+    agg_costs = np.array([2.0, 12.0, 1.0, 3.0])
+    grid_costs, grid_coords = rasterize_network_(
+        np.array([0, 0, 0]),
+        np.array([1, 2, 3]),
+        np.array([10 * pixel_size, 0.0, pixel_size]),
+        geom_address,
+        geom_array,
+        agg_costs,
+        np.array([0, 1]),
+        node_coords,
+        pixel_size,
+        zoom,
+        west,
+        north,
+        20,
+        5,
+    )
+    assert np.isfinite(grid_costs).sum() == 11
+    # The lowest cost wins on a shared pixel
+    assert grid_costs[2, 2] == 1.0
+    assert np.allclose(grid_costs[2, 3:13], np.arange(3.0, 13.0))
+    assert np.allclose(grid_coords[2, 12], node_coords[1])
+
+
+def test_fill_grid_distance_transform():
+    zoom = 12
+    west, north = 557878, 363838
+    pixel_size = pixel_x_to_web_mercator_x(1, zoom) - pixel_x_to_web_mercator_x(0, zoom)
+    # One reached pixel in the middle of the grid
+    grid_costs = np.full((41, 41), np.inf)
+    grid_coords = np.zeros((41, 41, 2))
+    grid_costs[20, 20] = 1.0
+    grid_coords[20, 20] = [
+        pixel_x_to_web_mercator_x(west + 20, zoom),
+        pixel_y_to_web_mercator_y(north + 20, zoom),
+    ]
+    speed = pixel_size / 60  # one minute per pixel
+    Z, grid_west, grid_north = fill_grid_distance_transform_(
+        grid_costs, grid_coords, zoom, west, north, speed, max_distance=3 * pixel_size
+    )
+    # The grid is cropped to the reached pixels plus the maximum distance
+    assert Z.shape == (9, 9)
+    assert (grid_west, grid_north) == (west + 16, north + 16)
+    assert Z[4, 4] == 1.0
+    assert Z[4, 7] == 4.0
+    assert Z[6, 6] == 4.0
+    assert np.isnan(Z[4, 8])
+    assert np.isnan(Z[7, 7])
+    # Pixels beyond the travel time limit are not reached
+    Z, _, _ = fill_grid_distance_transform_(
+        grid_costs, grid_coords, zoom, west, north, speed, max_distance=3 * pixel_size, max_traveltime=3
+    )
+    assert Z[4, 6] == 3.0
+    assert np.isnan(Z[4, 7])
+    assert np.isnan(Z[6, 6])
+
+
+def test_prepared_network():
+    edges = pd.DataFrame(
+        {
+            "source": [30, 10, 20],
+            "target": [10, 20, 40],
+            "cost": [60.0, 120.0, 60.0],
+            "reverse_cost": [60.0, -1.0, 60.0],
+            "length": [10.0, 20.0, 10.0],
+            "geom": [[[0.0, 0.0], [10.0, 0.0]], [[10.0, 0.0], [20.0, 5.0], [30.0, 0.0]], [[30.0, 0.0], [40.0, 0.0]]],
+        }
+    )
+    network = PreparedNetwork.from_dataframe(edges)
+    assert np.array_equal(network.node_ids, np.array([10, 20, 30, 40]))
+    assert np.array_equal(network.edges_source, np.array([2, 0, 1]))
+    assert np.array_equal(network.edges_target, np.array([0, 1, 3]))
+    assert np.array_equal(network.geom_address, np.array([0, 2, 5, 7]))
+    assert np.allclose(network.node_coords, np.array([[10.0, 0.0], [30.0, 0.0], [0.0, 0.0], [40.0, 0.0]]))
+    assert np.allclose(network.extent, np.array([-200.0, -200.0, 240.0, 205.0]))
+    assert network.graph is network.graph
+    index, valid = network.get_node_index([20, 25, 50, 10])
+    assert np.array_equal(valid, np.array([True, False, False, True]))
+    assert np.array_equal(index[valid], np.array([1, 0]))
+
+
+def test_prepared_network_wkb():
+    geoms = [[[0.0, 0.0], [10.0, 0.0]], [[10.0, 0.0], [20.0, 5.0], [30.0, 0.0]]]
+    edges = pd.DataFrame(
+        {
+            "source": [1, 2],
+            "target": [2, 3],
+            "cost": [60.0, 120.0],
+            "reverse_cost": [60.0, 120.0],
+            "length": [10.0, 20.0],
+            "geom": geoms,
+        }
+    )
+    network = PreparedNetwork.from_dataframe(edges)
+    edges["geom"] = [shapely.to_wkb(shapely.linestrings(geom)) for geom in geoms]
+    network_wkb = PreparedNetwork.from_dataframe(edges)
+    assert np.array_equal(network.geom_address, network_wkb.geom_address)
+    assert np.array_equal(network.geom_array, network_wkb.geom_array)
+    assert np.array_equal(network.node_coords, network_wkb.node_coords)
+
+
+def test_distance_tree():
+    # A chain of edges, the costs in seconds are the lengths in meters at 1 m/s
+    geoms = [[[0.0, 0.0], [60.0, 0.0]], [[60.0, 0.0], [180.0, 0.0]], [[180.0, 0.0], [240.0, 0.0]]]
+    edges = pd.DataFrame(
+        {
+            "source": [0, 1, 2],
+            "target": [1, 2, 3],
+            "cost": [60.0, 120.0, 60.0],
+            "reverse_cost": [60.0, 120.0, 60.0],
+            "length": [60.0, 120.0, 60.0],
+            "geom": geoms,
+        }
+    )
+    tree = DistanceTree(PreparedNetwork.from_dataframe(edges), [0], reach=10)
+    assert tree.covers(5, 2) and not tree.covers(6, 2)
+    # Same travel times as a search on the network loaded at the speed
+    for travel_time, speed in [(5, 2.0), (2, 1.0), (1.5, 1.5)]:
+        edges_speed = edges.assign(cost=edges["cost"] / speed, reverse_cost=edges["reverse_cost"] / speed)
+        network = PreparedNetwork.from_dataframe(edges_speed)
+        assert np.allclose(
+            tree.get_distances(travel_time, speed), dijkstra(np.array([0]), network.graph, travel_time)
+        )
+
+
+def test_compute_od_matrix():
+    edges = pd.DataFrame(
+        {
+            "source": edges_source + 10,
+            "target": edges_target + 10,
+            "cost": edges_cost,
+            "reverse_cost": edges_reverse_cost,
+            "length": edges_cost,
+            "geom": [[[float(s), 0.0], [float(t), 0.0]] for s, t in zip(edges_source, edges_target)],
+        }
+    )
+    network = PreparedNetwork.from_dataframe(edges)
+    # Unknown and unsnapped ids are not reached, duplicated origins get the same row
+    origins = np.array([10, 13, 99, 10])
+    destinations = np.array([13, 12, 14, -1, 10])
+    matrix = compute_od_matrix(network, origins, destinations, 10)
+    inf = np.inf
+    expected = np.array(
+        [
+            [4.0, 3.0, inf, inf, 0.0],
+            [0.0, 1.0, inf, inf, 4.0],
+            [inf, inf, inf, inf, inf],
+            [4.0, 3.0, inf, inf, 0.0],
+        ]
+    )
+    assert matrix.dtype == np.float32 and np.allclose(matrix, expected)
+    # Same travel times as full searches, the cutoff applies to all pairs
+    graph = construct_csr_graph_(5, edges_source, edges_target, edges_cost, edges_reverse_cost)
+    matrix = compute_od_matrix(edges, origins[:2], destinations[:3], 3.5)
+    for row, origin in enumerate([0, 3]):
+        distances = dijkstra(np.array([origin]), graph, 3.5)[[3, 2, 4]]
+        assert np.allclose(matrix[row], np.where(distances < 3.5, distances, inf))
@@ -0,0 +1,83 @@
+import os
+import time
+
+import pytest
+
+from src.core.config import settings
+from src.core import data_version
+from src.core.data_version import DataVersions
+from src.core.isochrone_cache import IsochroneCache
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_PATH", str(tmp_path))
+    monkeypatch.setattr(settings, "ISOCHRONE_CACHE_SHARED", True)
+    return tmp_path
+
+
+def test_lru(cache_path):
+    cache = IsochroneCache(max_size=2)
+    cache.put((0, "a"), 1, shared=False)
+    cache.put((0, "b"), 2, shared=False)
+    assert cache.get((0, "a")) == 1
+    # b is the least recently used result
+    cache.put((0, "c"), 3, shared=False)
+    assert cache.get((0, "b")) is None
+    assert cache.get((0, "a")) == 1 and cache.get((0, "c")) == 3
+
+
+def test_shared_tier(cache_path):
+    cache = IsochroneCache(max_size=2)
+    cache.put((0, "a"), {"grid": b"grid"})
+    cache.put((7, "a"), {"grid": b"scenario grid"})
+    # Another process reads the results from the shared tier
+    other_cache = IsochroneCache(max_size=2)
+    assert other_cache.get((0, "a")) == {"grid": b"grid"}
+    assert other_cache.get((7, "a")) == {"grid": b"scenario grid"}
+    assert (cache_path / "user" / "scenario" / "7" / "isochrone").is_dir()
+    # Scenario edits drop the results of the scenario only
+    other_cache.invalidate(7)
+    assert IsochroneCache(max_size=2).get((7, "a")) is None
+    assert other_cache.get((7, "a")) is None
+    assert other_cache.get((0, "a")) == {"grid": b"grid"}
+
+
+def test_shared_tier_cleanup(cache_path, monkeypatch):
+    monkeypatch.setattr(settings, "ISOCHRONE_CACHE_SHARED_MAX_AGE", 100)
+    cache = IsochroneCache(max_size=2)
+    cache.put((0, "old"), 1)
+    cache.put((7, "old"), 2)
+    for key in [(0, "old"), (7, "old")]:
+        os.utime(cache.get_path(key), (time.time() - 200, time.time() - 200))
+    cache.last_cleanup = 0.0
+    cache.put((0, "new"), 3)
+    # Files without a hit for the max age are removed in both directories
+    assert not os.path.exists(cache.get_path((0, "old")))
+    assert not os.path.exists(cache.get_path((7, "old")))
+    assert IsochroneCache(max_size=2).get((0, "new")) == 3
+
+
+class VersionEngine:
+    def __init__(self):
+        self.version = 1
+        self.queries = 0
+
+    def execute(self, query):
+        self.queries += 1
+        version = self.version
+        return type("Result", (), {"fetchall": lambda self: [("isochrone", version)]})()
+
+
+def test_data_versions(monkeypatch):
+    engine = VersionEngine()
+    monkeypatch.setattr(data_version, "legacy_engine", engine)
+    monkeypatch.setattr(settings, "DATA_VERSION_CHECK_INTERVAL", 60)
+    versions = DataVersions()
+    assert versions.get("isochrone") == 1
+    engine.version = 2
+    # The versions are read once per interval
+    assert versions.get("isochrone") == 1 and engine.queries == 1
+    versions.last_check = 0.0
+    assert versions.get("isochrone") == 2
+    assert versions.get("edge") == 0 and engine.queries == 2
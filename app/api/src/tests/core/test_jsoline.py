@@ -0,0 +1,78 @@
+import numpy as np
+import shapely
+
+from src.jsoline import (
+    calculate_jsolines,
+    get_band_index,
+    get_coordinate_decimals,
+    get_level_cells,
+)
+from src.utils import z_scale
+
+# A square ring of one minute around a center of ten minutes, everything else 30 minutes
+width = height = 8
+surface = np.full((height, width), 30, dtype=np.uint8)
+surface[2:6, 2:6] = 1
+surface[3:5, 3:5] = 10
+surface = surface.ravel()
+
+
+def test_get_level_cells():
+    cutoffs = np.array([5, 20, 40])
+    band = get_band_index(surface, width, height, cutoffs)
+    # The edges are outside of all levels
+    assert band[0] == 3 and band[width + 1] == 2
+    assert band[2 * width + 2] == 0 and band[3 * width + 3] == 1
+    level_offsets, level_cells = get_level_cells(band, width, height, len(cutoffs))
+    assert np.array_equal(np.diff(level_offsets), np.array([24, 16, 24]))
+    for level in range(len(cutoffs)):
+        cells = level_cells[level_offsets[level] : level_offsets[level + 1]]
+        assert np.all(np.diff(cells) > 0)
+
+
+def test_calculate_jsolines():
+    # Unsorted cutoffs keep their order in the result
+    isolines, isobands = calculate_jsolines(
+        surface, width, height, 0, 0, 10, np.array([20, 5]), web_mercator=True, return_isobands=True
+    )
+    assert len(isolines) == len(isobands) == 2
+    # One shell without holes at 20 minutes, one shell with the center as hole at 5 minutes
+    assert [len(polygon.interiors) for polygon in isolines[0].geoms] == [0]
+    assert [len(polygon.interiors) for polygon in isolines[1].geoms] == [1]
+    assert shapely.is_valid(isolines).all()
+    # The band from 5 to 20 minutes is the ring between both isolines and the center
+    assert isobands[1].equals(isolines[1])
+    assert [len(polygon.interiors) for polygon in isobands[0].geoms] == [1, 0]
+    assert shapely.is_valid(isobands).all()
+    assert isobands[0].intersection(isobands[1]).area == 0
+    assert np.isclose(isobands[0].area + isobands[1].area, isolines[0].area)
+
+
+def test_calculate_jsolines_saddles():
+    # A point outside of the isoline whose four neighbors are only connected through saddles
+    saddle_surface = np.full((9, 9), 30, dtype=np.uint8)
+    saddle_surface[[3, 4, 4, 5], [4, 3, 5, 4]] = 1
+    isolines, _ = calculate_jsolines(saddle_surface.ravel(), 9, 9, 0, 0, 10, np.array([5]))
+    assert [len(polygon.interiors) for polygon in isolines[0].geoms] == [1]
+
+
+def test_get_coordinate_decimals():
+    # A sixteenth of a pixel at zoom 10 is about 0.00002 degrees or 2 meters
+    assert get_coordinate_decimals(10, False, 1 / 16) == 5
+    assert get_coordinate_decimals(10, True, 1 / 16) == 0
+
+
+def test_calculate_jsolines_simplified():
+    cutoffs = np.array([5, 20])
+    exact, _ = calculate_jsolines(surface, width, height, 0, 0, 10, cutoffs, web_mercator=False)
+    simplified, _ = calculate_jsolines(
+        surface, width, height, 0, 0, 10, cutoffs, web_mercator=False, simplify_tolerance=0.25
+    )
+    assert shapely.is_valid(simplified).all()
+    assert (shapely.get_num_coordinates(simplified) <= shapely.get_num_coordinates(exact)).all()
+    assert [len(polygon.interiors) for polygon in simplified[0].geoms] == [1]
+    coordinates = shapely.get_coordinates(simplified)
+    assert np.array_equal(coordinates, np.round(coordinates, 5))
+    # The outlines move by less than half a pixel
+    pixel_size = 360 / z_scale(10)
+    assert (shapely.hausdorff_distance(simplified, exact) < pixel_size / 2).all()
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+
+from src.core.isochrone import PreparedNetwork, dijkstra
+from src.core.network_store import (
+    MAX_NEW_EDGE_ID,
+    MAX_NEW_NODE_ID,
+    StudyAreaNetwork,
+    TiledNetwork,
+    get_tile_bounds,
+)
+
+# Two edges along the x axis: 1 -> 2 -> 3, the second one is one-way
+edges = pd.DataFrame(
+    {
+        "id": [10, 11],
+        "source": [1, 2],
+        "target": [2, 3],
+        "cost": [100.0, 100.0],
+        "reverse_cost": [100.0, -1.0],
+        "geom": [
+            shapely.to_wkb(shapely.linestrings([[0.0, 0.0], [100.0, 0.0]])),
+            shapely.to_wkb(shapely.linestrings([[100.0, 0.0], [150.0, 0.0], [200.0, 0.0]])),
+        ],
+        "length": [100.0, 100.0],
+    }
+)
+network = StudyAreaNetwork(edges, box(-1000, -1000, 1000, 1000), 0)
+
+
+def test_snap():
+    x = np.array([25.0, 175.0, 25.0, 500.0])
+    y = np.array([5.0, -5.0, 50.0, 0.0])
+    snapped_edges, fractions = network.snap(x, y, np.full(4, 10.0))
+    assert np.array_equal(snapped_edges, np.array([0, 1, -1, -1]))
+    assert np.allclose(fractions[:2], np.array([0.25, 0.75]))
+
+
+def test_create_artificial_edges():
+    # Three points on the second edge, two of them at the same location
+    snapped_edges = np.array([1, 1, -1, 1])
+    fractions = np.array([0.75, 0.25, 0.0, 0.75])
+    node_ids, node_points, artificial_edges = network.create_artificial_edges(snapped_edges, fractions)
+    assert np.array_equal(
+        node_ids, np.array([MAX_NEW_NODE_ID - 1, MAX_NEW_NODE_ID, -1, MAX_NEW_NODE_ID - 1])
+    )
+    # The nodes lie on the edge, points that are not snapped have no coordinates
+    assert np.allclose(node_points[[0, 1, 3]], np.array([[175.0, 0.0], [125.0, 0.0], [175.0, 0.0]]))
+    assert np.isnan(node_points[2]).all()
+    assert list(artificial_edges["wid"]) == [11, 11, 11]
+    assert list(artificial_edges["id"]) == [MAX_NEW_EDGE_ID, MAX_NEW_EDGE_ID - 1, MAX_NEW_EDGE_ID - 2]
+    assert list(artificial_edges["source"]) == [2, MAX_NEW_NODE_ID, MAX_NEW_NODE_ID - 1]
+    assert list(artificial_edges["target"]) == [MAX_NEW_NODE_ID, MAX_NEW_NODE_ID - 1, 3]
+    assert np.allclose(artificial_edges["cost"], np.array([25.0, 50.0, 25.0]))
+    assert np.allclose(artificial_edges["reverse_cost"], np.array([-1.0, -1.0, -1.0]))
+    assert np.allclose(artificial_edges["length"], np.array([25.0, 50.0, 25.0]))
+    geoms = shapely.from_wkb(artificial_edges["geom"].to_numpy())
+    assert shapely.get_coordinates(geoms[1]).tolist() == [[125.0, 0.0], [150.0, 0.0], [175.0, 0.0]]
+
+
+def test_subset():
+    assert list(network.subset(25.0, 0.0, 50.0)["id"]) == [10]
+    assert list(network.subset([25.0, 190.0], [0.0, 0.0], 50.0)["id"]) == [10, 11]
+
+
+def test_tiled_network():
+    # A grid of 100 m edges at 1 m/s over 4 km, tiles of zoom 16 are about 611 m wide
+    size = 41
+    node = np.arange(size * size).reshape(size, size)
+    source = np.concatenate([node[:, :-1].ravel(), node[:-1, :].ravel()])
+    target = np.concatenate([node[:, 1:].ravel(), node[1:, :].ravel()])
+    coords = np.column_stack([(node % size).ravel() * 100.0, (node // size).ravel() * 100.0])
+    lines = shapely.linestrings(np.stack([coords[source], coords[target]], axis=1))
+    grid_edges = pd.DataFrame(
+        {
+            "id": np.arange(len(source)),
+            "source": source,
+            "target": target,
+            "cost": 100.0,
+            "reverse_cost": 100.0,
+            "geom": shapely.to_wkb(lines),
+            "length": 100.0,
+        }
+    )
+    loaded = []
+
+    def get_tiles(tiles):
+        loaded.extend(tiles)
+        bounds = get_tile_bounds(tiles, 16)
+        return {
+            tile: grid_edges[shapely.intersects(lines, box(*tile_bounds))]
+            for tile, tile_bounds in zip(tiles, bounds)
+        }
+
+    x = np.array([2010.0])
+    y = np.array([2000.0])
+    # Costs halved to 2 m/s, 6 minutes reach 720 m from the center
+    edges_network, starting_ids, starting_points = TiledNetwork(get_tiles, 16).read_network(
+        x, y, 6, np.array([50.0]), cost_factor=0.5
+    )
+    assert np.allclose(starting_points, np.array([[2010.0, 2000.0]]))
+    assert len(loaded) == len(set(loaded))
+    network = PreparedNetwork.from_dataframe(edges_network)
+    distances = dijkstra(network.get_node_index(starting_ids)[0], network.graph, 6)
+
+    full_network = StudyAreaNetwork(grid_edges, box(-1, -1, 4001, 4001), 0)
+    _, _, artificial_edges = full_network.create_artificial_edges(*full_network.snap(x, y, np.array([50.0])))
+    full_edges = pd.concat(
+        [grid_edges[~grid_edges["id"].isin(artificial_edges["wid"])], artificial_edges[grid_edges.columns]]
+    )
+    full_edges = full_edges.assign(cost=full_edges["cost"] * 0.5, reverse_cost=full_edges["reverse_cost"] * 0.5)
+    full_network = PreparedNetwork.from_dataframe(full_edges)
+    full_distances = dijkstra(full_network.get_node_index(starting_ids)[0], full_network.graph, 6)
+    # Same travel times for all nodes reached in the full network
+    reached = full_network.node_ids[full_distances < 6]
+    index, valid = network.get_node_index(reached)
+    assert valid.all()
+    assert np.allclose(distances[index], full_distances[full_distances < 6])
+    # Only the tiles reached by the search are loaded
+    assert len(edges_network) < len(grid_edges)
@@ -0,0 +1,56 @@
+import pytest
+
+from src.core.config import settings
+from src.core.result_store import ResultStore
+
+
+@pytest.fixture
+def result_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CELERY_BROKER_URL", "redis://")
+    monkeypatch.setattr(settings, "RESULT_STORE", "filesystem")
+    monkeypatch.setattr(settings, "RESULT_STORE_PATH", str(tmp_path))
+    monkeypatch.setattr(settings, "RESULT_STORE_MIN_SIZE", 1024)
+    return ResultStore()
+
+
+def test_store_results(result_store):
+    grid = bytes(range(256)) * 16
+    results = {
+        "data": {"grid": grid, "geojson": {"type": "FeatureCollection", "features": []}},
+        "return_type": "grid",
+        "hexlified": False,
+        "data_source": "isochrone",
+    }
+    results = result_store.store_results(results)
+    # Only the large grid is moved to the store
+    assert results["stored"] == {"grid": True}
+    assert results["data"]["grid"]["size"] == len(grid)
+    assert result_store.load(results, "grid") == grid
+    assert result_store.load(results, "geojson")["features"] == []
+
+
+def test_stream_corrupted(result_store, tmp_path):
+    reference = result_store.put(b"0" * 4096)
+    (tmp_path / reference["key"]).write_bytes(b"1" * 4096)
+    with pytest.raises(ValueError):
+        result_store.get(reference)
+
+
+def test_store_small_bytes(result_store):
+    results = {
+        "data": {"grid": b"\x00\x01", "geojson": {"type": "FeatureCollection", "features": []}},
+        "return_type": "grid",
+        "hexlified": False,
+        "data_source": "isochrone",
+    }
+    results = result_store.store_results(results)
+    # Bytes can't go through the JSON result backend, even small ones are stored
+    assert results["stored"] == {"grid": True}
+    assert result_store.load(results, "grid") == b"\x00\x01"
+
+
+def test_store_results_without_celery(result_store, monkeypatch):
+    monkeypatch.setattr(settings, "CELERY_BROKER_URL", "")
+    results = {"data": {"grid": b"\x00"}, "return_type": "grid", "data_source": "isochrone"}
+    assert result_store.store_results(results) is results
+    assert "stored" not in results
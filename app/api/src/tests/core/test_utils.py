@@ -0,0 +1,77 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import (
+    coordinate_to_pixel,
+    coordinates_to_pixels,
+    decode_r5_grid,
+    encode_od_matrix,
+    encode_r5_grid,
+    hilbert_curve_index,
+)
+
+grid = {
+    "version": 0,
+    "zoom": 10,
+    "west": 139400,
+    "north": 91000,
+    "width": 3,
+    "height": 2,
+    "depth": 2,
+    "data": np.array([0, 5, 3, 2147483647, 7, 1, 2, 9, 4, 2147483647, 12, 6]),
+    "accessibility": {"starting_points": [[11.5, 48.1]]},
+}
+
+
+def test_decode_r5_grid():
+    data = open("src/tests/data/isochrone/public_transport_calculation.bin", "rb").read()
+    decoded = decode_r5_grid(data)
+    assert len(decoded["data"]) == decoded["width"] * decoded["height"] * decoded["depth"]
+    # Header and data are encoded as R5 does, only the metadata is written differently
+    size = 36 + len(decoded["data"]) * 4
+    assert encode_r5_grid(decoded)[:size] == data[:size]
+
+
+@pytest.mark.parametrize("compression", [None, "deflate"])
+def test_encode_r5_grid(compression):
+    encoded = encode_r5_grid(grid, compression)
+    # R5 grids have version 0, compressed grids are flagged with their own version
+    assert encoded[:8] == b"ACCESSGR"
+    assert (np.frombuffer(encoded, np.int32, 1, 8)[0] == 0) == (compression is None)
+    decoded = decode_r5_grid(encoded)
+    assert np.array_equal(decoded["data"], grid["data"])
+    assert decoded["version"] == 0 and decoded["west"] == grid["west"]
+    assert decoded["accessibility"] == grid["accessibility"]
+
+
+def test_encode_od_matrix():
+    matrix = np.array([[1.5, np.inf], [np.inf, 7.25]], np.float32)
+    decoded = np.load(io.BytesIO(encode_od_matrix(matrix, "npy")))
+    assert decoded.dtype == np.float32 and np.allclose(decoded.diagonal(), [1.5, 7.25])
+    assert np.array_equal(np.isnan(decoded), np.isinf(matrix))
+    pairs = pd.read_csv(io.BytesIO(encode_od_matrix(matrix, "csv")))
+    assert pairs.values.tolist() == [[0, 0, 1.5], [1, 1, 7.25]]
+    with pytest.raises(ValueError):
+        encode_od_matrix(matrix, "xml")
+
+
+def test_coordinates_to_pixels():
+    longitudes = np.array([11.5696284, -73.985, 139.69])
+    latitudes = np.array([48.1502132, 40.758, 35.6895])
+    x, y = coordinates_to_pixels(longitudes, latitudes, 10)
+    for i in range(3):
+        expected = coordinate_to_pixel([longitudes[i], latitudes[i]], 10, return_dict=False, round_int=True)
+        assert [x[i], y[i]] == expected
+
+
+def test_hilbert_curve_index():
+    y, x = np.divmod(np.arange(64), 8)
+    index = hilbert_curve_index(x, y, order=3)
+    assert sorted(index.tolist()) == list(range(64))
+    # Consecutive positions on the curve are neighbouring pixels
+    order = np.argsort(index)
+    steps = np.abs(np.diff(x[order])) + np.abs(np.diff(y[order]))
+    assert (steps == 1).all()
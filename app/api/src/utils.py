@@ -1,5 +1,6 @@
 import base64
 import binascii
+import io
 import json
 import logging
 import math
@@ -13,6 +14,7 @@ import tempfile
 import time
 import uuid
 import zipfile
+import zlib
 from datetime import datetime, timedelta
 from functools import wraps
 from pathlib import Path
@@ -38,9 +40,16 @@ from shapely import geometry
 from shapely.geometry import GeometryCollection, MultiPolygon, Point, Polygon, box
 from shapely.ops import transform
 from starlette import status
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import zstandard
+except ImportError:
+    # Optional, only needed for zstd compressed grids
+    zstandard = None
 
 from src.core.config import settings
+from src.core.result_store import result_store
 from src.resources.enums import MaxUploadFileSize, MimeTypes
 
 
@@ -236,38 +245,51 @@ def to_feature_collection(
     return FeatureCollection(features)
 
 
-def encode_r5_grid(grid_data: Any) -> bytes:
+R5_GRID_TYPE = b"ACCESSGR"
+R5_GRID_VERSION = 0
+R5_GRID_HEADER_ENTRIES = 7
+R5_GRID_HEADER_SIZE = len(R5_GRID_TYPE) + R5_GRID_HEADER_ENTRIES * 4
+# Versions of the grids with a compressed body (data and metadata), R5 only reads version 0
+R5_GRID_COMPRESSIONS = {"deflate": 1, "zstd": 2}
+
+
+def compress_r5_grid_body(body, compression: str) -> bytes:
+    if compression == "deflate":
+        return zlib.compress(body, 6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor().compress(body)
+    raise ValueError(f"Invalid grid compression {compression}")
+
+
+def decompress_r5_grid_body(body, compression: str) -> bytes:
+    if compression == "deflate":
+        return zlib.decompress(body)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(body)
+    raise ValueError(f"Invalid grid compression {compression}")
+
+
+def encode_r5_grid(grid_data: Any, compression: Optional[str] = None) -> bytes:
     """
     Encode raster grid data
+
+    :param grid_data: Grid with header, data and metadata
+    :param compression: Compress the body with "deflate" or "zstd". None for the R5 format.
     """
-    grid_type = "ACCESSGR"
-    grid_type_binary = str.encode(grid_type)
-    array = np.array(
-        [
-            grid_data["version"],
-            grid_data["zoom"],
-            grid_data["west"],
-            grid_data["north"],
-            grid_data["width"],
-            grid_data["height"],
-            grid_data["depth"],
-        ],
-        dtype=np.int32,
-    )
-    header_bin = array.tobytes()
-    # - reshape the data
-    grid_size = grid_data["width"] * grid_data["height"]
-    if len(grid_data["data"]) == 0:
-        data = np.array([], dtype=np.int32)
+    width = int(grid_data["width"])
+    height = int(grid_data["height"])
+    depth = int(grid_data["depth"])
+    grid_size = width * height
+    data = np.asarray(grid_data["data"])
+    if len(data) == 0:
+        depth_size = 0
     else:
-        data = grid_data["data"].reshape(grid_data["depth"], grid_size)
-        reshaped_data = np.array([])
-        for i in range(grid_data["depth"]):
-            reshaped_data = np.append(reshaped_data, np.diff(data[i], prepend=0))
-        data = reshaped_data.astype(np.int32)
-    z_diff_bin = data.tobytes()
-
-    # - encode metadata
+        depth_size = depth * grid_size
+
     metadata = {
         "accessibility": grid_data.get("accessibility", {}),
         "errors": grid_data.get("errors", []),
@@ -278,65 +300,115 @@ def encode_r5_grid(grid_data: Any) -> bytes:
     }
     metadata_bin = json.dumps(metadata).encode("utf-8")
 
-    binary_output = b"".join([grid_type_binary, header_bin, z_diff_bin, metadata_bin])
-    return binary_output
+    # - write header, deltas and metadata into one buffer
+    data_size = depth_size * 4
+    buffer = bytearray(R5_GRID_HEADER_SIZE + data_size + len(metadata_bin))
+    buffer[: len(R5_GRID_TYPE)] = R5_GRID_TYPE
+    header = np.frombuffer(
+        buffer, dtype=np.int32, count=R5_GRID_HEADER_ENTRIES, offset=len(R5_GRID_TYPE)
+    )
+    header[:] = (
+        R5_GRID_COMPRESSIONS[compression] if compression else grid_data["version"],
+        grid_data["zoom"],
+        grid_data["west"],
+        grid_data["north"],
+        width,
+        height,
+        depth,
+    )
+    if depth_size:
+        # - delta encode every depth (percentile) separately
+        data = data.reshape(depth, grid_size)
+        deltas = np.frombuffer(
+            buffer, dtype=np.int32, count=depth_size, offset=R5_GRID_HEADER_SIZE
+        ).reshape(depth, grid_size)
+        deltas[:, 0] = data[:, 0]
+        np.subtract(data[:, 1:], data[:, :-1], out=deltas[:, 1:], casting="unsafe")
+    buffer[R5_GRID_HEADER_SIZE + data_size :] = metadata_bin
+
+    if compression:
+        body = compress_r5_grid_body(memoryview(buffer)[R5_GRID_HEADER_SIZE:], compression)
+        return bytes(buffer[:R5_GRID_HEADER_SIZE]) + body
+    return bytes(buffer)
 
 
 def decode_r5_grid(grid_data_buffer: bytes) -> dict:
     """
     Decode R5 grid data
-    """
-    CURRENT_VERSION = 0
-    HEADER_ENTRIES = 7
-    HEADER_LENGTH = 9  # type + entries
-    TIMES_GRID_TYPE = "ACCESSGR"
 
+    :param grid_data_buffer: Grid as encoded by R5 or encode_r5_grid (also with a compressed body)
+    """
     # -- PARSE HEADER
-    ## - get header type
-    header = {}
-    header_data = np.frombuffer(grid_data_buffer, count=8, dtype=np.byte)
-    header_type = "".join(map(chr, header_data))
-    if header_type != TIMES_GRID_TYPE:
+    if bytes(grid_data_buffer[: len(R5_GRID_TYPE)]) != R5_GRID_TYPE:
         raise ValueError("Invalid grid type")
-    ## - get header data
-    header_raw = np.frombuffer(grid_data_buffer, count=HEADER_ENTRIES, offset=8, dtype=np.int32)
-    version = header_raw[0]
-    if version != CURRENT_VERSION:
-        raise ValueError("Invalid grid version")
-    header["zoom"] = header_raw[1]
-    header["west"] = header_raw[2]
-    header["north"] = header_raw[3]
-    header["width"] = header_raw[4]
-    header["height"] = header_raw[5]
-    header["depth"] = header_raw[6]
-    header["version"] = version
+    header_raw = np.frombuffer(
+        grid_data_buffer, count=R5_GRID_HEADER_ENTRIES, offset=len(R5_GRID_TYPE), dtype=np.int32
+    )
+    version, zoom, west, north, width, height, depth = (int(value) for value in header_raw)
+    body = memoryview(grid_data_buffer)[R5_GRID_HEADER_SIZE:]
+    if version != R5_GRID_VERSION:
+        compression = {value: key for key, value in R5_GRID_COMPRESSIONS.items()}.get(version)
+        if compression is None:
+            raise ValueError("Invalid grid version")
+        body = decompress_r5_grid_body(body, compression)
+    header = {
+        "zoom": zoom,
+        "west": west,
+        "north": north,
+        "width": width,
+        "height": height,
+        "depth": depth,
+        "version": R5_GRID_VERSION,
+    }
 
     # -- PARSE DATA --
-    gridSize = header["width"] * header["height"]
-    # - skip the header
-    data = np.frombuffer(
-        grid_data_buffer,
-        offset=HEADER_LENGTH * 4,
-        count=gridSize * header["depth"],
-        dtype=np.int32,
-    )
-    # - reshape the data
-    data = data.reshape(header["depth"], gridSize)
-    reshaped_data = np.array([], dtype=np.int32)
-    for i in range(header["depth"]):
-        reshaped_data = np.append(reshaped_data, data[i].cumsum())
-    data = reshaped_data
+    grid_size = width * height
+    # - undo the delta encoding of every depth (percentile) in one pass
+    deltas = np.frombuffer(body, count=grid_size * depth, dtype=np.int32).reshape(depth, grid_size)
+    data = np.cumsum(deltas, axis=1, dtype=np.int32).ravel()
     # - decode metadata
-    raw_metadata = np.frombuffer(
-        grid_data_buffer,
-        offset=(HEADER_LENGTH + header["width"] * header["height"] * header["depth"]) * 4,
-        dtype=np.int8,
-    )
-    metadata = json.loads(raw_metadata.tostring())
+    metadata = json.loads(bytes(body[grid_size * depth * 4 :]))
 
     return header | metadata | {"data": data, "errors": [], "warnings": []}
 
 
+OD_MATRIX_MEDIA_TYPES = {
+    "npy": "application/octet-stream",
+    "arrow": "application/vnd.apache.arrow.file",
+    "csv": "text/csv",
+}
+
+
+def encode_od_matrix(matrix: np.ndarray, output_format: str) -> bytes:
+    """
+    Encode a travel time matrix
+
+    :param matrix: Travel times in minutes (origins x destinations, inf if not reached)
+    :param output_format: npy (dense float32 matrix, NaN if not reached), arrow or csv (origin, destination and travel time of the reached pairs)
+    """
+    matrix = np.asarray(matrix, np.float32)
+    if output_format == "npy":
+        output = io.BytesIO()
+        np.save(output, np.where(np.isfinite(matrix), matrix, np.nan), allow_pickle=False)
+        return output.getvalue()
+
+    origins, destinations = np.nonzero(np.isfinite(matrix))
+    pairs = pd.DataFrame(
+        {
+            "origin": origins.astype(np.int32),
+            "destination": destinations.astype(np.int32),
+            "travel_time": matrix[origins, destinations],
+        }
+    )
+    if output_format == "arrow":
+        output = io.BytesIO()
+        pairs.to_feather(output)
+        return output.getvalue()
+    if output_format == "csv":
+        return pairs.to_csv(index=False, float_format="%.2f").encode("utf-8")
+    raise ValueError(f"Invalid output format '{output_format}'")
+
+
 def filter_r5_grid(grid: dict, percentile: int = None, travel_time_limit: int = None) -> dict:
     """
     This function strips the grid to only include one percentile
@@ -552,6 +624,47 @@ def latitude_to_pixel(latitude, zoom):
     )
 
 
+def coordinates_to_pixels(longitudes, latitudes, zoom, round_int=True):
+    """
+    Convert arrays of coordinates to pixel coordinates
+    """
+    x = ((np.asarray(longitudes) + 180) / 360) * z_scale(zoom)
+    lat_rad = np.radians(latitudes)
+    y = ((1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2) * z_scale(zoom)
+    if round_int:
+        return np.round(x).astype(np.int64), np.round(y).astype(np.int64)
+    return x, y
+
+
+def hilbert_curve_index(x, y, order: int):
+    """
+    Position of pixels on the Hilbert curve. Pixels close on the curve are close in space.
+
+    :param x: Array of pixel x in [0, 2**order)
+    :param y: Array of pixel y in [0, 2**order)
+    :param order: Order of the curve
+
+    :return: Array of the positions on the curve
+    """
+    x = np.array(x, np.int64)
+    y = np.array(y, np.int64)
+    n = 1 << order
+    index = np.zeros(x.shape, np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        index += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant so that the curve continues at the end of the previous one
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return index
+
+
 @njit(cache=True)
 def web_mercator_x_to_pixel_x(x, zoom):
     return (x + (40075016.68557849 / 2.0)) / (40075016.68557849 / (z_scale(zoom)))
@@ -1157,6 +1270,17 @@ def convert_geojson_to_others_ogr2ogr(
     }
 
 
+def stream_stored_result(reference: dict, media_type: str, headers: dict = {}):
+    """
+    Stream a result from the result store
+    """
+    return StreamingResponse(
+        result_store.stream(reference),
+        media_type=media_type,
+        headers=headers | {"Content-Length": str(reference["size"])},
+    )
+
+
 def read_results(results, return_type=None):
     """
     results_example = {
@@ -1165,20 +1289,37 @@ def read_results(results, return_type=None):
         "hexlified": False,
         "data_source": "heatmap",
     }
-    return geojson or binary content based on return_type
+    return geojson or binary content based on return_type.
+    Entries moved to the result store (results["stored"]) are streamed from there.
     """
     if not return_type:
         return_type = results["return_type"]
 
     data = results["data"]
+    stored = results.get("stored", {})
 
-    if return_type == "geojson":
+    if results["data_source"] == "od_matrix":
+        headers = {"Content-Disposition": f"attachment; filename=od_matrix.{return_type}"}
+        media_type = OD_MATRIX_MEDIA_TYPES[return_type]
+        if stored.get("od_matrix"):
+            return stream_stored_result(data["od_matrix"], media_type, headers)
+        return Response(data["od_matrix"], media_type=media_type, headers=headers)
+
+    elif return_type in ("geojson", "network") and stored.get(return_type):
+        return stream_stored_result(data[return_type], "application/json")
+
+    elif return_type == "geojson":
         return data["geojson"]
 
     elif return_type == "network":
         return data["network"]
 
     elif return_type == "grid":
+        # The grids of batch isochrones are zipped
+        file_name = "grids.zip" if results["data_source"] == "isochrone_batch" else "grid.bin"
+        headers = {"Content-Disposition": f"attachment; filename={file_name}"}
+        if stored.get("grid"):
+            return stream_stored_result(data["grid"], "application/octet-stream", headers)
         if results["hexlified"]:
             data = binascii.unhexlify(data["grid"])
         else:
@@ -1186,11 +1327,11 @@ def read_results(results, return_type=None):
         return Response(
             data,
             media_type="application/octet-stream",
-            headers={"Content-Disposition": "attachment; filename=grid.bin"},
+            headers=headers,
         )
         
     elif return_type == "geobuf":
-        data = geobuf.encode(data["geojson"])
+        data = geobuf.encode(result_store.load(results, "geojson"))
         return Response(
             data,
             media_type=MimeTypes.geobuf.value,
@@ -1199,7 +1340,7 @@ def read_results(results, return_type=None):
 
     else:
         converted_data = convert_geojson_to_others_ogr2ogr(
-            input_geojson=data["geojson"],
+            input_geojson=result_store.load(results, "geojson"),
             destination_layer_name=results["data_source"],
             output_format=return_type,
         )
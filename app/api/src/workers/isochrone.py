@@ -1,10 +1,10 @@
 from src.db.session import sync_session
 from src import crud
 from src.workers.celery_app import celery_app
-from src.schemas.isochrone import IsochroneDTO
+from src.schemas.isochrone import IsochroneBatchDTO, IsochroneDTO, ODMatrixDTO
 from src.db import models
-import binascii
-from src.core.config import settings
+from src.core.result_store import result_store
+from src.utils import encode_od_matrix
 
 
 @celery_app.task()
@@ -21,9 +21,35 @@ def task_calculate_isochrone(isochrone_in, current_user, study_area_bounds):
         "hexlified": False,
         "data_source": "isochrone",
     }
-    if settings.CELERY_BROKER_URL:
-        # if we are using celery, we need to convert the numpy array to a string
-        result["data"]["grid"] = binascii.hexlify(bytes(result["data"]["grid"])).decode("utf-8")
-        result["hexlified"] = True
+    return result_store.store_results(result)
 
-    return result
+
+@celery_app.task()
+def task_calculate_isochrone_batch(isochrone_in, current_user):
+    isochrone_in = IsochroneBatchDTO(**isochrone_in)
+    current_user = models.User(**current_user)
+    db = sync_session()
+    result = crud.isochrone.calculate_batch(db, isochrone_in, current_user)
+    db.close()
+
+    result = {
+        "data": result,
+        "return_type": isochrone_in.output.type.value,
+        "hexlified": False,
+        "data_source": "isochrone_batch",
+    }
+    return result_store.store_results(result)
+
+
+@celery_app.task()
+def task_calculate_od_matrix(od_matrix_in):
+    od_matrix_in = ODMatrixDTO(**od_matrix_in)
+    matrix = crud.isochrone.calculate_od_matrix(od_matrix_in)
+
+    result = {
+        "data": {"od_matrix": encode_od_matrix(matrix, od_matrix_in.output_format.value)},
+        "return_type": od_matrix_in.output_format.value,
+        "hexlified": False,
+        "data_source": "od_matrix",
+    }
+    return result_store.store_results(result)
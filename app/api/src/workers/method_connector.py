@@ -7,10 +7,12 @@ from src.core.config import settings
 from src.core import config
 from src.core.opportunity import Opportunity
 from src.core.heatmap.heatmap_compute import ComputeHeatmap
+from src.core.heatmap.heatmap_core import TravelTimeMatrixCache
 from src.core.heatmap.heatmap_read import ReadHeatmap
 from src.db import models
 from src.db.session import legacy_engine
 from src.schemas.data_preparation import (
+    OpportunityMatrixParameters,
     OpportunityMatrixParametersSingleBulk,
     TravelTimeMatrixParametersSingleBulk,
 )
@@ -18,7 +20,7 @@ from src.schemas.heatmap import HeatmapSettings, HeatmapType, HeatmapConfigAggre
 from src.schemas.indicators import CalculateOevGueteklassenParameters
 from src.schemas.isochrone import IsochroneMode
 from src.crud.crud_indicator import indicator
-from src.utils import hexlify_file
+from src.utils import hexlify_file, print_info, print_warning
 
 
 async def create_traveltime_matrices_async(current_super_user, parameters):
@@ -52,22 +54,67 @@ async def create_traveltime_matrices_async(current_super_user, parameters):
 async def create_opportunity_matrices_async(user, parameters):
     user = models.User(**user)
     parameters = OpportunityMatrixParametersSingleBulk(**parameters)
+    bulk_id = parameters.bulk_id
+    compute_heatmap = ComputeHeatmap(current_user=user)
+    travel_time_matrices = await compute_heatmap.read_travel_time_matrices(
+        bulk_id=bulk_id, isochrone_dto=parameters.isochrone_dto, s3_folder=parameters.s3_folder
+    )
+
+    if travel_time_matrices is None:
+        return "No travel time matrices found for bulk_id: {bulk_id}"
+    await compute_bulk_opportunity_matrices(
+        compute_heatmap, parameters, bulk_id, travel_time_matrices
+    )
+    return "Ok"
+
+
+async def create_opportunity_matrices_region_async(user, parameters):
+    """
+    Opportunity matrices of a region of bulks. The bulks are processed in spatial order and the
+    decoded travel time matrices are shared between them, so every file is read about once.
+    """
+    user = models.User(**user)
+    parameters = OpportunityMatrixParameters(**parameters)
+    compute_heatmap = ComputeHeatmap(current_user=user)
+    bulk_ids = compute_heatmap.order_bulk_ids(parameters.bulk_id)
+    matrix_cache = TravelTimeMatrixCache(
+        [
+            compute_heatmap.get_travel_time_grids(bulk_id, parameters.isochrone_dto)
+            for bulk_id in bulk_ids
+        ],
+        max_size=settings.TRAVELTIME_MATRIX_CACHE_SIZE,
+    )
+    for bulk_id in bulk_ids:
+        travel_time_matrices = await compute_heatmap.read_travel_time_matrices(
+            bulk_id=bulk_id,
+            isochrone_dto=parameters.isochrone_dto,
+            s3_folder=parameters.s3_folder,
+            matrix_cache=matrix_cache,
+        )
+        if travel_time_matrices is None:
+            print_warning(f"No travel time matrices found for bulk_id: {bulk_id}")
+            continue
+        await compute_bulk_opportunity_matrices(
+            compute_heatmap, parameters, bulk_id, travel_time_matrices
+        )
+    print_info(f"Read {matrix_cache.reads} travel time matrices for {len(bulk_ids)} bulks")
+    return "Ok"
+
+
+async def compute_bulk_opportunity_matrices(
+    compute_heatmap: ComputeHeatmap,
+    parameters: OpportunityMatrixParameters,
+    bulk_id: str,
+    travel_time_matrices: dict,
+):
     isochrone_dto = parameters.isochrone_dto
     opportunity_types = parameters.opportunity_types
     opportunities_modified_excluded = ["aoi"]
     opportnities_user_excluded = ["aoi", "population"]
     scenario_ids = parameters.scenario_ids
     user_data_ids = parameters.user_data_ids
-    bulk_id = parameters.bulk_id
-    compute_heatmap = ComputeHeatmap(current_user=user)
     bulk_geom = Polygon(h3.h3_to_geo_boundary(h=bulk_id, geo_json=True))
     opportunity = Opportunity()
-    travel_time_matrices = await compute_heatmap.read_travel_time_matrices(
-        bulk_id=bulk_id, isochrone_dto=isochrone_dto, s3_folder=parameters.s3_folder
-    )
-
-    if travel_time_matrices is None:
-        return "No travel time matrices found for bulk_id: {bulk_id}"
     # Compute base data
     if parameters.compute_base_data == True:
         for opportunity_type in opportunity_types:
@@ -131,7 +178,6 @@ async def create_opportunity_matrices_async(user, parameters):
                 travel_time_matrices=travel_time_matrices,
                 output_path=f"{settings.CACHE_PATH}/user/data_upload/{user_data_id}",
             )
-    return "Ok"
 
 
 async def create_connectivity_matrices_async(current_super_user, parameters):
@@ -7,6 +7,7 @@ from src.workers.method_connector import (
     read_pt_oev_gueteklassen_async,
 )
 from src.core.config import settings
+from src.core.result_store import result_store
 
 
 @celery_app.task(time_limit=settings.CELERY_TASK_TIME_LIMIT)
@@ -14,7 +15,7 @@ def read_heatmap_task(current_user, heatmap_settings):
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     heatmap = loop.run_until_complete(read_heatmap_async(current_user, heatmap_settings))
-    return heatmap
+    return result_store.store_results(heatmap)
 
 
 @celery_app.task(time_limit=settings.CELERY_TASK_TIME_LIMIT)
@@ -24,7 +25,7 @@ def read_pt_station_count_task(current_user, payload, return_type):
     result = loop.run_until_complete(
         read_pt_station_count_async(current_user, payload, return_type)
     )
-    return result
+    return result_store.store_results(result)
 
 
 @celery_app.task(time_limit=settings.CELERY_TASK_TIME_LIMIT)
@@ -34,4 +35,4 @@ def read_pt_oev_gueteklassen_task(current_user, payload, return_type):
     result = loop.run_until_complete(
         read_pt_oev_gueteklassen_async(current_user, payload, return_type)
     )
-    return result
+    return result_store.store_results(result)